@@ -15,6 +15,13 @@ from app.config import settings
 # Import models to register them with Base.metadata
 from app.models.user import User
 from app.models.note import Note
+from app.models.note_search_token import NoteSearchToken
+from app.models.folder import Folder
+from app.models.file import File
+from app.models.file_content import FileContent
+from app.models.tombstone import Tombstone
+from app.models.file_blob_chunk import FileBlobChunk
+from app.models.upload_session import UploadSession, UploadSessionChunk
 
 # this is the Alembic Config object
 config = context.config
@@ -0,0 +1,46 @@
+"""add_change_versions_and_tombstones
+
+Revision ID: 0a7c94e5d213
+Revises: f3b8d61e2a95
+Create Date: 2026-10-16 16:48:31.270954
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a7c94e5d213'
+down_revision: Union[str, None] = 'f3b8d61e2a95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('change_version', sa.Integer(), server_default='0', nullable=False))
+    for table in ('notes', 'folders', 'files'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+        op.create_index(f'ix_{table}_user_id_version', table, ['user_id', 'version'])
+
+    op.create_table(
+        'tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('entity_type', sa.String(length=16), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstones_user_id_version', 'tombstones', ['user_id', 'version'])
+
+def downgrade():
+    op.drop_index('ix_tombstones_user_id_version', table_name='tombstones')
+    op.drop_table('tombstones')
+    for table in ('notes', 'folders', 'files'):
+        op.drop_index(f'ix_{table}_user_id_version', table_name=table)
+        op.drop_column(table, 'version')
+    op.drop_column('users', 'change_version')
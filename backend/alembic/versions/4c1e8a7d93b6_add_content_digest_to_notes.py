@@ -0,0 +1,27 @@
+"""add_content_digest_to_notes
+
+Revision ID: 4c1e8a7d93b6
+Revises: 0a7c94e5d213
+Create Date: 2026-10-16 17:22:05.418306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1e8a7d93b6'
+down_revision: Union[str, None] = '0a7c94e5d213'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Existing notes get their digest on their next update; until then it is NULL
+    op.add_column('notes', sa.Column('content_digest', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('notes', 'content_digest')
@@ -0,0 +1,32 @@
+"""add_note_listing_indexes
+
+Revision ID: 7a3c51d2e9f4
+Revises: 2e1876a2ef8f
+Create Date: 2026-10-16 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3c51d2e9f4'
+down_revision: Union[str, None] = '2e1876a2ef8f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Keyset pagination needs a non-null sort key, so backfill updated_at
+    op.execute("UPDATE notes SET updated_at = created_at WHERE updated_at IS NULL")
+    op.alter_column('notes', 'updated_at', server_default=sa.text('now()'))
+
+    op.create_index('ix_notes_user_id_updated_at_id', 'notes', ['user_id', 'updated_at', 'id'])
+    op.create_index('ix_notes_user_id_created_at_id', 'notes', ['user_id', 'created_at', 'id'])
+
+def downgrade():
+    op.drop_index('ix_notes_user_id_created_at_id', table_name='notes')
+    op.drop_index('ix_notes_user_id_updated_at_id', table_name='notes')
+    op.alter_column('notes', 'updated_at', server_default=None)
@@ -0,0 +1,29 @@
+"""add_encrypted_content_to_notes
+
+Revision ID: 9d2f6b1a8e34
+Revises: 4c1e8a7d93b6
+Create Date: 2026-10-16 18:05:47.902113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2f6b1a8e34'
+down_revision: Union[str, None] = '4c1e8a7d93b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Existing Fernet tokens stay in notes.content; they are rewritten into
+    # encrypted_content after their owner's next login, when the key is known
+    op.add_column('notes', sa.Column('encrypted_content', sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    # Envelopes can't be turned back into Fernet tokens without the users' keys
+    op.drop_column('notes', 'encrypted_content')
@@ -0,0 +1,43 @@
+"""create_note_search_tokens
+
+Revision ID: b41e9c07d6a2
+Revises: 7a3c51d2e9f4
+Create Date: 2026-10-16 10:03:17.552910
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41e9c07d6a2'
+down_revision: Union[str, None] = '7a3c51d2e9f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Existing notes start unindexed; index_pending_notes indexes them in the
+    # background after the owner's next login, since building tokens needs the
+    # user's master key
+    op.add_column('notes', sa.Column('search_indexed', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+
+    op.create_table('note_search_tokens',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=32), nullable=False),
+        sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_note_search_tokens_note_id', 'note_search_tokens', ['note_id'])
+    op.create_index('ix_note_search_tokens_user_id_token', 'note_search_tokens', ['user_id', 'token'])
+
+def downgrade():
+    op.drop_index('ix_note_search_tokens_user_id_token', table_name='note_search_tokens')
+    op.drop_index('ix_note_search_tokens_note_id', table_name='note_search_tokens')
+    op.drop_table('note_search_tokens')
+    op.drop_column('notes', 'search_indexed')
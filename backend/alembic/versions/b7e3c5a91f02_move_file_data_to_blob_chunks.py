@@ -0,0 +1,72 @@
+"""move_file_data_to_blob_chunks
+
+Revision ID: b7e3c5a91f02
+Revises: 9d2f6b1a8e34
+Create Date: 2026-10-16 18:41:12.536870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c5a91f02'
+down_revision: Union[str, None] = '9d2f6b1a8e34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match DB_BLOB_CHUNK_SIZE in app/core/storage_tiers.py
+CHUNK_SIZE = 1024 * 1024
+
+files = sa.table(
+    'files',
+    sa.column('id', sa.Integer),
+    sa.column('file_data', sa.LargeBinary),
+)
+chunks = sa.table(
+    'file_blob_chunks',
+    sa.column('file_id', sa.Integer),
+    sa.column('chunk_index', sa.Integer),
+    sa.column('data', sa.LargeBinary),
+)
+
+
+def upgrade():
+    op.create_table(
+        'file_blob_chunks',
+        sa.Column('file_id', sa.Integer(), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['file_id'], ['files.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('file_id', 'chunk_index')
+    )
+
+    # Copy the blobs one file at a time, so only one is held in memory
+    bind = op.get_bind()
+    file_ids = bind.execute(sa.select(files.c.id).where(files.c.file_data.is_not(None))).scalars().all()
+    for file_id in file_ids:
+        data = bind.execute(sa.select(files.c.file_data).where(files.c.id == file_id)).scalar()
+        rows = [
+            {'file_id': file_id, 'chunk_index': index, 'data': data[offset:offset + CHUNK_SIZE]}
+            for index, offset in enumerate(range(0, len(data), CHUNK_SIZE))
+        ]
+        if rows:
+            bind.execute(chunks.insert(), rows)
+
+    op.drop_column('files', 'file_data')
+
+
+def downgrade():
+    op.add_column('files', sa.Column('file_data', sa.LargeBinary(), nullable=True))
+
+    bind = op.get_bind()
+    file_ids = bind.execute(sa.select(chunks.c.file_id).distinct()).scalars().all()
+    for file_id in file_ids:
+        data = b"".join(bind.execute(
+            sa.select(chunks.c.data).where(chunks.c.file_id == file_id).order_by(chunks.c.chunk_index)
+        ).scalars())
+        bind.execute(files.update().where(files.c.id == file_id).values(file_data=data))
+
+    op.drop_table('file_blob_chunks')
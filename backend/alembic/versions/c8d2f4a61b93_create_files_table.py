@@ -0,0 +1,46 @@
+"""create_files_table
+
+Revision ID: c8d2f4a61b93
+Revises: b41e9c07d6a2
+Create Date: 2026-10-16 11:26:04.907133
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8d2f4a61b93'
+down_revision: Union[str, None] = 'b41e9c07d6a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # The files table was previously created by hand on some installs
+    if 'files' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table('files',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(), nullable=False),
+        sa.Column('content_type', sa.String(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('is_encrypted', sa.Boolean(), nullable=True),
+        sa.Column('file_path', sa.String(), nullable=True),
+        sa.Column('file_data', sa.LargeBinary(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('folder_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['folder_id'], ['folders.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_files_id'), 'files', ['id'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_files_id'), table_name='files')
+    op.drop_table('files')
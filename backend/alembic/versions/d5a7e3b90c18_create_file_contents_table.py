@@ -0,0 +1,47 @@
+"""create_file_contents_table
+
+Revision ID: d5a7e3b90c18
+Revises: c8d2f4a61b93
+Create Date: 2026-10-16 12:48:55.120376
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a7e3b90c18'
+down_revision: Union[str, None] = 'c8d2f4a61b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table('file_contents',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('digest', sa.String(length=64), nullable=False),
+        sa.Column('is_encrypted', sa.Boolean(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('file_path', sa.String(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'digest', 'is_encrypted', name='uq_file_contents_user_id_digest')
+    )
+    op.create_index(op.f('ix_file_contents_id'), 'file_contents', ['id'], unique=False)
+
+    op.add_column('files', sa.Column('content_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'fk_files_content_id', 'files', 'file_contents',
+        ['content_id'], ['id']
+    )
+
+def downgrade():
+    op.drop_constraint('fk_files_content_id', 'files', type_='foreignkey')
+    op.drop_column('files', 'content_id')
+    op.drop_index(op.f('ix_file_contents_id'), table_name='file_contents')
+    op.drop_table('file_contents')
@@ -0,0 +1,30 @@
+"""add_storage_tier_to_files
+
+Revision ID: e4a9c2d7b615
+Revises: b7e3c5a91f02
+Create Date: 2026-10-16 19:14:26.083119
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a9c2d7b615'
+down_revision: Union[str, None] = 'b7e3c5a91f02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column('files', sa.Column('storage_tier', sa.String(length=16), server_default='filesystem', nullable=False))
+    # Files without a path were stored in the database
+    op.execute("UPDATE files SET storage_tier = 'database' WHERE file_path IS NULL")
+    op.create_index('ix_files_storage_tier_size', 'files', ['storage_tier', 'size'])
+
+
+def downgrade():
+    op.drop_index('ix_files_storage_tier_size', table_name='files')
+    op.drop_column('files', 'storage_tier')
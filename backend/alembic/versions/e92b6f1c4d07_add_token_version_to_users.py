@@ -0,0 +1,25 @@
+"""add_token_version_to_users
+
+Revision ID: e92b6f1c4d07
+Revises: d5a7e3b90c18
+Create Date: 2026-10-16 14:05:39.847120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e92b6f1c4d07'
+down_revision: Union[str, None] = 'd5a7e3b90c18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+def downgrade():
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,52 @@
+"""add_materialized_path_to_folders
+
+Revision ID: f3b8d61e2a95
+Revises: e92b6f1c4d07
+Create Date: 2026-10-16 15:22:07.513842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d61e2a95'
+down_revision: Union[str, None] = 'e92b6f1c4d07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.add_column('folders', sa.Column('path', sa.String(), nullable=True))
+    op.add_column('folders', sa.Column('depth', sa.Integer(), nullable=True))
+
+    # Backfill from the roots down
+    op.execute("""
+        WITH RECURSIVE tree (id, path, depth) AS (
+            SELECT id, '/' || id || '/', 0 FROM folders WHERE parent_id IS NULL
+            UNION ALL
+            SELECT f.id, t.path || f.id || '/', t.depth + 1
+            FROM folders f JOIN tree t ON f.parent_id = t.id
+        )
+        UPDATE folders SET path = tree.path, depth = tree.depth
+        FROM tree WHERE folders.id = tree.id
+    """)
+    # Folders in or under a parent cycle are unreachable from any root; move them to the top level
+    op.execute("""
+        UPDATE folders SET parent_id = NULL, path = '/' || id || '/', depth = 0
+        WHERE path IS NULL
+    """)
+
+    op.alter_column('folders', 'path', nullable=False)
+    op.alter_column('folders', 'depth', nullable=False)
+    op.create_index(
+        'ix_folders_user_id_path', 'folders', ['user_id', 'path'],
+        postgresql_ops={'path': 'varchar_pattern_ops'}
+    )
+
+def downgrade():
+    op.drop_index('ix_folders_user_id_path', table_name='folders')
+    op.drop_column('folders', 'depth')
+    op.drop_column('folders', 'path')
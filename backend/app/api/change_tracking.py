@@ -0,0 +1,55 @@
+from typing import Iterable, Union
+
+from sqlalchemy import Select, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.user import User
+from ..models.tombstone import Tombstone
+
+
+async def next_change_version(db: AsyncSession, user_id: int) -> int:
+    """Take the user's next change version, to stamp on everything the transaction writes.
+
+    The user row stays locked until commit, so a user's versions become
+    visible in the order they were handed out and a client that synced up to
+    version N never misses a change committed later with a version <= N.
+    Call it before the transaction writes any existing row: every writer then
+    locks the user row first and two writers of one user can't deadlock.
+    """
+    return await db.scalar(
+        update(User)
+        .where(User.id == user_id)
+        .values(change_version=User.change_version + 1)
+        .returning(User.change_version)
+    )
+
+
+async def current_change_version(db: AsyncSession, user_id: int) -> int:
+    """The last version handed out to the user; it moves on every write to their data."""
+    return await db.scalar(select(User.change_version).where(User.id == user_id))
+
+
+async def record_tombstones(
+    db: AsyncSession,
+    user_id: int,
+    entity_type: str,
+    entity_ids: Union[Iterable[int], Select],
+    version: int
+):
+    """Record deletions for sync clients. `entity_ids` may be a list or a SELECT of ids."""
+    if isinstance(entity_ids, Select):
+        deleted = entity_ids.subquery()
+        await db.execute(
+            insert(Tombstone).from_select(
+                ["user_id", "entity_type", "entity_id", "version"],
+                select(literal(user_id), literal(entity_type), *deleted.c, literal(version))
+            )
+        )
+        return
+
+    rows = [
+        {"user_id": user_id, "entity_type": entity_type, "entity_id": entity_id, "version": version}
+        for entity_id in entity_ids
+    ]
+    if rows:
+        await db.execute(insert(Tombstone), rows)
@@ -1,17 +1,29 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
 from ..models.user import User
 from ..config import settings
+from ..core.principal_cache import Principal, PrincipalCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
+    db: AsyncSession = Depends(get_db)
+) -> Principal:
+    # Tokens verified recently skip JWT decoding and the user lookup
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -19,17 +31,30 @@ async def get_current_user(
     )
     try:
         payload = jwt.decode(
-            token, 
-            settings.SECRET_KEY, 
+            token,
+            settings.SECRET_KEY,
             algorithms=[settings.ALGORITHM]
         )
         username: str = payload.get("sub")
-        if username is None:
+        user_id = payload.get("uid")
+        if username is None or user_id is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if user is None or user.username != username or not user.is_active:
+        raise credentials_exception
+    # Tokens issued before the last logout carry an outdated version
+    if payload.get("tv") != user.token_version:
         raise credentials_exception
-    return user
\ No newline at end of file
+
+    principal = Principal(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        is_active=user.is_active,
+        token_version=user.token_version
+    )
+    principal_cache.put(token, principal, payload.get("exp"))
+    return principal
@@ -0,0 +1,44 @@
+from typing import Optional
+import hashlib
+
+from fastapi import Request, Response
+
+# Clients may keep responses but must revalidate them before every use
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the parts that identify one version of a representation."""
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def listing_etag(kind: str, user_id: int, change_version: int, request: Request) -> str:
+    """ETag of a listing: it changes with any write of the user and with the query parameters."""
+    params = hashlib.sha256(str(sorted(request.query_params.multi_items())).encode()).hexdigest()[:16]
+    return make_etag(kind, user_id, change_version, params)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so W/ prefixes are ignored."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def if_match_failed(if_match: Optional[str], etag: str) -> bool:
+    """If-Match uses the strong comparison, so W/ tags never match; "*" matches any version."""
+    if not if_match or if_match.strip() == "*":
+        return False
+    return etag not in (tag.strip() for tag in if_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
@@ -0,0 +1,315 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sweeps there are not guarded against running twice
+    fcntl = None
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Row, and_, or_, select
+
+from ..config import settings
+from ..core.blob_store import StoredBlob, blob_store
+from ..core.rate_limit import InMemoryTokenBuckets
+from ..core.upload_scratch import UPLOAD_SCRATCH_PATH, discard_sessions
+from ..database import AsyncSessionLocal, single_runner_lock
+from ..models.file import File
+from ..models.file_content import FileContent
+from ..models.upload_session import UploadSession
+from .change_tracking import next_change_version, record_tombstones
+from .routes.files import delete_files_where, remove_blobs
+
+SWEEP_BATCH_SIZE = 500
+
+
+class IOBudget:
+    """Paces storage operations with a token bucket, so a sweep can run beside production traffic."""
+
+    def __init__(self, ops_per_second: float):
+        self.rate = ops_per_second
+        self._buckets = InMemoryTokenBuckets(max_keys=1)
+
+    async def spend(self, ops: int = 1):
+        if self.rate <= 0:
+            return
+        for _ in range(ops):
+            while wait := self._buckets.take("io", self.rate, max(self.rate, 1)):
+                await asyncio.sleep(wait)
+
+
+def _state_path() -> Path:
+    return Path(settings.FILE_SWEEP_STATE_PATH or os.path.join(settings.FILE_STORAGE_PATH, ".sweep.json"))
+
+
+def _load_state(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_state(path: Path, state: dict):
+    temp_path = path.with_name(path.name + ".part")
+    temp_path.write_text(json.dumps(state))
+    os.replace(temp_path, path)
+
+
+def _next_batch(blobs: Iterator[StoredBlob], size: int) -> List[StoredBlob]:
+    return list(islice(blobs, size))
+
+
+async def _sweep_upload_sessions(counts: Dict[str, int], repair: bool, cutoff: float, budget: IOBudget, batch_size: int):
+    """Expired upload sessions, and scratch directories no session owns any more."""
+    last_id = ""
+    while True:
+        async with AsyncSessionLocal() as db:
+            expired = (await db.scalars(
+                select(UploadSession)
+                .where(UploadSession.expires_at <= datetime.now(timezone.utc), UploadSession.id > last_id)
+                .order_by(UploadSession.id)
+                .limit(batch_size)
+            )).all()
+            if not expired:
+                break
+            last_id = expired[-1].id
+            for session in expired:
+                print(f"Expired upload session: {session.id}")
+            counts["expired_upload_sessions"] += len(expired)
+            if repair:
+                await budget.spend(len(expired))
+                await discard_sessions(db, expired)
+                counts["repaired"] += len(expired)
+
+    try:
+        entries = await run_in_threadpool(lambda: sorted(os.scandir(UPLOAD_SCRATCH_PATH), key=lambda e: e.name))
+    except FileNotFoundError:
+        return
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        await budget.spend(len(batch))
+        async with AsyncSessionLocal() as db:
+            live = set((await db.scalars(
+                select(UploadSession.id).where(UploadSession.id.in_([entry.name for entry in batch]))
+            )).all())
+        for entry in batch:
+            if entry.name in live or entry.stat().st_mtime > cutoff:
+                continue
+            counts["stale_upload_dirs"] += 1
+            print(f"Upload scratch directory without a session: {entry.path}")
+            if repair:
+                await run_in_threadpool(shutil.rmtree, entry.path, ignore_errors=True)
+                counts["repaired"] += 1
+
+
+async def _sweep_blobs(state: dict, save, counts: Dict[str, int], repair: bool, cutoff: float,
+                       budget: IOBudget, batch_size: int):
+    """Blobs that no file or deduplicated content row references."""
+    blobs = blob_store.iter_blobs(state.get("marker"))
+    while batch := await run_in_threadpool(_next_batch, blobs, batch_size):
+        await budget.spend(len(batch))
+        keys = {blob.key for blob in batch}
+        async with AsyncSessionLocal() as db:
+            referenced = set((await db.scalars(select(File.file_path).where(File.file_path.in_(keys)))).all())
+            referenced.update((await db.scalars(
+                select(FileContent.file_path).where(FileContent.file_path.in_(keys))
+            )).all())
+
+        for blob in batch:
+            # A young blob may belong to an upload that hasn't committed its row yet
+            if blob.key in referenced or blob.modified > cutoff:
+                continue
+            counts["orphan_blobs"] += 1
+            print(f"Orphan blob: {blob.key}")
+            if repair:
+                await budget.spend()
+                await run_in_threadpool(blob_store.delete, blob.key)
+                counts["repaired"] += 1
+
+        state["marker"] = batch[-1].marker
+        state["blobs_seen"] = state.get("blobs_seen", 0) + len(batch)
+        await save()
+
+
+async def _remove_dangling_files(rows: List[Row]) -> int:
+    """Delete file rows whose blob is gone, as a user deletion would, with tombstones for sync."""
+    by_user = defaultdict(list)
+    for row in rows:
+        by_user[row.user_id].append(row)
+
+    removed = 0
+    async with AsyncSessionLocal() as db:
+        for user_id, user_rows in by_user.items():
+            version = await next_change_version(db, user_id)
+            # Only rows still pointing at the missing blob: they may have been deleted or moved meanwhile
+            ids = (await db.scalars(select(File.id).where(or_(*(
+                and_(File.id == row.id, File.file_path == row.file_path) for row in user_rows
+            ))).with_for_update())).all()
+            if not ids:
+                await db.rollback()
+                continue
+            await record_tombstones(db, user_id, "file", ids, version)
+            blob_keys = await delete_files_where(db, File.id.in_(ids))
+            await db.commit()
+            await run_in_threadpool(remove_blobs, blob_keys)
+            removed += len(ids)
+    return removed
+
+
+async def _sweep_files(state: dict, save, counts: Dict[str, int], repair: bool, budget: IOBudget, batch_size: int):
+    """File rows pointing at a blob that doesn't exist."""
+    if repair and not state.get("blobs_seen"):
+        # An unmounted volume or a wrong bucket would make every file look lost
+        print("The blob store looks empty, dangling file rows are only reported")
+        repair = False
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(File.id, File.user_id, File.file_path)
+                .where(File.file_path.is_not(None), File.id > state.get("last_file_id", 0))
+                .order_by(File.id)
+                .limit(batch_size)
+            )).all()
+        if not rows:
+            return
+
+        missing = set()
+        for key in {row.file_path for row in rows}:
+            await budget.spend()
+            if not await run_in_threadpool(blob_store.exists, key):
+                missing.add(key)
+        dangling = [row for row in rows if row.file_path in missing]
+        for row in dangling:
+            print(f"File {row.id} of user {row.user_id} has no blob: {row.file_path}")
+        counts["dangling_files"] += len(dangling)
+        if repair and dangling:
+            counts["repaired"] += await _remove_dangling_files(dangling)
+
+        state["last_file_id"] = rows[-1].id
+        await save()
+
+
+async def sweep_file_storage(
+    repair: bool = False,
+    ops_per_second: Optional[float] = None,
+    grace_seconds: Optional[float] = None,
+    batch_size: int = SWEEP_BATCH_SIZE,
+    state_path: Optional[Path] = None,
+    restart: bool = False
+) -> Optional[Dict[str, int]]:
+    """Reconcile the blob store with the files and file_contents tables.
+
+    Reports blobs no row references, file rows whose blob is missing,
+    expired upload sessions, and scratch or spool files left behind by
+    failed uploads. With `repair` they are removed; dangling file rows are
+    deleted like a user deletion, tombstones included. Anything younger than
+    the grace period is left alone.
+
+    The blob store and the files table are walked in batches, and the
+    position is saved to `state_path` after each one, so an interrupted
+    sweep resumes where it stopped. Returns what was found, or None if
+    another sweep holds the state file.
+    """
+    ops_per_second = settings.FILE_SWEEP_OPS_PER_SECOND if ops_per_second is None else ops_per_second
+    grace_seconds = settings.FILE_SWEEP_GRACE_MINUTES * 60 if grace_seconds is None else grace_seconds
+    state_path = state_path or _state_path()
+    cutoff = time.time() - grace_seconds
+    budget = IOBudget(ops_per_second)
+    counts = {
+        "orphan_blobs": 0, "dangling_files": 0, "expired_upload_sessions": 0,
+        "stale_upload_dirs": 0, "stale_spool_files": 0, "repaired": 0,
+    }
+
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(state_path.with_name(state_path.name + ".lock"), "w") as lock:
+        if fcntl:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+
+        state = {} if restart else _load_state(state_path)
+        if "completed_at" in state:
+            state = {}
+
+        async def save():
+            await run_in_threadpool(_save_state, state_path, state)
+
+        await _sweep_upload_sessions(counts, repair, cutoff, budget, batch_size)
+        stale = await run_in_threadpool(blob_store.remove_stale_writers, cutoff, not repair)
+        counts["stale_spool_files"] += stale
+        if repair:
+            counts["repaired"] += stale
+
+        if state.get("phase", "blobs") == "blobs":
+            await _sweep_blobs(state, save, counts, repair, cutoff, budget, batch_size)
+            state["phase"] = "files"
+            await save()
+        await _sweep_files(state, save, counts, repair, budget, batch_size)
+
+        state = {"completed_at": time.time()}
+        await save()
+    return counts
+
+
+async def sweep_periodically(interval_seconds: float):
+    """Sweep every `interval_seconds`, in the background of the app.
+
+    Started by every worker with FILE_SWEEP_INTERVAL_HOURS set. Only one of
+    them sweeps at a time: across hosts through `single_runner_lock` on
+    PostgreSQL, and on one host through the state file lock. Sweeps run at
+    most once per interval.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        completed_at = (await run_in_threadpool(_load_state, _state_path())).get("completed_at", 0)
+        if completed_at > time.time() - interval_seconds / 2:
+            continue
+        try:
+            async with single_runner_lock("file-storage-sweep") as acquired:
+                counts = await sweep_file_storage(repair=settings.FILE_SWEEP_REPAIR) if acquired else None
+            if counts:
+                print(f"File storage sweep: {counts}")
+        except Exception as e:
+            print(f"Error sweeping file storage: {str(e)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile stored file blobs with the database.")
+    parser.add_argument("--repair", action="store_true",
+                        help="remove what is found instead of only reporting it")
+    parser.add_argument("--ops-per-second", type=float, default=settings.FILE_SWEEP_OPS_PER_SECOND,
+                        help="storage operations per second, 0 for no limit")
+    parser.add_argument("--grace-minutes", type=float, default=settings.FILE_SWEEP_GRACE_MINUTES,
+                        help="leave blobs and scratch files younger than this alone")
+    parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true",
+                        help="start a new sweep instead of resuming an interrupted one")
+    args = parser.parse_args()
+
+    counts = asyncio.run(sweep_file_storage(
+        repair=args.repair,
+        ops_per_second=args.ops_per_second,
+        grace_seconds=args.grace_minutes * 60,
+        batch_size=args.batch_size,
+        restart=args.restart
+    ))
+    if counts is None:
+        print("Another sweep is running")
+        return
+    for name, count in counts.items():
+        print(f"{name}: {count}")
+
+
+if __name__ == "__main__":
+    main()
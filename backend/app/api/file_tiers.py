@@ -0,0 +1,127 @@
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Row, and_, delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..core.blob_store import blob_store, new_blob_key
+from ..core.storage_tiers import TIER_DATABASE, TIER_FILESYSTEM, store_in_database
+from ..database import AsyncSessionLocal, single_runner_lock
+from ..models.file import File
+from ..models.file_blob_chunk import FileBlobChunk
+
+MIGRATION_BATCH_SIZE = 100
+
+
+async def _move_to_filesystem(db: AsyncSession, db_file: Row) -> bool:
+    """Copy a database-stored file to the blob store and point its row at it."""
+    key = new_blob_key(db_file.user_id, db_file.filename)
+    writer = await run_in_threadpool(blob_store.create_writer)
+    try:
+        index = 0
+        while (data := await db.scalar(select(FileBlobChunk.data).where(
+            FileBlobChunk.file_id == db_file.id,
+            FileBlobChunk.chunk_index == index
+        ))) is not None:
+            await run_in_threadpool(writer.write, data)
+            index += 1
+        await run_in_threadpool(writer.commit, key)
+    finally:
+        await run_in_threadpool(writer.discard)
+
+    # Chunks first, like file deletion, so the two always lock in the same order
+    await db.execute(delete(FileBlobChunk).where(FileBlobChunk.file_id == db_file.id))
+    moved = await db.execute(
+        update(File)
+        .where(File.id == db_file.id, File.storage_tier == TIER_DATABASE)
+        .values(
+            storage_tier=TIER_FILESYSTEM,
+            file_path=key,
+            updated_at=File.updated_at
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if not moved.rowcount:
+        # Deleted or moved by someone else in the meantime
+        await db.rollback()
+        await run_in_threadpool(blob_store.delete, key)
+        return False
+    await db.commit()
+    return True
+
+
+async def _move_to_database(db: AsyncSession, db_file: Row) -> bool:
+    """Copy a file from the blob store into database chunks and remove the blob."""
+    try:
+        f = await run_in_threadpool(blob_store.open, db_file.file_path)
+    except FileNotFoundError:
+        return False
+    try:
+        await store_in_database(db, db_file.id, f)
+    finally:
+        await run_in_threadpool(f.close)
+    moved = await db.execute(
+        update(File)
+        .where(File.id == db_file.id, File.file_path == db_file.file_path)
+        .values(storage_tier=TIER_DATABASE, file_path=None, updated_at=File.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    if not moved.rowcount:
+        await db.rollback()
+        return False
+    await db.commit()
+    await run_in_threadpool(blob_store.delete, db_file.file_path)
+    return True
+
+
+async def migrate_file_tiers() -> Optional[Dict[str, int]]:
+    """Move every file stored in the wrong tier for the current settings.
+
+    Run after FILE_DB_TIER_MAX_KB or STORE_FILES_IN_DB change. Each file is
+    moved in its own transaction, and a file changed or deleted meanwhile is
+    left alone. Deduplicated files share their blob and stay on disk.
+    Returns how many files were moved each way, or None if another worker
+    is migrating (PostgreSQL only, see `single_runner_lock`).
+    """
+    async with single_runner_lock("file-tier-migration") as acquired:
+        if not acquired:
+            return None
+        return await _migrate_file_tiers()
+
+
+async def _migrate_file_tiers() -> Dict[str, int]:
+    moved = {TIER_DATABASE: 0, TIER_FILESYSTEM: 0}
+    threshold = settings.FILE_DB_TIER_MAX_KB * 1024
+    if settings.STORE_FILES_IN_DB:
+        misplaced = File.storage_tier == TIER_FILESYSTEM
+    elif not threshold:
+        misplaced = File.storage_tier == TIER_DATABASE
+    else:
+        misplaced = or_(
+            and_(File.storage_tier == TIER_DATABASE, File.size > threshold),
+            and_(File.storage_tier == TIER_FILESYSTEM, File.size <= threshold)
+        )
+
+    last_id = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            batch = (await db.execute(
+                select(File.id, File.user_id, File.filename, File.file_path, File.storage_tier)
+                .where(misplaced, File.content_id.is_(None), File.id > last_id)
+                .order_by(File.id)
+                .limit(MIGRATION_BATCH_SIZE)
+            )).all()
+            if not batch:
+                return moved
+            last_id = batch[-1].id
+
+            for db_file in batch:
+                try:
+                    if db_file.storage_tier == TIER_DATABASE:
+                        moved[TIER_FILESYSTEM] += await _move_to_filesystem(db, db_file)
+                    else:
+                        moved[TIER_DATABASE] += await _move_to_database(db, db_file)
+                except Exception as e:
+                    await db.rollback()
+                    print(f"Error moving file {db_file.id} between storage tiers: {str(e)}")
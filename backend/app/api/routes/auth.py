@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...models.user import User
 from ...schemas.user import UserCreate, UserResponse
@@ -12,8 +13,12 @@ from ...core.encryption import (
     generate_salt,
     generate_master_key
 )
-from ..dependencies import get_current_user
+from ..dependencies import get_current_user, principal_cache
+from .notes import index_pending_notes, upgrade_note_ciphertexts
+from ...core.principal_cache import Principal
 from ...core.session_manager import session_manager
+from ...core.kdf_executor import KDFPoolSaturated, kdf_executor
+from ...config import settings
 
 router = APIRouter()
 
@@ -22,39 +27,62 @@ print("Available functions:", [
     if not func.startswith('_')
 ])
 
+def _hash_new_credentials(password: str, master_key: bytes, salt: str):
+    """Both KDFs of a registration, run as one job on the KDF pool."""
+    return encrypt_master_key(master_key, password, salt), get_password_hash(password)
+
+def _unlock_master_key(password: str, hashed_password: str, encrypted_master_key: str, salt: str):
+    """Both KDFs of a login, run as one job on the KDF pool. Returns None for a wrong password."""
+    if not verify_password(password, hashed_password):
+        return None
+    return decrypt_master_key(encrypted_master_key, password, salt)
+
+async def _run_kdf(name: str, func, *args):
+    try:
+        return await kdf_executor.run(name, func, *args)
+    except KDFPoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, try again shortly",
+            headers={"Retry-After": str(settings.KDF_RETRY_AFTER_SECONDS)},
+        )
+
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.email == user.email).first():
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    if await db.scalar(select(User).where(User.email == user.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    if db.query(User).filter(User.username == user.username).first():
+    if await db.scalar(select(User).where(User.username == user.username)):
         raise HTTPException(status_code=400, detail="Username already taken")
 
-    # Generate encryption materials
+    # Generate encryption materials; the KDFs run on the bounded KDF pool
     salt = generate_salt()
     master_key = generate_master_key()
-    encrypted_master_key = encrypt_master_key(master_key, user.password, salt)
+    encrypted_master_key, hashed_password = await _run_kdf(
+        "register", _hash_new_credentials, user.password, master_key, salt
+    )
     
     db_user = User(
         email=user.email,
         username=user.username,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=hashed_password,
         encryption_salt=salt,
         encrypted_master_key=encrypted_master_key
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/login")
 async def login(
+    background_tasks: BackgroundTasks,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         print("Starting login process")  # Debug print
-        user = db.query(User).filter(User.username == form_data.username).first()
+        user = await db.scalar(select(User).where(User.username == form_data.username))
         
         if not user:
             raise HTTPException(
@@ -63,23 +91,18 @@ async def login(
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        if not verify_password(form_data.password, user.hashed_password):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
-        print("User authenticated, trying to decrypt master key")  # Debug print
-        
         try:
-            # Decrypt master key
-            master_key = decrypt_master_key(
-                user.encrypted_master_key,
+            # Verify the password and decrypt the master key on the KDF pool
+            master_key = await _run_kdf(
+                "login",
+                _unlock_master_key,
                 form_data.password,
+                user.hashed_password,
+                user.encrypted_master_key,
                 user.encryption_salt
             )
-            print("Master key decrypted successfully")  # Debug print
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Error decrypting master key: {str(e)}")  # Debug print
             raise HTTPException(
@@ -87,13 +110,29 @@ async def login(
                 detail=f"Error decrypting master key: {str(e)}"
             )
 
+        if master_key is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect username or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        print("Master key decrypted successfully")  # Debug print
+
         # Store master key in session
         session_manager.store_master_key(user.id, master_key)
+        # Legacy Fernet notes can only be converted, and notes from before the
+        # search index indexed, while the key is known
+        background_tasks.add_task(upgrade_note_ciphertexts, user.id, master_key)
+        background_tasks.add_task(index_pending_notes, user.id, master_key)
 
         # Create access token
-        access_token = create_access_token(data={"sub": user.username})
+        access_token = create_access_token(
+            data={"sub": user.username, "uid": user.id, "tv": user.token_version}
+        )
         return {"access_token": access_token, "token_type": "bearer"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Login error: {str(e)}")  # Debug print
         raise HTTPException(
@@ -102,6 +141,15 @@ async def login(
         )
 
 @router.post("/logout")
-async def logout(current_user: User = Depends(get_current_user)):
+async def logout(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Revoke every token issued so far and forget the cached ones
+    await db.execute(
+        update(User).where(User.id == current_user.id).values(token_version=User.token_version + 1)
+    )
+    await db.commit()
+    principal_cache.invalidate_user(current_user.id)
     session_manager.clear_session(current_user.id)
     return {"message": "Successfully logged out"}
\ No newline at end of file
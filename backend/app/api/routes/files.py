@@ -1,46 +1,262 @@
-import os
-import uuid
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File as FastAPIFile
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status, UploadFile, File as FastAPIFile
+from anyio import from_thread
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import shutil
-from pathlib import Path
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import ColumnElement
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+from email.utils import format_datetime
+import hmac
 import io
+import uuid
 
 from ...models.file import File
+from ...models.file_content import FileContent
+from ...models.file_blob_chunk import FileBlobChunk
 from ...models.folder import Folder
 from ...schemas.file import FileCreate, FileUpdate, FileResponse
-from ...database import get_db
+from ...database import async_engine, get_db
 from ..dependencies import get_current_user
-from ...models.user import User
-from ...core.encryption import encrypt_file, decrypt_file
+from ..change_tracking import current_change_version, next_change_version, record_tombstones
+from ..etags import etag_matches, listing_etag, not_modified, set_etag
+from ...core.principal_cache import Principal
+from ...core.blob_store import BlobWriter, blob_store, new_blob_key
+from ...core.storage_tiers import (
+    DB_BLOB_CHUNK_SIZE, TIER_DATABASE, TIER_FILESYSTEM, store_in_database, storage_tier_for
+)
+from ...core.encryption import FileEncryptor, encrypted_file_size, iter_decrypt_file_range, new_file_hasher
 from ...core.session_manager import session_manager
-from ...core.config import settings
+from ...config import settings
 
 router = APIRouter()
 
-# Configure file storage path
-FILE_STORAGE_PATH = Path(settings.FILE_STORAGE_PATH)
-if not FILE_STORAGE_PATH.exists():
-    FILE_STORAGE_PATH.mkdir(parents=True)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+async def _spool_upload(
+    upload: UploadFile,
+    out: BinaryIO,
+    encryptor: Optional[FileEncryptor],
+    hasher: Optional["hmac.HMAC"] = None
+) -> int:
+    """Copy an upload to `out` chunk by chunk, encrypting on the way.
+
+    If a hasher is given it is fed the plaintext, for deduplication.
+
+    Encryption and disk writes run in the threadpool so the event loop is never
+    blocked. Returns the plaintext size.
+    """
+    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024  # Convert to bytes
+    size = 0
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File size exceeds the {settings.MAX_FILE_SIZE_MB}MB limit"
+            )
+        if hasher:
+            hasher.update(chunk)
+        if encryptor:
+            chunk = await run_in_threadpool(encryptor.update, chunk)
+        await run_in_threadpool(out.write, chunk)
+    if encryptor:
+        await run_in_threadpool(out.write, encryptor.finalize())
+    return size
+
+class DatabaseBlobReader(io.RawIOBase):
+    """Seekable read-only view of a file stored in the database.
+
+    Fetches the chunk under the current position on demand. Reads happen in
+    the threadpool (decryption is sync), so each fetch is handed back to the
+    event loop and runs on the async engine like every other query. Wrap it
+    in a BufferedReader so reads spanning chunks are filled completely.
+
+    `size` is the stored length; a chunk missing or cut short before it
+    raises an IOError rather than ending the file early.
+    """
+
+    def __init__(self, file_id: int, size: int):
+        self.file_id = file_id
+        self.size = size
+        self._position = 0
+        self._chunk_index = None
+        self._chunk = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Only absolute and relative seeks are supported")
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self.size:
+            return 0
+        index, offset = divmod(self._position, DB_BLOB_CHUNK_SIZE)
+        if index != self._chunk_index:
+            self._chunk = from_thread.run(self._fetch_chunk, index)
+            self._chunk_index = index
+        data = self._chunk[offset:offset + len(buffer)]
+        if not data:
+            raise IOError(f"Chunk {index} of stored file {self.file_id} is truncated")
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    async def _fetch_chunk(self, index: int) -> bytes:
+        async with async_engine.connect() as conn:
+            data = await conn.scalar(select(FileBlobChunk.data).where(
+                FileBlobChunk.file_id == self.file_id,
+                FileBlobChunk.chunk_index == index
+            ))
+        if data is None:
+            raise IOError(f"Chunk {index} of stored file {self.file_id} is missing")
+        return data
+
+async def _store_deduplicated(
+    db: AsyncSession,
+    user_id: int,
+    digest: str,
+    is_encrypted: bool,
+    size: int,
+    writer: BlobWriter
+) -> Tuple[FileContent, bool]:
+    """Reference the user's existing identical blob, or commit the spooled upload as a new one.
+
+    Returns the content row and whether a new blob was created.
+    """
+    content = await db.scalar(select(FileContent).where(
+        FileContent.user_id == user_id,
+        FileContent.digest == digest,
+        FileContent.is_encrypted == is_encrypted
+    ).with_for_update())
+
+    if content:
+        # Duplicate upload: only a metadata row is added
+        content.ref_count = FileContent.ref_count + 1
+        await run_in_threadpool(writer.discard)
+        return content, False
+
+    # Encrypted and plain copies of the same file are separate blobs. The key is
+    # unique per content row, so a pending delete of a released blob can never
+    # remove one re-created for the same content in the meantime
+    key = f"{user_id}/cas/{digest}-{uuid.uuid4().hex}{'.enc' if is_encrypted else ''}"
+    content = FileContent(
+        user_id=user_id,
+        digest=digest,
+        is_encrypted=is_encrypted,
+        size=size,
+        file_path=key,
+        ref_count=1
+    )
+    try:
+        async with db.begin_nested():
+            db.add(content)
+    except IntegrityError:
+        # A concurrent upload of the same file created the blob first
+        return await _store_deduplicated(db, user_id, digest, is_encrypted, size, writer)
+
+    await run_in_threadpool(writer.commit, key)
+    return content, True
+
+async def _release_content(db: AsyncSession, content_id: int) -> Optional[str]:
+    """Drop one reference to a deduplicated blob.
+
+    Returns the blob key to remove once the transaction commits, if this was
+    the last reference.
+    """
+    content = await db.scalar(select(FileContent).where(FileContent.id == content_id).with_for_update())
+    if not content:
+        return None
+
+    content.ref_count -= 1
+    if content.ref_count > 0:
+        return None
+    await db.delete(content)
+    return content.file_path
+
+async def delete_files_where(db: AsyncSession, condition: ColumnElement) -> List[str]:
+    """Delete every file row matching `condition` with a fixed number of statements.
+
+    Releases the deduplicated blobs they reference. Returns the keys of the
+    blobs that nothing references any more, to be removed once the
+    transaction commits (see `remove_blobs`).
+    """
+    matching = select(File.id).where(condition)
+    blob_keys = list((await db.scalars(
+        select(File.file_path).where(condition, File.content_id.is_(None), File.file_path.is_not(None))
+    )).all())
+
+    # Deduplicated blobs: drop as many references as matching files point at them
+    content_ids = select(File.content_id).where(condition, File.content_id.is_not(None)).distinct()
+    released = (
+        select(func.count(File.id))
+        .where(File.content_id == FileContent.id, File.id.in_(matching))
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(FileContent)
+        .where(FileContent.id.in_(content_ids))
+        .values(ref_count=FileContent.ref_count - released)
+        .execution_options(synchronize_session=False)
+    )
+    orphaned = (await db.execute(
+        select(FileContent.id, FileContent.file_path)
+        .where(FileContent.id.in_(content_ids), FileContent.ref_count <= 0)
+    )).all()
+
+    await db.execute(
+        delete(FileBlobChunk).where(FileBlobChunk.file_id.in_(matching)).execution_options(synchronize_session=False)
+    )
+    await db.execute(delete(File).where(condition).execution_options(synchronize_session=False))
+    if orphaned:
+        await db.execute(
+            delete(FileContent)
+            .where(FileContent.id.in_([content_id for content_id, _ in orphaned]))
+            .execution_options(synchronize_session=False)
+        )
+    blob_keys.extend(key for _, key in orphaned)
+    return blob_keys
+
+def remove_blobs(keys: Iterable[str]):
+    """Remove blobs from the file store, ignoring ones already gone. Meant to run as a background task."""
+    for key in keys:
+        try:
+            blob_store.delete(key)
+        except Exception as e:
+            print(f"Error removing blob {key}: {str(e)}")
 
 @router.post("/", response_model=FileResponse)
 async def upload_file(
     file: UploadFile = FastAPIFile(...),
     folder_id: Optional[int] = None,
     is_encrypted: bool = True,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """Upload a file to the specified folder"""
+    writer = None
+    blob_key = None
     try:
         # Check if folder exists and belongs to user
         if folder_id:
-            folder = db.query(Folder).filter(
+            folder = await db.scalar(select(Folder).where(
                 Folder.id == folder_id,
                 Folder.user_id == current_user.id
-            ).first()
+            ))
             
             if not folder:
                 raise HTTPException(
@@ -48,24 +264,44 @@ async def upload_file(
                     detail="Folder not found or doesn't belong to you"
                 )
         
-        # Read file content
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        # Generate a unique filename to prevent collisions
-        unique_id = str(uuid.uuid4())
-        original_filename = file.filename
-        ext = os.path.splitext(original_filename)[1]
-        secure_filename = f"{unique_id}{ext}"
-        
-        # Check for file size limits (optional)
-        max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024  # Convert to bytes
-        if file_size > max_size:
+        # Reject oversized uploads early when the size is known up front
+        if file.size is not None and file.size > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
             raise HTTPException(
                 status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                 detail=f"File size exceeds the {settings.MAX_FILE_SIZE_MB}MB limit"
             )
-            
+
+        encryptor = None
+        master_key = None
+        if is_encrypted:
+            master_key = session_manager.get_master_key(current_user.id)
+            if not master_key:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Session expired. Please login again."
+                )
+            encryptor = FileEncryptor(master_key)
+
+        # Deduplication hashes are keyed with the master key, so they need a session
+        hasher = None
+        if settings.FILE_DEDUPLICATION and not settings.STORE_FILES_IN_DB:
+            master_key = master_key or session_manager.get_master_key(current_user.id)
+            if master_key:
+                hasher = new_file_hasher(master_key)
+
+        original_filename = file.filename
+        if file.size is not None and storage_tier_for(file.size) == TIER_DATABASE:
+            # Bound for the database: spool in memory, the disk is never touched
+            spool = io.BytesIO()
+            file_size = await _spool_upload(file, spool, encryptor, hasher)
+            tier = TIER_DATABASE
+        else:
+            # Encrypt and spool into a new blob, which only appears under a key
+            # once committed, so a failed upload never leaves a partial file
+            spool = writer = await run_in_threadpool(blob_store.create_writer)
+            file_size = await _spool_upload(file, writer, encryptor, hasher)
+            tier = storage_tier_for(file_size)
+
         # Create file record in database
         db_file = File(
             filename=original_filename,
@@ -73,39 +309,37 @@ async def upload_file(
             size=file_size,
             is_encrypted=is_encrypted,
             user_id=current_user.id,
-            folder_id=folder_id
+            folder_id=folder_id,
+            storage_tier=tier
         )
         
-        # Handle encryption if needed
-        if is_encrypted:
-            master_key = session_manager.get_master_key(current_user.id)
-            if not master_key:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Session expired. Please login again."
-                )
-            file_content = encrypt_file(file_content, master_key)
-        
-        # Choose storage method based on configuration (database or filesystem)
-        if settings.STORE_FILES_IN_DB:
-            # Store in database
-            db_file.file_data = file_content
+        db_file.version = await next_change_version(db, current_user.id)
+
+        # Small files are stored in the database, larger ones on disk (see storage_tier_for)
+        if db_file.storage_tier == TIER_DATABASE:
+            # Store in database, in chunks kept apart from the file row
+            db.add(db_file)
+            await db.flush()
+            await run_in_threadpool(spool.seek, 0)
+            await store_in_database(db, db_file.id, spool)
+        elif hasher:
+            # Store in the user's content-addressed store
+            content, created = await _store_deduplicated(
+                db, current_user.id, hasher.hexdigest(), is_encrypted, file_size, writer
+            )
+            db_file.content_id = content.id
+            db_file.file_path = content.file_path
+            if created:
+                blob_key = content.file_path
         else:
-            # Store in filesystem
-            user_dir = FILE_STORAGE_PATH / str(current_user.id)
-            if not user_dir.exists():
-                user_dir.mkdir(parents=True)
-                
-            file_path = user_dir / secure_filename
-            with open(file_path, "wb") as f:
-                f.write(file_content)
-                
-            # Store relative path in database
-            db_file.file_path = f"{current_user.id}/{secure_filename}"
+            # Store in the blob store, and its key in the database
+            blob_key = new_blob_key(current_user.id, original_filename)
+            await run_in_threadpool(writer.commit, blob_key)
+            db_file.file_path = blob_key
             
         db.add(db_file)
-        db.commit()
-        db.refresh(db_file)
+        await db.commit()
+        await db.refresh(db_file)
         
         # Don't return file data in the response
         file_response = FileResponse.from_orm(db_file)
@@ -113,42 +347,114 @@ async def upload_file(
         
     except Exception as e:
         # Cleanup any partially created files
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+        if blob_key:
+            await run_in_threadpool(blob_store.delete, blob_key)
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if writer:
+            await run_in_threadpool(writer.discard)
+
+def _file_etag(db_file: File) -> str:
+    """Strong validator for a file's content; it changes whenever the file is replaced."""
+    modified = db_file.updated_at or db_file.created_at
+    stamp = int(modified.timestamp() * 1000) if modified else 0
+    return f'"{db_file.id}-{db_file.size}-{stamp}"'
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into inclusive (start, end) offsets.
+
+    Returns None when the header should be ignored (other units, several
+    ranges or a malformed value), and raises 416 when it can't be satisfied.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and start > end:
+                return None
+        else:
+            # Suffix range: the last N bytes, "-0" can never be satisfied
+            suffix = int(last)
+            start = max(size - suffix, 0) if suffix else size
+            end = size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+def _iter_stored_range(f: BinaryIO, db_file: File, master_key: Optional[bytes], start: int, end: int):
+    """Yield bytes start..end (inclusive) of a stored file's plaintext, then close it.
+
+    Unencrypted files are read from the requested offset directly; encrypted
+    ones only decrypt the segments that cover the range.
+    """
+    try:
+        if db_file.is_encrypted:
+            yield from iter_decrypt_file_range(f, master_key, db_file.size, start, end)
+            return
+
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
 
 @router.get("/{file_id}/download")
 async def download_file(
     file_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None, alias="If-Range"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    """Download a file by ID"""
+    """Download a file by ID, or a byte range of it"""
     # Get file from database
-    db_file = db.query(File).filter(
+    db_file = await db.scalar(select(File).where(
         File.id == file_id,
         File.user_id == current_user.id
-    ).first()
+    ))
     
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
     
+    etag = _file_etag(db_file)
+    modified = db_file.updated_at or db_file.created_at
+    last_modified = format_datetime(modified, usegmt=True) if modified and modified.tzinfo else None
+    headers = {
+        "Content-Disposition": f"attachment; filename={db_file.filename}",
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+    }
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+
+    # Only honour Range when If-Range (if sent) still matches the current file
+    byte_range = None
+    if range_header and (if_range is None or if_range in (etag, last_modified)):
+        byte_range = _parse_range(range_header, db_file.size)
+
     try:
-        # Get file content based on storage method
-        if db_file.file_data:
-            # From database
-            file_content = db_file.file_data
-        elif db_file.file_path:
-            # From filesystem
-            file_path = FILE_STORAGE_PATH / db_file.file_path
-            if not file_path.exists():
-                raise HTTPException(status_code=404, detail="File content not found")
-            with open(file_path, "rb") as f:
-                file_content = f.read()
-        else:
-            raise HTTPException(status_code=500, detail="File has no content")
-        
-        # Decrypt if needed
+        master_key = None
         if db_file.is_encrypted:
             master_key = session_manager.get_master_key(current_user.id)
             if not master_key:
@@ -156,33 +462,63 @@ async def download_file(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Session expired. Please login again."
                 )
-            file_content = decrypt_file(file_content, master_key)
-        
-        # Return file as streaming response
+
+        # Get file content based on storage method
+        if db_file.storage_tier == TIER_DATABASE:
+            # From database, read chunk by chunk
+            stored_size = encrypted_file_size(db_file.size) if db_file.is_encrypted else db_file.size
+            f = io.BufferedReader(DatabaseBlobReader(db_file.id, stored_size), DOWNLOAD_CHUNK_SIZE)
+        else:
+            # From the blob store
+            try:
+                f = await run_in_threadpool(blob_store.open, db_file.file_path)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="File content not found")
+
+        status_code = status.HTTP_200_OK
+        start, end = 0, db_file.size - 1
+        if byte_range:
+            start, end = byte_range
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end}/{db_file.size}"
+        headers["Content-Length"] = str(end - start + 1)
+
+        # Stream the plaintext; the sync generator is iterated in the threadpool
         return StreamingResponse(
-            io.BytesIO(file_content),
+            _iter_stored_range(f, db_file, master_key, start, end),
+            status_code=status_code,
             media_type=db_file.content_type,
-            headers={"Content-Disposition": f"attachment; filename={db_file.filename}"}
+            headers=headers
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving file: {str(e)}")
 
 @router.get("/", response_model=List[FileResponse])
-def get_files(
+async def get_files(
+    request: Request,
+    response: Response,
     folder_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get all files for the user, optionally filtered by folder"""
-    query = db.query(File).filter(File.user_id == current_user.id)
+    etag = listing_etag("files", current_user.id, await current_change_version(db, current_user.id), request)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    query = select(File).where(File.user_id == current_user.id)
     
     # Filter by folder if provided
     if folder_id is not None:
         # Verify folder belongs to user
-        folder = db.query(Folder).filter(
+        folder = await db.scalar(select(Folder).where(
             Folder.id == folder_id,
             Folder.user_id == current_user.id
-        ).first()
+        ))
         
         if not folder:
             raise HTTPException(
@@ -190,53 +526,60 @@ def get_files(
                 detail="Folder not found or doesn't belong to you"
             )
             
-        query = query.filter(File.folder_id == folder_id)
+        query = query.where(File.folder_id == folder_id)
     
-    files = query.all()
+    files = (await db.scalars(query)).all()
     return files
 
 @router.delete("/{file_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_file(
+async def delete_file(
     file_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Delete a file"""
-    db_file = db.query(File).filter(
+    db_file = await db.scalar(select(File).where(
         File.id == file_id,
         File.user_id == current_user.id
-    ).first()
+    ))
     
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
     
     try:
-        # Delete file from filesystem if stored there
-        if db_file.file_path:
-            file_path = FILE_STORAGE_PATH / db_file.file_path
-            if file_path.exists():
-                os.remove(file_path)
+        version = await next_change_version(db, current_user.id)
+        if db_file.content_id:
+            # Deduplicated blobs are only removed with their last reference
+            blob_key = await _release_content(db, db_file.content_id)
+        elif db_file.storage_tier == TIER_FILESYSTEM:
+            blob_key = db_file.file_path
+        else:
+            blob_key = None
+            await db.execute(delete(FileBlobChunk).where(FileBlobChunk.file_id == file_id))
         
-        # Delete record from database
-        db.delete(db_file)
-        db.commit()
+        # Delete record from database, then the blob it no longer references
+        await db.delete(db_file)
+        await record_tombstones(db, current_user.id, "file", [file_id], version)
+        await db.commit()
+        if blob_key:
+            await run_in_threadpool(blob_store.delete, blob_key)
         return None
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting file: {str(e)}")
 
 @router.put("/{file_id}", response_model=FileResponse)
-def update_file(
+async def update_file(
     file_id: int,
     file_update: FileUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Update file metadata (rename or move to different folder)"""
-    db_file = db.query(File).filter(
+    db_file = await db.scalar(select(File).where(
         File.id == file_id,
         File.user_id == current_user.id
-    ).first()
+    ))
     
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
@@ -245,10 +588,10 @@ def update_file(
     
     # Check if folder exists and belongs to user if moving
     if "folder_id" in update_data and update_data["folder_id"] is not None:
-        folder = db.query(Folder).filter(
+        folder = await db.scalar(select(Folder).where(
             Folder.id == update_data["folder_id"],
             Folder.user_id == current_user.id
-        ).first()
+        ))
         
         if not folder:
             raise HTTPException(
@@ -256,10 +599,13 @@ def update_file(
                 detail="Destination folder not found or doesn't belong to you"
             )
     
+    # Take the version before touching the row, see next_change_version
+    version = await next_change_version(db, current_user.id)
+
     # Update the file record
     for key, value in update_data.items():
         setattr(db_file, key, value)
-    
-    db.commit()
-    db.refresh(db_file)
+    db_file.version = version
+    await db.commit()
+    await db.refresh(db_file)
     return db_file
\ No newline at end of file
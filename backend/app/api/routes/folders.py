@@ -1,30 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response, status
+from sqlalchemy import String, delete, func, select, true, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
 from ...models.folder import Folder
 from ...models.note import Note
-from ...schemas.folder import FolderCreate, FolderUpdate, FolderResponse
+from ...models.note_search_token import NoteSearchToken
+from ...models.file import File
+from ...schemas.folder import FolderCreate, FolderUpdate, FolderResponse, FolderTreeResponse
 from ...database import get_db
 from ..dependencies import get_current_user
-from ...models.user import User
+from ...core.principal_cache import Principal
+from .files import delete_files_where, remove_blobs
+from ..change_tracking import current_change_version, next_change_version, record_tombstones
+from ..etags import etag_matches, listing_etag, not_modified, set_etag
 
 router = APIRouter()
 
+# Deepest subtree a single tree request may ask for
+MAX_TREE_DEPTH = 64
+
 @router.post("/", response_model=FolderResponse)
-def create_folder(
+async def create_folder(
     folder: FolderCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """Create a new folder"""
     try:
         # Check if parent folder exists and belongs to the user
         if folder.parent_id:
-            parent_folder = db.query(Folder).filter(
+            parent_folder = await db.scalar(select(Folder).where(
                 Folder.id == folder.parent_id,
                 Folder.user_id == current_user.id
-            ).first()
+            ))
             
             if not parent_folder:
                 raise HTTPException(
@@ -32,41 +41,118 @@ def create_folder(
                     detail="Parent folder not found or doesn't belong to you"
                 )
         
-        db_folder = Folder(**folder.dict(), user_id=current_user.id)
+        db_folder = Folder(**folder.dict(), user_id=current_user.id, path="")
         db.add(db_folder)
-        db.commit()
-        db.refresh(db_folder)
+        # The path ends with the folder's own id, known once it's inserted
+        await db.flush()
+        db_folder.path = Folder.child_path(parent_folder.path if folder.parent_id else None, db_folder.id)
+        db_folder.depth = parent_folder.depth + 1 if folder.parent_id else 0
+        db_folder.version = await next_change_version(db, current_user.id)
+        await db.commit()
+        await db.refresh(db_folder)
         return db_folder
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/", response_model=List[FolderResponse])
-def get_folders(
+async def get_folders(
+    request: Request,
+    response: Response,
     parent_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get all folders for the user, optionally filtered by parent_id"""
-    query = db.query(Folder).filter(Folder.user_id == current_user.id)
+    etag = listing_etag("folders", current_user.id, await current_change_version(db, current_user.id), request)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    query = select(Folder).where(Folder.user_id == current_user.id)
     
     # Filter by parent_id if provided
     if parent_id is not None:
-        query = query.filter(Folder.parent_id == parent_id)
+        query = query.where(Folder.parent_id == parent_id)
     
-    return query.all()
+    return (await db.scalars(query)).all()
+
+@router.get("/tree", response_model=List[FolderTreeResponse])
+async def get_folder_tree(
+    request: Request,
+    response: Response,
+    root_id: Optional[int] = None,
+    max_depth: Optional[int] = Query(None, ge=0, le=MAX_TREE_DEPTH),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Get the folder hierarchy with note and file counts in a single query.
+
+    Returns the user's root folders, or only `root_id` when given, with nested
+    children down to `max_depth` levels below them.
+    """
+    etag = listing_etag("folder-tree", current_user.id, await current_change_version(db, current_user.id), request)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    query_filter = [Folder.user_id == current_user.id]
+    if root_id is None:
+        base_depth = 0
+    else:
+        root = (
+            select(Folder.path, Folder.depth)
+            .where(Folder.id == root_id, Folder.user_id == current_user.id)
+            .subquery()
+        )
+        # Subtree of the root: every folder whose path extends the root's
+        query_filter.append(Folder.path.startswith(root.c.path))
+        base_depth = root.c.depth
+    if max_depth is not None:
+        query_filter.append(Folder.depth <= base_depth + max_depth)
+
+    note_count = (
+        select(func.count(Note.id)).where(Note.folder_id == Folder.id).correlate(Folder).scalar_subquery()
+    )
+    file_count = (
+        select(func.count(File.id)).where(File.folder_id == Folder.id).correlate(Folder).scalar_subquery()
+    )
+    query = select(Folder, note_count, file_count).where(*query_filter)
+    if root_id is not None:
+        query = query.join(root, true())
+    rows = (await db.execute(query.order_by(Folder.depth, Folder.name, Folder.id))).all()
+
+    if root_id is not None and not rows:
+        raise HTTPException(status_code=404, detail="Folder not found")
+
+    # Rows come parents first, so every child finds its parent already built
+    nodes = {}
+    roots = []
+    for folder, notes, files in rows:
+        node = FolderResponse.from_orm(folder).dict()
+        node.update(note_count=notes, file_count=files, children=[])
+        nodes[folder.id] = node
+        if folder.parent_id in nodes:
+            nodes[folder.parent_id]["children"].append(node)
+        else:
+            roots.append(node)
+    return roots
 
 @router.get("/{folder_id}", response_model=FolderResponse)
-def get_folder(
+async def get_folder(
     folder_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get a specific folder by ID"""
-    folder = db.query(Folder).filter(
+    folder = await db.scalar(select(Folder).where(
         Folder.id == folder_id,
         Folder.user_id == current_user.id
-    ).first()
+    ))
     
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found")
@@ -74,17 +160,17 @@ def get_folder(
     return folder
 
 @router.put("/{folder_id}", response_model=FolderResponse)
-def update_folder(
+async def update_folder(
     folder_id: int,
     folder_update: FolderUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Update a folder"""
-    db_folder = db.query(Folder).filter(
+    db_folder = await db.scalar(select(Folder).where(
         Folder.id == folder_id,
         Folder.user_id == current_user.id
-    ).first()
+    ))
     
     if not db_folder:
         raise HTTPException(status_code=404, detail="Folder not found")
@@ -101,10 +187,10 @@ def update_folder(
             )
         
         # Check if new parent exists and belongs to the user
-        parent = db.query(Folder).filter(
+        parent = await db.scalar(select(Folder).where(
             Folder.id == update_data["parent_id"],
             Folder.user_id == current_user.id
-        ).first()
+        ))
         
         if not parent:
             raise HTTPException(
@@ -113,86 +199,123 @@ def update_folder(
             )
         
         # Prevent setting a descendant as parent (would create a cycle)
-        current_id = parent.id
-        while current_id:
-            current_folder = db.query(Folder).filter(Folder.id == current_id).first()
-            if current_folder.parent_id == folder_id:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Cannot set a descendant folder as parent (would create a cycle)"
-                )
-            current_id = current_folder.parent_id
-    
+        if parent.path.startswith(db_folder.path):
+            raise HTTPException(
+                status_code=400,
+                detail="Cannot set a descendant folder as parent (would create a cycle)"
+            )
+
+    moved = "parent_id" in update_data and update_data["parent_id"] != db_folder.parent_id
+
+    # Take the version before touching the row, see next_change_version
+    version = await next_change_version(db, current_user.id)
+
     # Update folder with provided data
     for key, value in update_data.items():
         setattr(db_folder, key, value)
-    
-    db.commit()
-    db.refresh(db_folder)
+    db_folder.version = version
+    if moved:
+        # Re-root the whole subtree in one statement
+        old_path = db_folder.path
+        new_path = Folder.child_path(parent.path if update_data["parent_id"] else None, folder_id)
+        depth_change = (parent.depth + 1 if update_data["parent_id"] else 0) - db_folder.depth
+        await db.execute(
+            update(Folder)
+            .where(Folder.user_id == current_user.id, Folder.path.startswith(old_path))
+            .values(
+                path=new_path + func.substr(Folder.path, len(old_path) + 1, type_=String),
+                depth=Folder.depth + depth_change
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    await db.commit()
+    await db.refresh(db_folder)
     return db_folder
 
 @router.delete("/{folder_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_folder(
+async def delete_folder(
     folder_id: int,
+    background_tasks: BackgroundTasks,
     recursive: bool = False,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Delete a folder"""
-    folder = db.query(Folder).filter(
+    folder = await db.scalar(select(Folder).where(
         Folder.id == folder_id,
         Folder.user_id == current_user.id
-    ).first()
+    ))
     
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found")
     
-    # Check if folder has children or notes
-    has_children = db.query(Folder).filter(Folder.parent_id == folder_id).first() is not None
-    has_notes = db.query(Note).filter(Note.folder_id == folder_id).first() is not None
+    # Check if folder has children, notes or files
+    has_children = await db.scalar(select(Folder.id).where(Folder.parent_id == folder_id).limit(1)) is not None
+    has_notes = await db.scalar(select(Note.id).where(Note.folder_id == folder_id).limit(1)) is not None
+    has_files = await db.scalar(select(File.id).where(File.folder_id == folder_id).limit(1)) is not None
     
-    if (has_children or has_notes) and not recursive:
+    if (has_children or has_notes or has_files) and not recursive:
         raise HTTPException(
             status_code=400,
-            detail="Folder contains notes or subfolders. Use recursive=true to delete everything."
+            detail="Folder contains notes, files or subfolders. Use recursive=true to delete everything."
         )
     
-    # Delete recursively if requested
-    if recursive:
-        # Delete all notes in this folder
-        db.query(Note).filter(Note.folder_id == folder_id).delete()
-        
-        # Get all child folders
-        child_folders = db.query(Folder).filter(Folder.parent_id == folder_id).all()
-        for child in child_folders:
-            # Recursive delete through API call
-            delete_folder(child.id, True, db, current_user)
-    
-    # Finally delete the folder itself
-    db.delete(folder)
-    db.commit()
+    blob_keys = []
+    try:
+        version = await next_change_version(db, current_user.id)
+        if recursive:
+            # The whole subtree, by path prefix; every statement below is set-based
+            subtree = select(Folder.id).where(
+                Folder.user_id == current_user.id,
+                Folder.path.startswith(folder.path)
+            )
+            subtree_notes = select(Note.id).where(Note.folder_id.in_(subtree))
+            subtree_files = select(File.id).where(File.folder_id.in_(subtree))
+            await record_tombstones(db, current_user.id, "note", subtree_notes, version)
+            await record_tombstones(db, current_user.id, "file", subtree_files, version)
+            await record_tombstones(db, current_user.id, "folder", subtree, version)
+            await db.execute(delete(NoteSearchToken).where(NoteSearchToken.note_id.in_(subtree_notes)))
+            await db.execute(delete(Note).where(Note.folder_id.in_(subtree)))
+            blob_keys = await delete_files_where(db, File.folder_id.in_(subtree))
+            await db.execute(
+                delete(Folder)
+                .where(Folder.user_id == current_user.id, Folder.path.startswith(folder.path))
+                .execution_options(synchronize_session=False)
+            )
+        else:
+            await db.delete(folder)
+            await record_tombstones(db, current_user.id, "folder", [folder_id], version)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error deleting folder: {str(e)}")
+
+    # Blobs are removed after the response, the rows no longer reference them
+    if blob_keys:
+        background_tasks.add_task(remove_blobs, blob_keys)
     return None
 
 @router.get("/{folder_id}/notes", response_model=List)
-def get_folder_notes(
+async def get_folder_notes(
     folder_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get all notes in a specific folder"""
     # First check if folder exists and belongs to user
-    folder = db.query(Folder).filter(
+    folder = await db.scalar(select(Folder).where(
         Folder.id == folder_id,
         Folder.user_id == current_user.id
-    ).first()
+    ))
     
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found")
     
     # Get all notes in the folder
-    notes = db.query(Note).filter(
+    notes = (await db.scalars(select(Note).where(
         Note.folder_id == folder_id,
         Note.user_id == current_user.id
-    ).all()
+    ))).all()
     
     return notes
\ No newline at end of file
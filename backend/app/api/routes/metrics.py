@@ -0,0 +1,31 @@
+from typing import Optional
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from ..dependencies import principal_cache
+from ...config import settings
+from ...core.kdf_executor import kdf_executor
+from ...core.rate_limit import auth_rate_limiter
+
+router = APIRouter()
+
+def require_metrics_token(authorization: Optional[str] = Header(None)):
+    """Only operators holding METRICS_TOKEN may read the counters; user tokens are not accepted."""
+    scheme, _, token = (authorization or "").partition(" ")
+    expected = settings.METRICS_TOKEN
+    if not expected or scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@router.get("/", dependencies=[Depends(require_metrics_token)])
+def get_metrics():
+    """Runtime counters of the in-process caches, for tuning under load"""
+    return {
+        "principal_cache": principal_cache.stats(),
+        "kdf": kdf_executor.stats(),
+        "auth_rate_limit": auth_rate_limiter.stats(),
+    }
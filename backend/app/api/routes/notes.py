@@ -1,23 +1,185 @@
 # app/api/routes/notes.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, bindparam, delete, distinct, func, insert, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+import hmac
 
 from ...models.note import Note
-from ...schemas.note import NoteCreate, NoteUpdate, NoteResponse
-from ...database import get_db
+from ...models.note_search_token import NoteSearchToken
+from ...models.folder import Folder
+from ...schemas.note import (
+    NoteCreate, NoteUpdate, NoteResponse, NoteSummary, NotePage,
+    NoteBatchRequest, NoteBatchResult, NoteBatchResponse
+)
+from ...database import AsyncSessionLocal, get_db
 from ..dependencies import get_current_user
-from ...models.user import User
-from ...core.encryption import decrypt_master_key, encrypt_note_content, decrypt_note_content
+from ..change_tracking import current_change_version, next_change_version, record_tombstones
+from ..etags import etag_matches, if_match_failed, listing_etag, make_etag, not_modified, set_etag
+from ...core.principal_cache import Principal
+from ...core.encryption import (
+    decrypt_master_key, encrypt_note_content, decrypt_note_content, decrypt_many, encrypt_many, note_content_digest
+)
 from ...core.session_manager import session_manager
+from ...core.pagination import encode_cursor, decode_cursor
+from ...core.search_index import note_search_tokens, query_search_tokens
 
 router = APIRouter()
 
+MAX_PAGE_SIZE = 200
+REINDEX_BATCH_SIZE = 500
+MAX_BATCH_OPERATIONS = 500
+
+async def _write_search_indexes(db: AsyncSession, entries: List[Tuple[Note, Optional[str]]], master_key: Optional[bytes]):
+    """Replace the blind index tokens of several notes, given their plaintext content."""
+    note_ids = [note.id for note, _ in entries if note.id is not None]
+    if note_ids:
+        await db.execute(delete(NoteSearchToken).where(NoteSearchToken.note_id.in_(note_ids)))
+
+    # Unencrypted notes are searched directly, they don't need index tokens
+    encrypted = [(note, content) for note, content in entries if note.is_encrypted]
+    for note, _ in entries:
+        note.search_indexed = note.is_encrypted
+    if not encrypted:
+        return
+
+    await db.flush()
+    token_lists = await run_in_threadpool(
+        lambda: [note_search_tokens(note.title, content, master_key) for note, content in encrypted]
+    )
+    rows = [
+        {"note_id": note.id, "user_id": note.user_id, "token": token}
+        for (note, _), tokens in zip(encrypted, token_lists)
+        for token in tokens
+    ]
+    if rows:
+        await db.execute(insert(NoteSearchToken), rows)
+
+async def _write_search_index(db: AsyncSession, note: Note, content: Optional[str], master_key: Optional[bytes]):
+    """Replace the blind index tokens of a note, given its plaintext content."""
+    await _write_search_indexes(db, [(note, content)], master_key)
+
+async def index_pending_notes(user_id: int, master_key: bytes) -> int:
+    """Index encrypted notes that were written before they had blind index tokens.
+
+    Needs the master key, so it runs in the background after login, one
+    batch per transaction. A note is only indexed while it still has the
+    version that was read, so a concurrent edit's tokens are never replaced
+    by stale ones. Returns the number of notes indexed.
+    """
+    indexed = 0
+    last_id = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            pending = (await db.scalars(
+                select(Note).where(
+                    Note.user_id == user_id,
+                    Note.is_encrypted == True,
+                    Note.search_indexed == False,
+                    Note.id > last_id
+                ).order_by(Note.id).limit(REINDEX_BATCH_SIZE)
+            )).all()
+            if not pending:
+                return indexed
+            last_id = pending[-1].id
+
+            try:
+                contents = await run_in_threadpool(decrypt_many, [note.ciphertext for note in pending], master_key)
+            except Exception as e:
+                print(f"Error indexing notes of user {user_id}: {str(e)}")
+                return indexed
+            entries = []
+            for note, content in zip(pending, contents):
+                # Locks the row until commit, so the note can't change under its new tokens
+                claimed = await db.execute(
+                    update(Note)
+                    .where(Note.id == note.id, Note.version == note.version, Note.search_indexed == False)
+                    .values(search_indexed=True)
+                    .execution_options(synchronize_session=False)
+                )
+                if claimed.rowcount:
+                    entries.append((note, content))
+            await _write_search_indexes(db, entries, master_key)
+            await db.commit()
+            indexed += len(entries)
+
+async def upgrade_note_ciphertexts(user_id: int, master_key: bytes) -> int:
+    """Rewrite the user's legacy Fernet note ciphertexts as binary envelopes.
+
+    Needs the master key, so it runs in the background after login, one
+    batch per transaction. A row is only replaced while it still has the
+    version that was read, so a concurrent edit is never undone. Returns the
+    number of notes converted.
+    """
+    notes = Note.__table__
+    converted = 0
+    last_id = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            rows = (await db.execute(
+                select(Note.id, Note.version, Note.content).where(
+                    Note.user_id == user_id,
+                    Note.is_encrypted == True,
+                    Note.encrypted_content.is_(None),
+                    Note.content.is_not(None),
+                    Note.id > last_id
+                ).order_by(Note.id).limit(REINDEX_BATCH_SIZE)
+            )).all()
+            if not rows:
+                return converted
+            last_id = rows[-1].id
+
+            try:
+                contents = await run_in_threadpool(decrypt_many, [row.content for row in rows], master_key)
+            except Exception as e:
+                print(f"Error upgrading note ciphertexts of user {user_id}: {str(e)}")
+                return converted
+            envelopes = await run_in_threadpool(encrypt_many, contents, master_key)
+            await db.execute(
+                update(notes)
+                .where(
+                    notes.c.id == bindparam("note_id"),
+                    notes.c.version == bindparam("note_version"),
+                    notes.c.encrypted_content.is_(None)
+                )
+                .values(
+                    content=None,
+                    encrypted_content=bindparam("envelope"),
+                    content_digest=bindparam("digest")
+                ),
+                [
+                    {
+                        "note_id": row.id,
+                        "note_version": row.version,
+                        "envelope": envelope,
+                        "digest": note_content_digest(content, master_key),
+                    }
+                    for row, content, envelope in zip(rows, contents, envelopes)
+                ]
+            )
+            await db.commit()
+            converted += len(rows)
+
+async def _note_responses(notes: List[Note], master_key: Optional[bytes]) -> List[NoteResponse]:
+    """Responses for `notes`, with the content of the encrypted ones decrypted in one batch."""
+    items = [NoteResponse.model_validate(note) for note in notes]
+    encrypted = [(item, note) for item, note in zip(items, notes) if note.is_encrypted]
+    if encrypted:
+        decrypted = await run_in_threadpool(
+            decrypt_many, [note.ciphertext for _, note in encrypted], master_key
+        )
+        for (item, _), content in zip(encrypted, decrypted):
+            item.content = content
+    return items
+
 @router.post("/", response_model=NoteResponse)
-def create_note(
+async def create_note(
     note: NoteCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     try:
         if note.is_encrypted:
@@ -29,30 +191,270 @@ def create_note(
                 )
             
             note_data = note.dict()
-            note_data['content'] = encrypt_note_content(note.content, master_key)
+            note_data['content'] = None
+            note_data['encrypted_content'] = encrypt_note_content(note.content, master_key)
+            note_data['content_digest'] = note_content_digest(note.content, master_key)
         else:
             note_data = note.dict()
 
         db_note = Note(**note_data, user_id=current_user.id)
+        db_note.version = await next_change_version(db, current_user.id)
         db.add(db_note)
-        db.commit()
-        db.refresh(db_note)
-        return db_note
+        if db_note.is_encrypted:
+            await _write_search_index(db, db_note, note.content, master_key)
+        await db.commit()
+        await db.refresh(db_note)
+
+        note_response = NoteResponse.model_validate(db_note)
+        note_response.content = note.content
+        return note_response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/batch", response_model=NoteBatchResponse)
+async def batch_notes(
+    batch: NoteBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Apply a list of create/update/delete/move operations in one transaction.
+
+    Operations that can't be applied (unknown note, foreign folder, missing
+    fields) are reported in their result and skipped, the others are committed
+    together. All decryption and all encryption each run as a single batch.
+    """
+    operations = batch.operations
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch can hold at most {MAX_BATCH_OPERATIONS} operations"
+        )
+    results = [NoteBatchResult(op=op.op, id=op.id, client_id=op.client_id) for op in operations]
+
+    # Everything the batch refers to is loaded with one query per table
+    note_ids = [op.id for op in operations if op.op != "create" and op.id is not None]
+    notes = {}
+    if note_ids:
+        notes = {note.id: note for note in (await db.scalars(
+            select(Note).where(Note.user_id == current_user.id, Note.id.in_(note_ids))
+        )).all()}
+    datas = [
+        {"folder_id": op.folder_id} if op.op == "move"
+        else op.data.dict(exclude_unset=True) if op.data else {}
+        for op in operations
+    ]
+    folder_ids = {data["folder_id"] for data in datas if data.get("folder_id") is not None}
+    owned_folders = set()
+    if folder_ids:
+        owned_folders = set((await db.scalars(
+            select(Folder.id).where(Folder.user_id == current_user.id, Folder.id.in_(folder_ids))
+        )).all())
+
+    # Validate, and normalise each operation's data to the fields it sets
+    planned = []  # (index, op, note, data)
+    seen = set()
+    for i, (op, data) in enumerate(zip(operations, datas)):
+        for key in ("content", "is_encrypted"):
+            if key in data and data[key] is None:
+                del data[key]
+        error = None
+        if op.op == "create":
+            if data.get("title") is None or "content" not in data:
+                error = (422, "A created note needs a title and content")
+            else:
+                data = NoteCreate(**data).dict()
+        elif op.id is None:
+            error = (422, "Note id is required")
+        elif op.id in seen:
+            error = (409, "Note appears more than once in the batch")
+        elif op.id not in notes:
+            error = (404, "Note not found")
+        if not error and data.get("folder_id") is not None and data["folder_id"] not in owned_folders:
+            error = (404, "Folder not found or doesn't belong to you")
+        if error:
+            results[i].status_code, results[i].error = error
+            continue
+        if op.op != "create":
+            seen.add(op.id)
+        planned.append((i, op.op, notes.get(op.id), data))
+
+    edits = [(i, op, note, data) for i, op, note, data in planned if op in ("create", "update")]
+    needs_key = any(
+        data["is_encrypted"] if op == "create" else note.is_encrypted or data.get("is_encrypted")
+        for _, op, note, data in edits
+    )
+    master_key = None
+    if needs_key:
+        master_key = session_manager.get_master_key(current_user.id)
+        if not master_key:
+            raise HTTPException(
+                status_code=401,
+                detail="Session expired. Please login again."
+            )
+
+    try:
+        # Plaintext of every created/updated note, stored contents decrypted in one batch
+        plaintext: Dict[int, str] = {}
+        stored = [
+            (i, note) for i, op, note, data in edits
+            if op == "update" and "content" not in data and note.is_encrypted
+        ]
+        if stored:
+            decrypted = await run_in_threadpool(decrypt_many, [note.ciphertext for _, note in stored], master_key)
+            plaintext.update((i, content) for (i, _), content in zip(stored, decrypted))
+        for i, op, note, data in edits:
+            if "content" in data:
+                plaintext[i] = data["content"]
+            elif i not in plaintext:
+                plaintext[i] = note.content
+
+        # Contents that have to be (re)written, encrypted in one batch where needed
+        rewritten = {}
+        for i, op, note, data in edits:
+            encrypted = data.get("is_encrypted", note.is_encrypted if note else True)
+            if op == "create" or "content" in data or encrypted != note.is_encrypted:
+                rewritten[i] = encrypted
+        to_encrypt = [i for i, encrypted in rewritten.items() if encrypted]
+        if to_encrypt:
+            ciphertexts = await run_in_threadpool(encrypt_many, [plaintext[i] for i in to_encrypt], master_key)
+            ciphertext = dict(zip(to_encrypt, ciphertexts))
+
+        touched = {}
+        index_entries = []
+        deleted_ids = []
+        version = await next_change_version(db, current_user.id) if planned else None
+        for i, op, note, data in planned:
+            if op == "delete":
+                deleted_ids.append(note.id)
+                continue
+            if op == "create":
+                note = Note(**data, user_id=current_user.id)
+                db.add(note)
+            else:
+                for key, value in data.items():
+                    setattr(note, key, value)
+            note.version = version
+            if i in rewritten:
+                note.store_content(ciphertext[i] if rewritten[i] else plaintext[i])
+                note.content_digest = note_content_digest(plaintext[i], master_key) if rewritten[i] else None
+            if op == "create" or (op == "update" and data.keys() & {"title", "content", "is_encrypted"}):
+                index_entries.append((note, plaintext[i]))
+            touched[i] = note
+
+        await db.flush()
+        await _write_search_indexes(db, index_entries, master_key)
+        if deleted_ids:
+            for note_id in deleted_ids:
+                db.expunge(notes[note_id])
+            await db.execute(delete(NoteSearchToken).where(NoteSearchToken.note_id.in_(deleted_ids)))
+            await db.execute(
+                delete(Note).where(Note.id.in_(deleted_ids)).execution_options(synchronize_session=False)
+            )
+            await record_tombstones(db, current_user.id, "note", deleted_ids, version)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error applying batch: {str(e)}")
+
+    # Reload server-generated columns (timestamps, ids) of all touched notes at once
+    if touched:
+        (await db.scalars(
+            select(Note).where(Note.id.in_([note.id for note in touched.values()]))
+            .execution_options(populate_existing=True)
+        )).all()
+    for i, note in touched.items():
+        results[i].id = note.id
+        if i in plaintext:
+            response = NoteResponse.model_validate(note)
+            response.content = plaintext[i]
+            results[i].note = response
+    return NoteBatchResponse(results=results)
+
+@router.get("/search", response_model=List[NoteResponse])
+async def search_notes(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Search the user's notes by title and content.
+
+    Encrypted notes are matched through their blind index tokens, so only the
+    matching notes are loaded and decrypted. Every query term must match the
+    start of a word in the note and be at least MIN_PREFIX_LENGTH (3)
+    characters long. Notes written before the index existed are indexed in
+    the background after the owner's next login, and found from then on.
+    """
+    master_key = session_manager.get_master_key(current_user.id)
+    if not master_key:
+        raise HTTPException(
+            status_code=401,
+            detail="Session expired. Please login again."
+        )
+
+    try:
+        tokens = query_search_tokens(q, master_key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not tokens:
+        return []
+
+    try:
+        token_hits = select(NoteSearchToken.note_id).where(
+            NoteSearchToken.user_id == current_user.id,
+            NoteSearchToken.token.in_(tokens)
+        ).group_by(NoteSearchToken.note_id).having(
+            func.count(distinct(NoteSearchToken.token)) == len(tokens)
+        )
+        escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = f"%{escaped}%"
+
+        notes = (await db.scalars(
+            select(Note).where(
+                Note.user_id == current_user.id,
+                or_(
+                    Note.id.in_(token_hits),
+                    Note.title.ilike(pattern, escape="\\"),
+                    and_(Note.is_encrypted == False, Note.content.ilike(pattern, escape="\\"))
+                )
+            ).order_by(Note.updated_at.desc(), Note.id.desc()).limit(limit)
+        )).all()
+
+        return await _note_responses(notes, master_key)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching notes: {str(e)}")
+
 @router.get("/{note_id}", response_model=NoteResponse)
-def get_note(
+async def get_note(
     note_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    """Get a specific note by ID, ensuring the user owns it."""
-    note = db.query(Note).filter(Note.id == note_id, Note.user_id == current_user.id).first()
+    """Get a specific note by ID, ensuring the user owns it.
+
+    Answers 304 when If-None-Match holds the current ETag, without loading or
+    decrypting the content.
+    """
+    version = await db.scalar(select(Note.version).where(Note.id == note_id, Note.user_id == current_user.id))
+    if version is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    etag = make_etag("note", note_id, version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    note = await db.scalar(select(Note).where(Note.id == note_id, Note.user_id == current_user.id))
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
+    set_etag(response, make_etag("note", note_id, note.version))
 
     try:
+        note_response = NoteResponse.model_validate(note)
         if note.is_encrypted:
             master_key = session_manager.get_master_key(current_user.id)
             if not master_key:
@@ -60,20 +462,74 @@ def get_note(
                     status_code=401,
                     detail="Session expired. Please login again."
                 )
-            note.content = decrypt_note_content(note.content, master_key)
-        return note
+            note_response.content = decrypt_note_content(note.ciphertext, master_key)
+        return note_response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving note: {str(e)}")
 
-@router.get("/", response_model=List[NoteResponse])
-def get_notes(
-    db: Session = Depends(get_db), 
-    current_user: User = Depends(get_current_user)
+@router.get("/", response_model=NotePage)
+async def get_notes(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: str = Query("updated_at", pattern="^(updated_at|created_at)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    include: Optional[str] = Query(None, pattern="^content$"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db), 
+    current_user: Principal = Depends(get_current_user)
 ):
-    """Get all notes for the authenticated user."""
+    """Get one page of the authenticated user's notes.
+
+    By default only note metadata is returned and `content` is never loaded or
+    decrypted. Pass `include=content` to get decrypted content as well, and the
+    returned `next_cursor` to fetch the following page.
+
+    The ETag follows the user's change version, so an unchanged listing is
+    answered with 304 after a single primary key lookup.
+    """
+    etag = listing_etag("notes", current_user.id, await current_change_version(db, current_user.id), request)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    sort_column = getattr(Note, sort)
+    query = select(Note).where(Note.user_id == current_user.id)
+
+    if cursor:
+        try:
+            cursor_value, cursor_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if order == "desc":
+            query = query.where(tuple_(sort_column, Note.id) < tuple_(cursor_value, cursor_id))
+        else:
+            query = query.where(tuple_(sort_column, Note.id) > tuple_(cursor_value, cursor_id))
+
+    if order == "desc":
+        query = query.order_by(sort_column.desc(), Note.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Note.id.asc())
+
+    if include != "content":
+        query = query.options(defer(Note.content), defer(Note.encrypted_content))
+
     try:
-        notes = db.query(Note).filter(Note.user_id == current_user.id).all()
-        
+        # Fetch one extra row to know whether there is a next page
+        notes = (await db.scalars(query.limit(limit + 1))).all()
+        next_cursor = None
+        if len(notes) > limit:
+            notes = notes[:limit]
+            last = notes[-1]
+            next_cursor = encode_cursor(getattr(last, sort), last.id)
+
+        if include != "content":
+            items = [NoteSummary.model_validate(note) for note in notes]
+            return NotePage(items=items, next_cursor=next_cursor)
+
         # Get master key once for all encrypted notes
         master_key = None
         encrypted_notes = any(note.is_encrypted for note in notes)
@@ -86,33 +542,47 @@ def get_notes(
                     detail="Session expired. Please login again."
                 )
 
-        # Decrypt notes if needed
-        for note in notes:
-            if note.is_encrypted:
-                note.content = decrypt_note_content(note.content, master_key)
-        
-        return notes
+        # Decrypt all encrypted notes in one batch
+        items = await _note_responses(notes, master_key)
+
+        return NotePage(items=items, next_cursor=next_cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving notes: {str(e)}")
 
 @router.put("/{note_id}", response_model=NoteResponse)
-def update_note(
+async def update_note(
     note_id: int,
     note_update: NoteUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    """Update a note if the user owns it."""
-    db_note = db.query(Note).filter(Note.id == note_id, Note.user_id == current_user.id).first()
+    """Update a note if the user owns it.
+
+    With If-Match the update only applies while the note still has that ETag,
+    otherwise it fails with 412. Fields that already hold the sent values are
+    left alone; when nothing changes nothing is written, and content that
+    matches the stored digest is not encrypted again.
+    """
+    db_note = await db.scalar(select(Note).where(Note.id == note_id, Note.user_id == current_user.id))
     if not db_note:
         raise HTTPException(status_code=404, detail="Note not found")
+    if if_match_failed(if_match, make_etag("note", note_id, db_note.version)):
+        raise _precondition_failed(note_id, db_note.version)
 
     try:
         update_data = note_update.dict(exclude_unset=True)
+        for key in ('content', 'is_encrypted'):
+            if key in update_data and update_data[key] is None:
+                del update_data[key]
+        encrypted = update_data.get('is_encrypted', db_note.is_encrypted)
         master_key = None
         
         # Get master key if needed
-        if db_note.is_encrypted or ('is_encrypted' in update_data and update_data['is_encrypted']):
+        if db_note.is_encrypted or encrypted:
             master_key = session_manager.get_master_key(current_user.id)
             if not master_key:
                 raise HTTPException(
@@ -120,45 +590,91 @@ def update_note(
                     detail="Session expired. Please login again."
                 )
 
-        # Handle content update for encrypted notes
-        if 'content' in update_data and db_note.is_encrypted:
-            update_data['content'] = encrypt_note_content(update_data['content'], master_key)
-        
-        # Handle encryption status change
-        if 'is_encrypted' in update_data and update_data['is_encrypted'] != db_note.is_encrypted:
-            if update_data['is_encrypted']:
-                # Encrypt the content
-                update_data['content'] = encrypt_note_content(db_note.content, master_key)
+        # Work out the plaintext after the update and whether it differs from the stored one
+        new_content = update_data.pop('content', None)
+        digest = db_note.content_digest
+        if new_content is None:
+            content = decrypt_note_content(db_note.ciphertext, master_key) if db_note.is_encrypted else db_note.content
+            content_changed = False
+        elif not db_note.is_encrypted:
+            content = new_content
+            content_changed = new_content != db_note.content
+        else:
+            content = new_content
+            new_digest = note_content_digest(new_content, master_key)
+            if digest is None:
+                # Notes written before digests were kept are compared by decrypting them
+                content_changed = decrypt_note_content(db_note.ciphertext, master_key) != new_content
             else:
-                # Decrypt the content
-                decrypted_content = decrypt_note_content(db_note.content, master_key)
-                update_data['content'] = decrypted_content
+                content_changed = not hmac.compare_digest(digest, new_digest)
+            digest = new_digest
 
-        for key, value in update_data.items():
-            setattr(db_note, key, value)
+        changes = {key: value for key, value in update_data.items() if getattr(db_note, key) != value}
+        if content_changed or 'is_encrypted' in changes:
+            if encrypted:
+                changes['content'] = None
+                changes['encrypted_content'] = encrypt_note_content(content, master_key)
+                changes['content_digest'] = digest or note_content_digest(content, master_key)
+            else:
+                changes['content'] = content
+                changes['encrypted_content'] = None
+                changes['content_digest'] = None
+        elif changes and encrypted and db_note.content_digest is None:
+            changes['content_digest'] = note_content_digest(content, master_key)
 
-        db.commit()
-        db.refresh(db_note)
-        
-        # Decrypt for response if needed
-        if db_note.is_encrypted:
-            db_note.content = decrypt_note_content(db_note.content, master_key)
-            
-        return db_note
+        if changes:
+            # Taken before any row is written, see next_change_version
+            version = await next_change_version(db, current_user.id)
+            if if_match:
+                # Writers of the user's data now wait for this transaction, so the check holds until commit
+                current = await db.scalar(select(Note.version).where(Note.id == note_id))
+                if if_match_failed(if_match, make_etag("note", note_id, current)):
+                    await db.rollback()
+                    raise _precondition_failed(note_id, current)
+
+            for key, value in changes.items():
+                setattr(db_note, key, value)
+            db_note.version = version
+            db_note.updated_at = datetime.now(timezone.utc)
+
+            # Keep the blind index in sync with the title and content
+            if changes.keys() & {'title', 'content', 'is_encrypted'}:
+                await _write_search_index(db, db_note, content, master_key)
+            await db.commit()
+
+        # Built from the values in memory, the committed row holds nothing else
+        note_response = NoteResponse.model_validate(db_note)
+        note_response.content = content
+        set_etag(response, make_etag("note", note_id, db_note.version))
+        return note_response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating note: {str(e)}")
 
+def _precondition_failed(note_id: int, version: Optional[int]) -> HTTPException:
+    if version is None:
+        return HTTPException(status_code=404, detail="Note not found")
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Note was changed since it was loaded",
+        headers={"ETag": make_etag("note", note_id, version)}
+    )
+
 @router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_note(
+async def delete_note(
     note_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """Delete a note if the user owns it."""
-    db_note = db.query(Note).filter(Note.id == note_id, Note.user_id == current_user.id).first()
+    db_note = await db.scalar(select(Note).where(Note.id == note_id, Note.user_id == current_user.id))
     if not db_note:
         raise HTTPException(status_code=404, detail="Note not found")
 
-    db.delete(db_note)
-    db.commit()
+    version = await next_change_version(db, current_user.id)
+    await db.execute(delete(NoteSearchToken).where(NoteSearchToken.note_id == note_id))
+    await db.delete(db_note)
+    await record_tombstones(db, current_user.id, "note", [note_id], version)
+    await db.commit()
     return
\ No newline at end of file
@@ -0,0 +1,97 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...models.note import Note
+from ...models.folder import Folder
+from ...models.file import File
+from ...models.tombstone import Tombstone
+from ...schemas.note import NoteResponse
+from ...schemas.sync import SyncResponse
+from ...database import get_db
+from ..dependencies import get_current_user
+from ..change_tracking import current_change_version
+from ...core.principal_cache import Principal
+from ...core.encryption import decrypt_many
+from ...core.session_manager import session_manager
+
+router = APIRouter()
+
+# Rows (of all kinds) per sync page
+DEFAULT_SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 2000
+
+@router.get("/", response_model=SyncResponse)
+async def sync(
+    since: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_SYNC_PAGE_SIZE, ge=1, le=MAX_SYNC_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Get the notes, folders and files changed since version `since`, and the ones deleted.
+
+    `since=0` starts from the whole account. At most `limit` changed rows are
+    returned, oldest versions first; with `has_more`, pass the returned
+    `version` as `since` to get the next page. A page never splits one
+    version, so a single version with more rows than `limit` is returned
+    whole. Every query is a range scan of a (user_id, version) index, so the
+    cost follows the size of the page.
+    """
+    # Read the version first: anything committed after it is returned again next time, never missed
+    version = current = await current_change_version(db, current_user.id)
+
+    def changed(model, up_to=None):
+        query = select(model).where(model.user_id == current_user.id)
+        if since:
+            query = query.where(model.version > since)
+        if up_to is not None:
+            query = query.where(model.version <= up_to)
+        return query.order_by(model.version, model.id)
+
+    # Tombstones only matter to a client that already has data
+    models = [Note, Folder, File] + ([Tombstone] if since else [])
+    # One row over the limit per kind tells whether anything is left
+    rows = {model: (await db.scalars(changed(model).limit(limit + 1))).all() for model in models}
+
+    fetched = sorted(row.version for model_rows in rows.values() for row in model_rows)
+    has_more = len(fetched) > limit
+    if has_more:
+        # Stop below the first version that doesn't fit, or after it if it is
+        # the oldest one. Every kind is complete up to there: a kind cut off
+        # at limit + 1 rows only has later versions left.
+        cut = fetched[limit]
+        version = cut - 1 if cut > fetched[0] else cut
+        if version == 0:
+            # Rows written before versions were tracked have version 0, which
+            # since=0 can't resume after: take the next version along
+            later = [
+                await db.scalar(select(func.min(model.version)).where(model.user_id == current_user.id, model.version > 0))
+                for model in models
+            ]
+            version = min((v for v in later if v is not None), default=current)
+            has_more = version != current
+        rows = {model: (await db.scalars(changed(model, up_to=version))).all() for model in models}
+
+    notes = rows[Note]
+    note_items = [NoteResponse.model_validate(note) for note in notes]
+    encrypted = [(item, note) for item, note in zip(note_items, notes) if note.is_encrypted]
+    if encrypted:
+        master_key = session_manager.get_master_key(current_user.id)
+        if not master_key:
+            raise HTTPException(
+                status_code=401,
+                detail="Session expired. Please login again."
+            )
+        contents = await run_in_threadpool(decrypt_many, [note.ciphertext for _, note in encrypted], master_key)
+        for (item, _), content in zip(encrypted, contents):
+            item.content = content
+
+    return SyncResponse(
+        version=version,
+        has_more=has_more,
+        notes=note_items,
+        folders=rows[Folder],
+        files=rows[File],
+        deleted=rows.get(Tombstone, [])
+    )
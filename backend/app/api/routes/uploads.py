@@ -0,0 +1,282 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import BinaryIO
+import os
+import shutil
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...models.file import File
+from ...models.folder import Folder
+from ...models.upload_session import UploadSession, UploadSessionChunk
+from ...schemas.file import FileResponse, UploadSessionCreate, UploadSessionResponse
+from ...database import get_db
+from ..dependencies import get_current_user
+from ..change_tracking import next_change_version
+from ...core.principal_cache import Principal
+from ...core.blob_store import blob_store, new_blob_key
+from ...core.storage_tiers import TIER_DATABASE, store_in_database, storage_tier_for
+from ...core.upload_scratch import delete_sessions, discard_sessions, remove_session_dirs, session_dir
+from ...core.encryption import FILE_SEGMENT_SIZE, FileEncryptor, new_file_header
+from ...core.session_manager import session_manager
+from ...config import settings
+
+router = APIRouter()
+
+# A whole number of encryption segments, so every chunk can be encrypted on its own
+CHUNK_SIZE = 4 * 1024 * 1024
+SEGMENTS_PER_CHUNK = CHUNK_SIZE // FILE_SEGMENT_SIZE
+COPY_BUFFER_SIZE = 1024 * 1024
+
+def _chunk_count(session: UploadSession) -> int:
+    """Number of chunks of a session; an empty file is sent as one empty chunk."""
+    return max(1, -(-session.size // session.chunk_size))
+
+def _chunk_length(session: UploadSession, index: int) -> int:
+    if index < _chunk_count(session) - 1:
+        return session.chunk_size
+    return session.size - index * session.chunk_size
+
+def _require_master_key(user_id: int) -> bytes:
+    master_key = session_manager.get_master_key(user_id)
+    if not master_key:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session expired. Please login again."
+        )
+    return master_key
+
+async def _get_session(db: AsyncSession, session_id: str, user_id: int, for_update: bool = False) -> UploadSession:
+    query = select(UploadSession).where(
+        UploadSession.id == session_id,
+        UploadSession.user_id == user_id,
+        UploadSession.expires_at > datetime.now(timezone.utc)
+    )
+    if for_update:
+        query = query.with_for_update()
+    session = await db.scalar(query)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    return session
+
+async def _session_response(db: AsyncSession, session: UploadSession) -> UploadSessionResponse:
+    chunks = (await db.execute(
+        select(UploadSessionChunk.chunk_index, UploadSessionChunk.size)
+        .where(UploadSessionChunk.session_id == session.id)
+        .order_by(UploadSessionChunk.chunk_index)
+    )).all()
+    return UploadSessionResponse(
+        id=session.id,
+        filename=session.filename,
+        size=session.size,
+        chunk_size=session.chunk_size,
+        chunk_count=_chunk_count(session),
+        received=[chunk.chunk_index for chunk in chunks],
+        received_bytes=sum(chunk.size for chunk in chunks),
+        expires_at=session.expires_at
+    )
+
+def _assemble(chunk_dir: Path, chunk_count: int, header: bytes, out: BinaryIO):
+    """Concatenate the stored chunks into one file, streaming through a small buffer."""
+    if header:
+        out.write(header)
+    for index in range(chunk_count):
+        with open(chunk_dir / str(index), "rb") as chunk:
+            shutil.copyfileobj(chunk, out, COPY_BUFFER_SIZE)
+
+@router.post("/", response_model=UploadSessionResponse)
+async def create_upload_session(
+    upload: UploadSessionCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Start a chunked upload. Send the chunks with PUT, in any order, then complete it."""
+    if upload.size > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File size exceeds the {settings.MAX_FILE_SIZE_MB}MB limit"
+        )
+    if upload.folder_id:
+        folder = await db.scalar(select(Folder.id).where(
+            Folder.id == upload.folder_id,
+            Folder.user_id == current_user.id
+        ))
+        if not folder:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Folder not found or doesn't belong to you"
+            )
+    if upload.is_encrypted:
+        _require_master_key(current_user.id)
+
+    # Clear out the user's abandoned sessions while we're at it
+    expired = (await db.scalars(select(UploadSession).where(
+        UploadSession.user_id == current_user.id,
+        UploadSession.expires_at <= datetime.now(timezone.utc)
+    ))).all()
+    await discard_sessions(db, expired)
+
+    session = UploadSession(
+        id=str(uuid.uuid4()),
+        user_id=current_user.id,
+        folder_id=upload.folder_id,
+        filename=upload.filename,
+        content_type=upload.content_type,
+        size=upload.size,
+        chunk_size=CHUNK_SIZE,
+        is_encrypted=upload.is_encrypted,
+        file_header=new_file_header() if upload.is_encrypted else None,
+        expires_at=datetime.now(timezone.utc) + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    )
+    db.add(session)
+    await db.commit()
+    return await _session_response(db, session)
+
+@router.get("/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Progress of an upload session, to resume it after an interruption."""
+    session = await _get_session(db, session_id, current_user.id)
+    return await _session_response(db, session)
+
+@router.put("/{session_id}/chunks/{index}", response_model=UploadSessionResponse)
+async def upload_chunk(
+    session_id: str,
+    index: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Store one chunk, sent as the raw request body.
+
+    The chunk is encrypted as it streams in and written to disk under a
+    temporary name, so only complete chunks count as received. Sending a
+    chunk again replaces it.
+    """
+    session = await _get_session(db, session_id, current_user.id)
+    chunk_count = _chunk_count(session)
+    if not 0 <= index < chunk_count:
+        raise HTTPException(status_code=400, detail=f"Chunk index must be between 0 and {chunk_count - 1}")
+    expected = _chunk_length(session, index)
+
+    encryptor = None
+    if session.is_encrypted:
+        encryptor = FileEncryptor(
+            _require_master_key(current_user.id),
+            header=session.file_header,
+            first_segment=index * SEGMENTS_PER_CHUNK
+        )
+
+    chunk_dir = session_dir(session)
+    await run_in_threadpool(chunk_dir.mkdir, parents=True, exist_ok=True)
+    temp_path = chunk_dir / f"{index}.{uuid.uuid4().hex}.part"
+    out = await run_in_threadpool(open, temp_path, "wb")
+    try:
+        received = 0
+        async for data in request.stream():
+            received += len(data)
+            if received > expected:
+                break
+            if encryptor:
+                data = await run_in_threadpool(encryptor.update, data)
+            await run_in_threadpool(out.write, data)
+        if received != expected:
+            raise HTTPException(status_code=400, detail=f"Chunk {index} must be exactly {expected} bytes")
+        if encryptor:
+            await run_in_threadpool(out.write, encryptor.finalize(final=index == chunk_count - 1))
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(os.replace, temp_path, chunk_dir / str(index))
+    except BaseException:
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(temp_path.unlink, missing_ok=True)
+        raise
+
+    db.add(UploadSessionChunk(session_id=session.id, chunk_index=index, size=expected))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Already recorded by an earlier copy of this chunk, or the session is gone
+        await db.rollback()
+        session = await _get_session(db, session_id, current_user.id)
+    return await _session_response(db, session)
+
+@router.post("/{session_id}/complete", response_model=FileResponse)
+async def complete_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Assemble the received chunks into a file once all of them are there."""
+    session = await _get_session(db, session_id, current_user.id, for_update=True)
+    chunk_count = _chunk_count(session)
+    received = set((await db.scalars(
+        select(UploadSessionChunk.chunk_index).where(UploadSessionChunk.session_id == session.id)
+    )).all())
+    missing = [index for index in range(chunk_count) if index not in received]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"{len(missing)} chunks are missing, starting with chunk {missing[0]}"
+        )
+
+    writer = await run_in_threadpool(blob_store.create_writer)
+    blob_key = None
+    try:
+        await run_in_threadpool(_assemble, session_dir(session), chunk_count, session.file_header, writer)
+        tier = storage_tier_for(session.size)
+        if tier != TIER_DATABASE:
+            blob_key = new_blob_key(current_user.id, session.filename)
+            await run_in_threadpool(writer.commit, blob_key)
+
+        # The version locks the user row until commit, so it is only taken
+        # once the upload is assembled, right before the rows are written
+        db_file = File(
+            filename=session.filename,
+            content_type=session.content_type,
+            size=session.size,
+            is_encrypted=session.is_encrypted,
+            user_id=current_user.id,
+            folder_id=session.folder_id,
+            storage_tier=tier,
+            file_path=blob_key,
+            version=await next_change_version(db, current_user.id)
+        )
+        db.add(db_file)
+        if tier == TIER_DATABASE:
+            await db.flush()
+            await run_in_threadpool(writer.seek, 0)
+            await store_in_database(db, db_file.id, writer)
+
+        directories = await delete_sessions(db, [session])
+        await db.commit()
+        await remove_session_dirs(directories)
+        await db.refresh(db_file)
+        return FileResponse.from_orm(db_file)
+    except Exception as e:
+        await db.rollback()
+        if blob_key:
+            await run_in_threadpool(blob_store.delete, blob_key)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await run_in_threadpool(writer.discard)
+
+@router.delete("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Abandon an upload session and drop the chunks received so far."""
+    session = await _get_session(db, session_id, current_user.id)
+    await discard_sessions(db, [session])
+    return None
@@ -0,0 +1,106 @@
+from typing import Optional
+from urllib.parse import parse_qs
+import json
+import math
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..core.rate_limit import AuthRateLimiter
+
+# Login and register bodies are tiny; larger ones are rejected without being buffered
+MAX_INSPECTED_BODY = 64 * 1024
+
+
+def _username_from_body(content_type: str, body: bytes) -> Optional[str]:
+    try:
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            values = parse_qs(body.decode(), max_num_fields=20).get("username")
+            return values[0] if values else None
+        if content_type.startswith("application/json"):
+            username = json.loads(body).get("username")
+            return username if isinstance(username, str) else None
+    except (ValueError, AttributeError):
+        pass
+    return None
+
+
+class AuthThrottleMiddleware:
+    """Rejects login/register attempts over the per-IP or per-username budget with 429.
+
+    Runs before routing, so throttled requests never reach the password KDFs.
+    The client IP is charged before the body is read; the body is then
+    buffered (up to MAX_INSPECTED_BODY, larger ones get 413) to read the
+    username and replayed to the app.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: AuthRateLimiter, paths=("/auth/login", "/auth/register")):
+        self.app = app
+        self.limiter = limiter
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"].rstrip("/") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        client_ip = scope["client"][0] if scope.get("client") else "unknown"
+        wait = self.limiter.check_ip(client_ip)
+        if wait:
+            await self._too_many_attempts(wait, scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        try:
+            declared_size = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared_size = 0
+        if declared_size > MAX_INSPECTED_BODY:
+            await self._too_large(scope, receive, send)
+            return
+
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > MAX_INSPECTED_BODY:
+                await self._too_large(scope, receive, send)
+                return
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        wait = self.limiter.check_user(_username_from_body(content_type, body))
+        if wait:
+            await self._too_many_attempts(wait, scope, receive, send)
+            return
+
+        replayed = False
+
+        async def replay() -> Message:
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, replay, send)
+
+    @staticmethod
+    async def _too_many_attempts(wait: float, scope: Scope, receive: Receive, send: Send):
+        response = JSONResponse(
+            {"detail": "Too many attempts, try again later"},
+            status_code=429,
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+        await response(scope, receive, send)
+
+    @staticmethod
+    async def _too_large(scope: Scope, receive: Receive, send: Send):
+        response = JSONResponse({"detail": "Request body too large"}, status_code=413, headers={"Connection": "close"})
+        await response(scope, receive, send)
@@ -1,16 +1,54 @@
 from pydantic_settings import BaseSettings
 import os
 from pathlib import Path
+from typing import Optional
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    ASYNC_DATABASE_URL: Optional[str] = None  # Defaults to DATABASE_URL with its async driver
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
     STORE_FILES_IN_DB: bool = False  # If False, store in filesystem
+    FILE_DB_TIER_MAX_KB: int = 0  # Files up to this size are stored in the database, larger ones on disk (0: none)
+    FILE_TIER_MIGRATION: bool = False  # Move files to their tier in the background after startup; enable on one worker
     FILE_STORAGE_PATH: str = os.path.join(os.getcwd(), "file_storage")
+    FILE_STORAGE_BACKEND: str = "local"  # "local" (sharded under FILE_STORAGE_PATH) or "s3"
+    FILE_STORAGE_FSYNC: bool = True  # Flush local blobs to disk before an upload succeeds
+    FILE_STORAGE_S3_BUCKET: Optional[str] = None
+    FILE_STORAGE_S3_PREFIX: str = ""  # Prepended to every object key
+    FILE_STORAGE_S3_ENDPOINT_URL: Optional[str] = None  # For S3-compatible services such as MinIO
+    FILE_STORAGE_S3_REGION: Optional[str] = None
     MAX_FILE_SIZE_MB: int = 50 
+    FILE_DEDUPLICATION: bool = False  # Share one blob between a user's identical uploads
+    UPLOAD_SESSION_TTL_HOURS: int = 24  # Chunked uploads not completed by then are discarded
+
+    FILE_SWEEP_INTERVAL_HOURS: float = 0  # Background reconciliation of blobs and file rows (0: off, the default)
+    FILE_SWEEP_REPAIR: bool = False  # Background sweeps fix what they find instead of only reporting it
+    FILE_SWEEP_OPS_PER_SECOND: float = 200  # Storage operations per second a sweep may use (0: unlimited)
+    FILE_SWEEP_GRACE_MINUTES: float = 60  # Blobs and scratch files younger than this are never orphans
+    FILE_SWEEP_STATE_PATH: Optional[str] = None  # Progress of the current sweep, defaults to FILE_STORAGE_PATH
+
+    SESSION_BACKEND: str = "memory"  # "memory" (single process) or "sqlite" (shared by all workers on a host)
+    SESSION_DB_PATH: Optional[str] = None  # SQLite session file, defaults to a private 0700 directory in the temp dir
+
+    PRINCIPAL_CACHE_SIZE: int = 10000  # Verified access tokens kept in memory per worker
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60  # Also how long a user deactivated in the database stays signed in
+
+    METRICS_TOKEN: Optional[str] = None  # Bearer token for /metrics/, which is only mounted when set
+
+    KDF_WORKERS: Optional[int] = None  # Threads for password hashing, defaults to min(4, CPUs)
+    KDF_MAX_QUEUE: int = 32  # Logins/registrations allowed to wait for a KDF thread before 503s
+    KDF_RETRY_AFTER_SECONDS: int = 1
+
+    AUTH_RATE_LIMIT_ENABLED: bool = True  # Token buckets in front of /auth/login and /auth/register
+    AUTH_RATE_LIMIT_BACKEND: str = "memory"  # "memory" (per worker) or "sqlite" (shared by all workers on a host)
+    AUTH_RATE_LIMIT_DB_PATH: Optional[str] = None  # Defaults to the same private directory as SESSION_DB_PATH
+    AUTH_RATE_LIMIT_IP_PER_MINUTE: float = 30
+    AUTH_RATE_LIMIT_IP_BURST: int = 10
+    AUTH_RATE_LIMIT_USER_PER_MINUTE: float = 5
+    AUTH_RATE_LIMIT_USER_BURST: int = 5
     
     class Config:
         env_file = ".env"
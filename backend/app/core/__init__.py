@@ -4,7 +4,9 @@ from .encryption import (
     encrypt_master_key,
     decrypt_master_key,
     encrypt_note_content,
-    decrypt_note_content
+    decrypt_note_content,
+    encrypt_many,
+    decrypt_many
 )
 
 __all__ = [
@@ -13,5 +15,7 @@ __all__ = [
     'encrypt_master_key',
     'decrypt_master_key',
     'encrypt_note_content',
-    'decrypt_note_content'
+    'decrypt_note_content',
+    'encrypt_many',
+    'decrypt_many'
 ]
\ No newline at end of file
@@ -0,0 +1,330 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+from urllib.parse import quote, unquote
+import hashlib
+import io
+import os
+import re
+import tempfile
+import uuid
+
+from ..config import settings
+
+
+class StoredBlob(NamedTuple):
+    key: str
+    marker: str  # Position in the listing, to resume it after this blob
+    modified: float  # Unix time
+
+
+class BlobWriter(ABC):
+    """A blob being written. It becomes visible under a key only when committed.
+
+    Behaves as a seekable binary file, so a spooled upload can be read back
+    before deciding where it goes.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+
+    def write(self, data: bytes) -> int:
+        return self.file.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    @abstractmethod
+    def commit(self, key: str):
+        """Store the written bytes under `key`, replacing any blob there, and close the writer."""
+
+    @abstractmethod
+    def discard(self):
+        """Drop the written bytes. Safe to call after commit."""
+
+
+class BlobStore(ABC):
+    """Immutable blobs under string keys such as "<user_id>/<uuid>.pdf"."""
+
+    @abstractmethod
+    def create_writer(self) -> BlobWriter:
+        """Start a new blob. Commit it under a key, or discard it."""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Seekable reader of a blob. Raises FileNotFoundError if there is none."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether a blob is stored under `key`."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove a blob, ignoring one already gone."""
+
+    @abstractmethod
+    def iter_blobs(self, after: Optional[str] = None) -> Iterator[StoredBlob]:
+        """Every stored blob in a stable order, starting after the blob with marker `after`."""
+
+    def remove_stale_writers(self, older_than: float, dry_run: bool = False) -> int:
+        """Remove spool files of writers abandoned before `older_than` (Unix time). Returns how many."""
+        return 0
+
+
+def new_blob_key(user_id: int, filename: str) -> str:
+    """A fresh key for a user's file, keeping its extension."""
+    return f"{user_id}/{uuid.uuid4()}{os.path.splitext(filename)[1]}"
+
+
+class _LocalBlobWriter(BlobWriter):
+    def __init__(self, store: "LocalBlobStore", file: BinaryIO, temp_path: Path):
+        super().__init__(file)
+        self.store = store
+        self.temp_path = temp_path
+
+    def commit(self, key: str):
+        path = self.store.path_for(key)
+        self.file.flush()
+        if self.store.fsync:
+            os.fsync(self.file.fileno())
+        self.file.close()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.temp_path, path)
+        if self.store.fsync:
+            self.store.fsync_directory(path.parent)
+
+    def discard(self):
+        self.file.close()
+        self.temp_path.unlink(missing_ok=True)
+
+
+_SHARD = re.compile(r"[0-9a-f]{2}")
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs as files under `root`, spread over 256 * 256 directories by a hash of the key.
+
+    Blobs are written to `root/.tmp` and renamed into place, so readers never
+    see a partial blob. With `fsync`, the data and the rename are flushed to
+    disk before a commit returns. Blobs written before sharding, at
+    `root/<key>`, are still found.
+    """
+
+    def __init__(self, root: str, fsync: bool = True):
+        self.root = Path(root)
+        self.fsync = fsync
+        self.temp_dir = self.root / ".tmp"
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: str) -> Path:
+        shard = hashlib.sha256(key.encode()).hexdigest()
+        # Quoting keeps the key a single, reversible file name
+        return self.root / shard[:2] / shard[2:4] / quote(key, safe="")
+
+    def _existing_path(self, key: str) -> Optional[Path]:
+        for path in (self.path_for(key), self.root / key):
+            if path.is_file():
+                return path
+        return None
+
+    def fsync_directory(self, directory: Path):
+        if os.name != "posix":
+            return
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def create_writer(self) -> BlobWriter:
+        temp_path = self.temp_dir / f"{uuid.uuid4()}.part"
+        return _LocalBlobWriter(self, open(temp_path, "w+b"), temp_path)
+
+    def open(self, key: str) -> BinaryIO:
+        path = self._existing_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        return open(path, "rb")
+
+    def exists(self, key: str) -> bool:
+        return self._existing_path(key) is not None
+
+    def delete(self, key: str):
+        for path in (self.path_for(key), self.root / key):
+            path.unlink(missing_ok=True)
+
+    def _key_for(self, parts: Tuple[str, ...]) -> str:
+        if len(parts) == 3 and _SHARD.fullmatch(parts[1]):
+            key = unquote(parts[2])
+            if self.path_for(key) == self.root.joinpath(*parts):
+                return key
+        # The flat per-user layout, or a stray file that no key maps to
+        return "/".join(parts)
+
+    def _walk(self, directory: Path, parts: Tuple[str, ...], after: Tuple[str, ...]) -> Iterator[StoredBlob]:
+        # Entries are visited in name order, skipping whole directories that sort before `after`
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue  # Spool files and upload scratch space
+            entry_parts = parts + (entry.name,)
+            if entry_parts < after[:len(entry_parts)]:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from self._walk(Path(entry.path), entry_parts, after)
+            elif entry.is_file(follow_symlinks=False) and entry_parts > after:
+                yield StoredBlob(self._key_for(entry_parts), "/".join(entry_parts), entry.stat().st_mtime)
+
+    def iter_blobs(self, after: Optional[str] = None) -> Iterator[StoredBlob]:
+        return self._walk(self.root, (), tuple(after.split("/")) if after else ())
+
+    def remove_stale_writers(self, older_than: float, dry_run: bool = False) -> int:
+        removed = 0
+        for entry in os.scandir(self.temp_dir):
+            if entry.is_file() and entry.stat().st_mtime < older_than:
+                if not dry_run:
+                    Path(entry.path).unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+
+class _S3BlobWriter(BlobWriter):
+    def __init__(self, store: "S3BlobStore", file: BinaryIO):
+        super().__init__(file)
+        self.store = store
+
+    def commit(self, key: str):
+        # upload_fileobj switches to a multipart upload for large blobs
+        self.file.seek(0)
+        self.store.client.upload_fileobj(self.file, self.store.bucket, self.store.object_key(key))
+        self.file.close()
+
+    def discard(self):
+        # The spool is an anonymous temporary file, closing it drops it
+        self.file.close()
+
+
+class S3BlobReader(io.RawIOBase):
+    """Seekable read-only view of an object, fetched with ranged GETs.
+
+    Wrap it in a BufferedReader so small reads share one request.
+    """
+
+    def __init__(self, client, bucket: str, key: str, size: int):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        end = min(self._position + len(buffer), self.size)
+        if end <= self._position:
+            return 0
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={self._position}-{end - 1}"
+        )
+        data = response["Body"].read()
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class S3BlobStore(BlobStore):
+    """Blobs as objects in an S3-compatible bucket.
+
+    Objects are only created by a complete PUT (or multipart upload), so they
+    are never partially visible. Blobs are spooled to a local temporary file
+    until committed.
+    """
+
+    READ_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, bucket: str, prefix: str = "", client=None, endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None):
+        if client is None:
+            import boto3  # Only needed with this backend
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def object_key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _size(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return response["ContentLength"]
+
+    def create_writer(self) -> BlobWriter:
+        return _S3BlobWriter(self, tempfile.TemporaryFile())
+
+    def open(self, key: str) -> BinaryIO:
+        size = self._size(key)
+        if size is None:
+            raise FileNotFoundError(key)
+        reader = S3BlobReader(self.client, self.bucket, self.object_key(key), size)
+        return io.BufferedReader(reader, self.READ_BUFFER_SIZE)
+
+    def exists(self, key: str) -> bool:
+        return self._size(key) is not None
+
+    def delete(self, key: str):
+        # Deleting a missing object succeeds
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def iter_blobs(self, after: Optional[str] = None) -> Iterator[StoredBlob]:
+        # Listings come back in key order, a page at a time
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(Bucket=self.bucket, Prefix=self.prefix, StartAfter=after or self.prefix)
+        for page in pages:
+            for obj in page.get("Contents", []):
+                yield StoredBlob(obj["Key"][len(self.prefix):], obj["Key"], obj["LastModified"].timestamp())
+
+
+def create_blob_store() -> BlobStore:
+    """Build the blob store selected by FILE_STORAGE_BACKEND."""
+    if settings.FILE_STORAGE_BACKEND == "local":
+        return LocalBlobStore(settings.FILE_STORAGE_PATH, fsync=settings.FILE_STORAGE_FSYNC)
+    if settings.FILE_STORAGE_BACKEND == "s3":
+        if not settings.FILE_STORAGE_S3_BUCKET:
+            raise ValueError("FILE_STORAGE_S3_BUCKET is required with FILE_STORAGE_BACKEND=s3")
+        return S3BlobStore(
+            settings.FILE_STORAGE_S3_BUCKET,
+            prefix=settings.FILE_STORAGE_S3_PREFIX,
+            endpoint_url=settings.FILE_STORAGE_S3_ENDPOINT_URL,
+            region=settings.FILE_STORAGE_S3_REGION
+        )
+    raise ValueError(f"Unknown FILE_STORAGE_BACKEND: {settings.FILE_STORAGE_BACKEND}")
+
+
+blob_store = create_blob_store()
@@ -1,8 +1,19 @@
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, TypeVar, Union
 import base64
+import hashlib
+import hmac
+import io
 import os
+import struct
+import threading
 
 print("Loading encryption.py")
 
@@ -24,6 +35,16 @@ def derive_key_from_password(password: str, salt: str) -> bytes:
     )
     return base64.urlsafe_b64encode(kdf.derive(password.encode()))
 
+def derive_subkey(master_key: bytes, purpose: bytes, length: int = 32) -> bytes:
+    """Derive an independent key for one purpose (search index, files, ...) from the master key."""
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=length,
+        salt=None,
+        info=b"semper-tutus/" + purpose,
+    )
+    return hkdf.derive(master_key)
+
 def encrypt_master_key(master_key: bytes, password: str, salt: str) -> str:
     """Encrypt master key with password-derived key."""
     password_key = derive_key_from_password(password, salt)
@@ -37,48 +58,289 @@ def decrypt_master_key(encrypted_master_key: str, password: str, salt: str) -> b
     f = Fernet(password_key)
     return f.decrypt(encrypted_master_key.encode())
 
-def encrypt_note_content(content: str, master_key: bytes) -> str:
+# Batches smaller than this are not worth handing to the worker pool
+PARALLEL_BATCH_THRESHOLD = 256
+MAX_CRYPTO_WORKERS = min(4, os.cpu_count() or 1)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# Ciphers and subkeys derived from a master key, grouped by that key so a
+# session's entries can be dropped together by `forget_master_key`.
+MAX_CACHED_MASTER_KEYS = 1024
+_key_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+_key_cache_lock = threading.Lock()
+
+T = TypeVar("T")
+
+def key_scoped_cache(factory: Callable[[bytes], T]) -> Callable[[bytes], T]:
+    """Cache `factory(master_key)` until the key is forgotten or pushed out by newer keys."""
+    name = f"{factory.__module__}.{factory.__qualname__}"
+
+    @wraps(factory)
+    def cached(master_key: bytes) -> T:
+        with _key_cache_lock:
+            entries = _key_cache.get(master_key)
+            if entries is not None and name in entries:
+                _key_cache.move_to_end(master_key)
+                return entries[name]
+        value = factory(master_key)
+        with _key_cache_lock:
+            entries = _key_cache.setdefault(master_key, {})
+            _key_cache.move_to_end(master_key)
+            value = entries.setdefault(name, value)
+            while len(_key_cache) > MAX_CACHED_MASTER_KEYS:
+                _key_cache.popitem(last=False)
+        return value
+
+    return cached
+
+def forget_master_key(master_key: bytes):
+    """Drop everything cached for a master key, once its session ends."""
+    with _key_cache_lock:
+        _key_cache.pop(master_key, None)
+
+@key_scoped_cache
+def _get_fernet(master_key: bytes) -> Fernet:
+    """Return a cached Fernet cipher for the key. Fernet objects are thread-safe."""
+    return Fernet(master_key)
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=MAX_CRYPTO_WORKERS,
+                    thread_name_prefix="note-crypto",
+                )
+    return _executor
+
+def _as_bytes(value: Union[str, bytes]) -> bytes:
+    return value.encode() if isinstance(value, str) else value
+
+def _run_batch(func: Callable[[Any], Any], items: Sequence[Any], parallel: Optional[bool]) -> List[Any]:
+    """Apply func to every item, spreading large batches over the worker pool in slices."""
+    if parallel is None:
+        parallel = len(items) >= PARALLEL_BATCH_THRESHOLD and MAX_CRYPTO_WORKERS > 1
+    if not parallel:
+        return [func(item) for item in items]
+
+    slice_size = -(-len(items) // MAX_CRYPTO_WORKERS)
+    slices = [items[i:i + slice_size] for i in range(0, len(items), slice_size)]
+    results: List[Any] = []
+    for chunk in _get_executor().map(lambda part: [func(item) for item in part], slices):
+        results.extend(chunk)
+    return results
+
+# Note ciphertext envelope:
+#   version (1) | nonce (12) | AES-GCM ciphertext | tag (16)
+# The version byte is authenticated as associated data. Notes written
+# before the envelope existed hold Fernet tokens (text); they are still
+# read, and rewritten in the envelope format by `upgrade_note_ciphertexts`.
+NOTE_ENVELOPE_V1 = b"\x01"
+NOTE_NONCE_SIZE = 12
+
+@key_scoped_cache
+def _note_cipher(master_key: bytes) -> AESGCM:
+    return AESGCM(derive_subkey(master_key, b"note-encryption"))
+
+def _encrypt_note(cipher: AESGCM, content: Union[str, bytes]) -> bytes:
+    nonce = os.urandom(NOTE_NONCE_SIZE)
+    return NOTE_ENVELOPE_V1 + nonce + cipher.encrypt(nonce, _as_bytes(content), NOTE_ENVELOPE_V1)
+
+def _decrypt_note(cipher: AESGCM, fernet: Fernet, ciphertext: Union[str, bytes]) -> str:
+    if isinstance(ciphertext, str):
+        # Legacy Fernet token
+        return fernet.decrypt(ciphertext.encode()).decode()
+    ciphertext = bytes(ciphertext)
+    if ciphertext[:1] != NOTE_ENVELOPE_V1:
+        raise ValueError("Unknown note ciphertext version")
+    nonce = ciphertext[1:1 + NOTE_NONCE_SIZE]
+    return cipher.decrypt(nonce, ciphertext[1 + NOTE_NONCE_SIZE:], NOTE_ENVELOPE_V1).decode()
+
+def is_legacy_ciphertext(ciphertext: Union[str, bytes, None]) -> bool:
+    """Whether a stored note ciphertext is a Fernet token from before the binary envelope."""
+    return isinstance(ciphertext, str)
+
+def encrypt_note_content(content: str, master_key: bytes) -> bytes:
     """Encrypt note content using master key."""
-    f = Fernet(master_key)
-    return f.encrypt(content.encode()).decode()
-
-def decrypt_note_content(encrypted_content: str, master_key: bytes) -> str:
-    """Decrypt note content using master key."""
-    f = Fernet(master_key)
-    return f.decrypt(encrypted_content.encode()).decode()
-
-def encrypt_file(file_data: bytes, key: bytes) -> bytes:
-    """Encrypt file data using the provided key"""
-    # Use the same encryption algorithm you're using for notes
-    # This is a simplified example - adjust to match your actual encryption implementation
-    iv = os.urandom(16)  # Generate initialization vector
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
-    
-    # Pad data to match block size
-    padder = padding.PKCS7(algorithms.AES.block_size).padder()
-    padded_data = padder.update(file_data) + padder.finalize()
-    
-    # Encrypt the data
-    encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
-    
-    # Return IV + encrypted data
-    return iv + encrypted_data
-
-def decrypt_file(encrypted_data: bytes, key: bytes) -> bytes:
-    """Decrypt file data using the provided key"""
-    # This is a simplified example - adjust to match your actual encryption implementation
-    iv = encrypted_data[:16]  # Extract initialization vector (first 16 bytes)
-    data = encrypted_data[16:]  # Extract encrypted data (rest of the bytes)
-    
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
-    
-    # Decrypt the data
-    decrypted_padded_data = decryptor.update(data) + decryptor.finalize()
-    
-    # Unpad the data
-    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
-    decrypted_data = unpadder.update(decrypted_padded_data) + unpadder.finalize()
-    
-    return decrypted_data
\ No newline at end of file
+    return _encrypt_note(_note_cipher(master_key), content)
+
+def decrypt_note_content(encrypted_content: Union[str, bytes], master_key: bytes) -> str:
+    """Decrypt note content using master key. Accepts envelopes and legacy Fernet tokens."""
+    return _decrypt_note(_note_cipher(master_key), _get_fernet(master_key), encrypted_content)
+
+def encrypt_many(contents: Sequence[Union[str, bytes]], master_key: bytes, parallel: Optional[bool] = None) -> List[bytes]:
+    """Encrypt a batch of note contents with one cipher, preserving order."""
+    cipher = _note_cipher(master_key)
+    return _run_batch(lambda content: _encrypt_note(cipher, content), contents, parallel)
+
+def decrypt_many(tokens: Sequence[Union[str, bytes]], master_key: bytes, parallel: Optional[bool] = None) -> List[str]:
+    """Decrypt a batch of note contents with one cipher, preserving order."""
+    cipher = _note_cipher(master_key)
+    fernet = _get_fernet(master_key)
+    return _run_batch(lambda token: _decrypt_note(cipher, fernet, token), tokens, parallel)
+
+# Segmented file encryption format:
+#   header:  magic (4) | segment size (4, big endian) | random file id (16)
+#   segment: nonce (12) | AES-GCM ciphertext (<= segment size) | tag (16)
+# Every segment is authenticated together with the header, its index and
+# whether it is the last one, so segments can't be reordered, dropped,
+# truncated or moved to another file.
+FILE_FORMAT_MAGIC = b"STF1"
+FILE_SEGMENT_SIZE = 64 * 1024
+FILE_HEADER_SIZE = 24
+SEGMENT_NONCE_SIZE = 12
+SEGMENT_TAG_SIZE = 16
+SEGMENT_OVERHEAD = SEGMENT_NONCE_SIZE + SEGMENT_TAG_SIZE
+
+@key_scoped_cache
+def _file_cipher(master_key: bytes) -> AESGCM:
+    return AESGCM(derive_subkey(master_key, b"file-encryption"))
+
+def _segment_aad(header: bytes, index: int, final: bool) -> bytes:
+    return header + struct.pack(">Q?", index, final)
+
+def file_segment_count(plain_size: int, segment_size: int = FILE_SEGMENT_SIZE) -> int:
+    """Number of segments for a plaintext of the given size (an empty file has one)."""
+    return max(1, -(-plain_size // segment_size))
+
+def encrypted_file_size(plain_size: int, segment_size: int = FILE_SEGMENT_SIZE) -> int:
+    """Size of the encrypted form of a plaintext of the given size."""
+    return FILE_HEADER_SIZE + plain_size + file_segment_count(plain_size, segment_size) * SEGMENT_OVERHEAD
+
+def new_file_header(segment_size: int = FILE_SEGMENT_SIZE) -> bytes:
+    """Header of a new encrypted file, with a fresh random file id."""
+    return FILE_FORMAT_MAGIC + struct.pack(">I", segment_size) + os.urandom(16)
+
+class FileEncryptor:
+    """Incrementally encrypts a file into the segmented format.
+
+    Feed plaintext with `update()` and write out whatever it returns, then write
+    the result of `finalize()`. Memory use is bounded by one segment.
+
+    To encrypt one part of a file on its own (uploads sent in parts), pass the
+    file's `header` and the index of the part's first segment; the header is
+    then not part of the output, and `finalize(final=False)` ends a part that
+    is not the last one.
+    """
+
+    def __init__(self, master_key: bytes, segment_size: int = FILE_SEGMENT_SIZE,
+                 header: Optional[bytes] = None, first_segment: int = 0):
+        self._cipher = _file_cipher(master_key)
+        self.segment_size = segment_size
+        self.header = header or new_file_header(segment_size)
+        self._buffer = bytearray()
+        self._index = first_segment
+        self._header_written = header is not None
+
+    def _seal(self, plaintext: bytes, final: bool) -> bytes:
+        nonce = os.urandom(SEGMENT_NONCE_SIZE)
+        ciphertext = self._cipher.encrypt(nonce, plaintext, _segment_aad(self.header, self._index, final))
+        self._index += 1
+        return nonce + ciphertext
+
+    def _take_header(self) -> bytes:
+        if self._header_written:
+            return b""
+        self._header_written = True
+        return self.header
+
+    def update(self, data: bytes) -> bytes:
+        self._buffer += data
+        out = [self._take_header()]
+        # Always hold back the last full segment, it may turn out to be the final one
+        while len(self._buffer) > self.segment_size:
+            out.append(self._seal(bytes(self._buffer[:self.segment_size]), final=False))
+            del self._buffer[:self.segment_size]
+        return b"".join(out)
+
+    def finalize(self, final: bool = True) -> bytes:
+        out = self._take_header()
+        if final or self._buffer:
+            out += self._seal(bytes(self._buffer), final=final)
+        self._buffer.clear()
+        return out
+
+class FileDecryptor:
+    """Decrypts individual segments of a file in the segmented format."""
+
+    def __init__(self, master_key: bytes, header: bytes):
+        if len(header) != FILE_HEADER_SIZE or header[:4] != FILE_FORMAT_MAGIC:
+            raise ValueError("Not an encrypted file or unsupported format")
+        self._cipher = _file_cipher(master_key)
+        self.header = header
+        self.segment_size = struct.unpack(">I", header[4:8])[0]
+
+    @property
+    def encrypted_segment_size(self) -> int:
+        return self.segment_size + SEGMENT_OVERHEAD
+
+    def segment_offset(self, index: int) -> int:
+        """Byte offset of a segment within the encrypted file."""
+        return FILE_HEADER_SIZE + index * self.encrypted_segment_size
+
+    def decrypt_segment(self, index: int, segment: bytes, final: bool) -> bytes:
+        nonce = segment[:SEGMENT_NONCE_SIZE]
+        return self._cipher.decrypt(
+            nonce, segment[SEGMENT_NONCE_SIZE:], _segment_aad(self.header, index, final)
+        )
+
+@key_scoped_cache
+def _note_digest_key(master_key: bytes) -> bytes:
+    return derive_subkey(master_key, b"note-content-digest")
+
+def note_content_digest(content: str, master_key: bytes) -> str:
+    """Keyed hash of a note's plaintext, to tell unchanged content apart without decrypting it."""
+    return hmac.new(_note_digest_key(master_key), content.encode(), hashlib.sha256).hexdigest()
+
+def new_file_hasher(master_key: bytes) -> "hmac.HMAC":
+    """Keyed hash of a file's plaintext, used to deduplicate a user's identical files."""
+    return hmac.new(derive_subkey(master_key, b"file-dedup"), digestmod=hashlib.sha256)
+
+def encrypt_file(file_data: bytes, master_key: bytes) -> bytes:
+    """Encrypt a whole file held in memory into the segmented format."""
+    encryptor = FileEncryptor(master_key)
+    return encryptor.update(file_data) + encryptor.finalize()
+
+def iter_decrypt_file(read: Callable[[int], bytes], master_key: bytes) -> Iterator[bytes]:
+    """Decrypt a segmented file segment by segment, reading from `read(n)`.
+
+    Yields plaintext segments. Raises InvalidTag if the file was tampered with or
+    truncated.
+    """
+    decryptor = FileDecryptor(master_key, read(FILE_HEADER_SIZE))
+    index = 0
+    segment = read(decryptor.encrypted_segment_size)
+    while True:
+        # Look one segment ahead to know whether the current one is the last
+        next_segment = read(decryptor.encrypted_segment_size)
+        final = not next_segment
+        yield decryptor.decrypt_segment(index, segment, final)
+        if final:
+            return
+        segment = next_segment
+        index += 1
+
+def iter_decrypt_file_range(f: BinaryIO, master_key: bytes, plain_size: int, start: int, end: int) -> Iterator[bytes]:
+    """Decrypt bytes start..end (inclusive) of the plaintext from a seekable segmented file.
+
+    Only the segments covering the range are read and decrypted.
+    """
+    f.seek(0)
+    decryptor = FileDecryptor(master_key, f.read(FILE_HEADER_SIZE))
+    segment_size = decryptor.segment_size
+    last_index = file_segment_count(plain_size, segment_size) - 1
+
+    for index in range(start // segment_size, end // segment_size + 1):
+        f.seek(decryptor.segment_offset(index))
+        plaintext = decryptor.decrypt_segment(
+            index, f.read(decryptor.encrypted_segment_size), final=index == last_index
+        )
+        segment_start = index * segment_size
+        yield plaintext[max(start - segment_start, 0):end - segment_start + 1]
+
+def decrypt_file(encrypted_data: bytes, master_key: bytes) -> bytes:
+    """Decrypt a whole segmented file held in memory."""
+    return b"".join(iter_decrypt_file(io.BytesIO(encrypted_data).read, master_key))
@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+import asyncio
+import os
+import threading
+import time
+
+from ..config import settings
+
+
+class KDFPoolSaturated(Exception):
+    """Raised when the KDF queue is full and the job was not accepted."""
+
+
+class _Timing:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class KDFExecutor:
+    """Size-limited thread pool for password hashing and key derivation.
+
+    argon2 and PBKDF2 release the GIL, so `workers` threads use up to that many
+    cores without blocking the event loop. At most `max_queue` further jobs may
+    wait for a worker; beyond that `run` fails fast with KDFPoolSaturated
+    instead of letting latency grow without bound.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kdf")
+        self._lock = threading.Lock()
+        self._pending = 0  # accepted jobs, running or queued
+        self.rejected = 0
+        self._wait = _Timing()
+        self._timings: Dict[str, _Timing] = {}
+
+    async def run(self, name: str, func: Callable[..., Any], *args: Any) -> Any:
+        """Run func(*args) on the pool, timing it under `name`."""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise KDFPoolSaturated()
+            self._pending += 1
+
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._pending -= 1
+                    self._wait.record(started - submitted)
+                    self._timings.setdefault(name, _Timing()).record(finished - started)
+
+        # The slot is held until the job finishes, even if the request is cancelled
+        return await asyncio.wrap_future(self._pool.submit(job))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": min(self._pending, self.workers),
+                "queue_depth": max(self._pending - self.workers, 0),
+                "rejected": self.rejected,
+                "queue_wait": self._wait.as_dict(),
+                "jobs": {name: timing.as_dict() for name, timing in self._timings.items()},
+            }
+
+
+kdf_executor = KDFExecutor(
+    workers=settings.KDF_WORKERS or min(4, os.cpu_count() or 1),
+    max_queue=settings.KDF_MAX_QUEUE
+)
@@ -0,0 +1,53 @@
+import os
+import stat
+import tempfile
+
+
+def _check_owned(st: os.stat_result, path: str):
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"{path} is owned by uid {st.st_uid}, not by this process")
+
+
+def private_state_path(filename: str) -> str:
+    """Path of `filename` in this user's private state directory under the temp dir.
+
+    The directory is created 0700; one that is a symlink or belongs to another
+    user is refused, since anyone can create names in the shared temp dir.
+    """
+    directory = os.path.join(tempfile.gettempdir(), f"semper-tutus-{os.getuid()}")
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"{directory} is not a directory")
+    _check_owned(st, directory)
+    if stat.S_IMODE(st.st_mode) != 0o700:
+        os.chmod(directory, 0o700)
+    return os.path.join(directory, filename)
+
+
+def prepare_sqlite_file(path: str):
+    """Create or open a SQLite database file as owner-only before SQLite touches it.
+
+    Symlinks and files of another user are refused, for the database and for
+    its -wal and -shm files. SQLite creates the latter with the mode of the
+    database; ones left by an older run are made owner-only too.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    try:
+        _check_owned(os.fstat(fd), path)
+        os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
+    for suffix in ("-wal", "-shm"):
+        try:
+            fd = os.open(path + suffix, os.O_RDWR | os.O_NOFOLLOW)
+        except FileNotFoundError:
+            continue
+        try:
+            _check_owned(os.fstat(fd), path + suffix)
+            os.fchmod(fd, 0o600)
+        finally:
+            os.close(fd)
@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Optional, Tuple
+import base64
+import json
+
+
+def encode_cursor(sort_value: Optional[datetime], row_id: int) -> str:
+    """Encode the (sort key, id) of the last row on a page as an opaque cursor."""
+    payload = {
+        "v": sort_value.isoformat() if sort_value is not None else None,
+        "id": row_id,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Decode a cursor produced by `encode_cursor`. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        sort_value = payload["v"]
+        return (
+            datetime.fromisoformat(sort_value) if sort_value is not None else None,
+            int(payload["id"]),
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -0,0 +1,170 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import random
+import sqlite3
+import threading
+import time
+
+from ..config import settings
+from .local_files import prepare_sqlite_file, private_state_path
+
+
+class TokenBucketBackend(ABC):
+    """Token buckets keyed by an arbitrary string (client IP, username, ...)."""
+
+    @abstractmethod
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        """Take one token from the key's bucket.
+
+        `rate` is tokens added per second and `capacity` the bucket size. Returns
+        0 if a token was taken, otherwise the seconds until one is available.
+        """
+
+
+def _refill(tokens: float, elapsed: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + max(elapsed, 0.0) * rate)
+
+
+class InMemoryTokenBuckets(TokenBucketBackend):
+    """Process-local buckets. Each worker enforces the limits on its own.
+
+    At most `max_keys` buckets are kept; the least recently used one is dropped
+    (which refills it) when the limit is reached.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> (tokens, last refill on the monotonic clock)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (capacity, now))
+            tokens = _refill(tokens, now - last, rate, capacity)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteTokenBuckets(TokenBucketBackend):
+    """Buckets shared by all worker processes on one host through a local SQLite file."""
+
+    IDLE_SECONDS = 3600
+    PURGE_PROBABILITY = 0.001
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        prepare_sqlite_file(path)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " key TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_buckets_updated_at ON buckets (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, rate: float, capacity: float) -> float:
+        now = time.time()
+        conn = self._connect()
+        # The write lock is taken up front so concurrent workers can't both spend the last token
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else _refill(row[0], now - row[1], rate, capacity)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+            if random.random() < self.PURGE_PROBABILITY:
+                # Idle buckets have refilled completely, dropping them changes nothing
+                conn.execute("DELETE FROM buckets WHERE updated_at <= ?", (now - self.IDLE_SECONDS,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class AuthRateLimiter:
+    """Per-IP and per-username limits for the KDF-backed auth endpoints."""
+
+    def __init__(self, backend: TokenBucketBackend, ip_per_minute: float, ip_burst: int,
+                 user_per_minute: float, user_burst: int):
+        self.backend = backend
+        self.ip_rate = ip_per_minute / 60
+        self.ip_burst = ip_burst
+        self.user_rate = user_per_minute / 60
+        self.user_burst = user_burst
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {"allowed": 0, "rejected_ip": 0, "rejected_user": 0}
+
+    def check_ip(self, client_ip: str) -> float:
+        """Charge one attempt to the client IP. Returns 0 or the seconds to wait."""
+        wait = self.backend.take(f"ip:{client_ip}", self.ip_rate, self.ip_burst)
+        if wait:
+            self._count("rejected_ip")
+        return wait
+
+    def check_user(self, username: Optional[str]) -> float:
+        """Charge one attempt, already admitted by `check_ip`, to the username."""
+        wait = 0.0
+        if username:
+            wait = self.backend.take(f"user:{username.lower()}", self.user_rate, self.user_burst)
+        self._count("rejected_user" if wait else "allowed")
+        return wait
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self._counters[outcome] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+def create_rate_limit_backend() -> TokenBucketBackend:
+    """Build the token bucket backend selected by AUTH_RATE_LIMIT_BACKEND."""
+    if settings.AUTH_RATE_LIMIT_BACKEND == "memory":
+        return InMemoryTokenBuckets()
+    if settings.AUTH_RATE_LIMIT_BACKEND == "sqlite":
+        path = settings.AUTH_RATE_LIMIT_DB_PATH or private_state_path("rate_limits.db")
+        return SQLiteTokenBuckets(path)
+    raise ValueError(f"Unknown AUTH_RATE_LIMIT_BACKEND: {settings.AUTH_RATE_LIMIT_BACKEND}")
+
+
+auth_rate_limiter = AuthRateLimiter(
+    create_rate_limit_backend(),
+    ip_per_minute=settings.AUTH_RATE_LIMIT_IP_PER_MINUTE,
+    ip_burst=settings.AUTH_RATE_LIMIT_IP_BURST,
+    user_per_minute=settings.AUTH_RATE_LIMIT_USER_PER_MINUTE,
+    user_burst=settings.AUTH_RATE_LIMIT_USER_BURST
+)
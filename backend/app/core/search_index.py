@@ -0,0 +1,58 @@
+from typing import List, Optional, Set
+import hashlib
+import hmac
+import re
+
+from .encryption import derive_subkey, key_scoped_cache
+
+# Words are indexed by every prefix from MIN_PREFIX_LENGTH up to
+# MAX_PREFIX_LENGTH characters, so a query term matches words starting with it.
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_LENGTH = 12
+TOKEN_BYTES = 16
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+@key_scoped_cache
+def _index_key(master_key: bytes) -> bytes:
+    return derive_subkey(master_key, b"note-search-index")
+
+
+def _token(term: str, key: bytes) -> str:
+    return hmac.new(key, term.encode(), hashlib.sha256).digest()[:TOKEN_BYTES].hex()
+
+
+def _terms(text: Optional[str]) -> Set[str]:
+    return set(_WORD_RE.findall(text.lower())) if text else set()
+
+
+def note_search_tokens(title: Optional[str], content: Optional[str], master_key: bytes) -> Set[str]:
+    """Blind index tokens for a note's plaintext title and content.
+
+    Tokens are keyed with a subkey of the user's master key, so the server can
+    match them against query tokens without learning the terms, and equal terms
+    of different users never produce the same token.
+    """
+    key = _index_key(master_key)
+    prefixes = set()
+    for word in _terms(title) | _terms(content):
+        if len(word) <= MIN_PREFIX_LENGTH:
+            prefixes.add(word)
+            continue
+        for length in range(MIN_PREFIX_LENGTH, min(len(word), MAX_PREFIX_LENGTH) + 1):
+            prefixes.add(word[:length])
+    return {_token(prefix, key) for prefix in prefixes}
+
+
+def query_search_tokens(query: str, master_key: bytes) -> List[str]:
+    """Blind index tokens for the terms of a search query; a note must match all of them.
+
+    Raises ValueError for a term shorter than MIN_PREFIX_LENGTH, which could
+    only match words of exactly that length.
+    """
+    terms = _terms(query)
+    if any(len(term) < MIN_PREFIX_LENGTH for term in terms):
+        raise ValueError(f"Search terms must be at least {MIN_PREFIX_LENGTH} characters long")
+    key = _index_key(master_key)
+    return sorted({_token(term[:MAX_PREFIX_LENGTH], key) for term in terms})
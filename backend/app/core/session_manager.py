@@ -1,45 +1,246 @@
-from typing import Dict, Optional
-from datetime import datetime, timedelta, UTC
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from datetime import timedelta
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import heapq
+import os
+import sqlite3
 import threading
+import time
+
+from ..config import settings
+from .encryption import derive_subkey, forget_master_key
+from .local_files import prepare_sqlite_file, private_state_path
+
+
+class SessionBackend(ABC):
+    """Storage for unlocked master keys, keyed by user id."""
+
+    @abstractmethod
+    def store(self, user_id: int, master_key: bytes, timeout: timedelta):
+        """Store a master key, replacing any existing session of the user."""
+
+    @abstractmethod
+    def get(self, user_id: int, timeout: timedelta) -> Optional[bytes]:
+        """Return the master key if the session hasn't expired, and refresh its last access."""
+
+    @abstractmethod
+    def delete(self, user_id: int):
+        """Remove the user's session if there is one."""
+
+    def close(self):
+        """Release background resources. The backend must not be used afterwards."""
+
+
+class _Stripe:
+    """One lock-protected shard of the in-memory sessions."""
+
+    __slots__ = ("lock", "sessions", "expiry_heap", "queued")
 
-class SecureSessionManager:
     def __init__(self):
-        self._sessions: Dict[int, Dict] = {}
-        self._lock = threading.Lock()
-        self._cleanup_interval = timedelta(minutes=30)
+        self.lock = threading.Lock()
+        # user_id -> [master_key, deadline on the monotonic clock]
+        self.sessions: Dict[int, List] = {}
+        # (deadline, user_id) entries; a session's deadline may have moved since, checked when popped
+        self.expiry_heap: List[Tuple[float, int]] = []
+        # user_id -> deadline of its live heap entry; other entries of the user are superseded
+        self.queued: Dict[int, float] = {}
+
+
+class InMemorySessionBackend(SessionBackend):
+    """Process-local sessions. Only suitable for a single worker process.
+
+    Sessions are split over lock stripes by user id, so lookups for different
+    users rarely contend. Each stripe tracks expiry in a min-heap on the
+    monotonic clock, with at most one live entry per user: stores evict a
+    bounded number of expired sessions, and a background thread (stopped by
+    `close`) sweeps the rest, so no operation ever scans every session.
+    """
+
+    def __init__(self, stripes: int = 64, eviction_budget: int = 16, sweep_interval: Optional[float] = 60.0):
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self._eviction_budget = eviction_budget
+        self._closed = threading.Event()
+        self._sweeper = None
+        if sweep_interval:
+            self._sweeper = threading.Thread(
+                target=self._sweep_forever, args=(sweep_interval,), name="session-sweeper", daemon=True
+            )
+            self._sweeper.start()
+
+    def _stripe(self, user_id: int) -> _Stripe:
+        return self._stripes[user_id % len(self._stripes)]
+
+    def store(self, user_id: int, master_key: bytes, timeout: timedelta):
+        now = time.monotonic()
+        deadline = now + timeout.total_seconds()
+        stripe = self._stripe(user_id)
+        with stripe.lock:
+            stripe.sessions[user_id] = [master_key, deadline]
+            # An entry due earlier than the deadline is pushed back when popped, so
+            # one is only added when the user has none or its entry is due too late
+            queued = stripe.queued.get(user_id)
+            if queued is None or deadline < queued:
+                heapq.heappush(stripe.expiry_heap, (deadline, user_id))
+                stripe.queued[user_id] = deadline
+            self._evict_expired(stripe, now, self._eviction_budget)
+
+    def get(self, user_id: int, timeout: timedelta) -> Optional[bytes]:
+        now = time.monotonic()
+        stripe = self._stripe(user_id)
+        with stripe.lock:
+            session = stripe.sessions.get(user_id)
+            if session is None:
+                return None
+            if session[1] <= now:
+                del stripe.sessions[user_id]
+                return None
+            # Only the deadline moves; the heap entry is fixed up lazily on eviction
+            session[1] = now + timeout.total_seconds()
+            return session[0]
+
+    def delete(self, user_id: int):
+        stripe = self._stripe(user_id)
+        with stripe.lock:
+            stripe.sessions.pop(user_id, None)
+
+    def purge_expired(self) -> int:
+        """Evict every expired session, one stripe at a time. Returns how many were removed."""
+        removed = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                removed += self._evict_expired(stripe, time.monotonic(), budget=None)
+        return removed
+
+    def close(self):
+        self._closed.set()
+        if self._sweeper:
+            self._sweeper.join()
+
+    def __len__(self) -> int:
+        return sum(len(stripe.sessions) for stripe in self._stripes)
+
+    @staticmethod
+    def _evict_expired(stripe: _Stripe, now: float, budget: Optional[int]) -> int:
+        """Pop due heap entries, up to `budget` of them. Must hold the stripe lock."""
+        removed = 0
+        heap = stripe.expiry_heap
+        while heap and heap[0][0] <= now and (budget is None or budget > 0):
+            deadline, user_id = heapq.heappop(heap)
+            if budget is not None:
+                budget -= 1
+            if stripe.queued.get(user_id) != deadline:
+                # Superseded by a later store of the user, which pushed an earlier entry
+                continue
+            session = stripe.sessions.get(user_id)
+            if session is not None and session[1] > now:
+                # Touched since this entry was pushed, track its current deadline
+                heapq.heappush(heap, (session[1], user_id))
+                stripe.queued[user_id] = session[1]
+                continue
+            del stripe.queued[user_id]
+            if session is not None:
+                del stripe.sessions[user_id]
+                removed += 1
+        return removed
+
+    def _sweep_forever(self, interval: float):
+        while not self._closed.wait(interval):
+            self.purge_expired()
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions shared by all worker processes on one host through a local SQLite file.
+
+    Master keys are wrapped with AES-GCM under a key derived from SECRET_KEY
+    before they are written, so the database file alone doesn't expose them.
+    Put the file on a tmpfs (e.g. /dev/shm) to keep it off persistent storage.
+    """
+
+    def __init__(self, path: str, wrapping_secret: str):
+        self._path = path
+        self._cipher = AESGCM(derive_subkey(wrapping_secret.encode(), b"session-key-wrapping"))
+        self._local = threading.local()
+        # The database and its -wal and -shm files all hold wrapped keys
+        prepare_sqlite_file(path)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " user_id INTEGER PRIMARY KEY,"
+                " wrapped_key BLOB NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_last_access ON sessions (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _wrap(self, user_id: int, master_key: bytes) -> bytes:
+        nonce = os.urandom(12)
+        return nonce + self._cipher.encrypt(nonce, master_key, str(user_id).encode())
+
+    def _unwrap(self, user_id: int, wrapped_key: bytes) -> bytes:
+        return self._cipher.decrypt(wrapped_key[:12], wrapped_key[12:], str(user_id).encode())
+
+    def store(self, user_id: int, master_key: bytes, timeout: timedelta):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (user_id, wrapped_key, last_access) VALUES (?, ?, ?)",
+            (user_id, self._wrap(user_id, master_key), now)
+        )
+        conn.execute("DELETE FROM sessions WHERE last_access <= ?", (now - timeout.total_seconds(),))
+
+    def get(self, user_id: int, timeout: timedelta) -> Optional[bytes]:
+        now = time.time()
+        # fetchall() steps the statement to completion so the write lock is released
+        rows = self._connect().execute(
+            "UPDATE sessions SET last_access = ? WHERE user_id = ? AND last_access > ? RETURNING wrapped_key",
+            (now, user_id, now - timeout.total_seconds())
+        ).fetchall()
+        if not rows:
+            return None
+        return self._unwrap(user_id, rows[0][0])
+
+    def delete(self, user_id: int):
+        self._connect().execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+
+def create_session_backend() -> SessionBackend:
+    """Build the session backend selected by SESSION_BACKEND."""
+    if settings.SESSION_BACKEND == "memory":
+        return InMemorySessionBackend()
+    if settings.SESSION_BACKEND == "sqlite":
+        path = settings.SESSION_DB_PATH or private_state_path("sessions.db")
+        return SQLiteSessionBackend(path, settings.SECRET_KEY)
+    raise ValueError(f"Unknown SESSION_BACKEND: {settings.SESSION_BACKEND}")
+
+
+class SecureSessionManager:
+    def __init__(self, backend: Optional[SessionBackend] = None):
+        self._backend = backend or InMemorySessionBackend()
         self._session_timeout = timedelta(hours=4)
 
     def store_master_key(self, user_id: int, master_key: bytes):
-        with self._lock:
-            self._sessions[user_id] = {
-                'master_key': master_key,
-                'last_access': datetime.now(UTC)
-            }
-            self._cleanup_expired()
+        self._backend.store(user_id, master_key, self._session_timeout)
 
     def get_master_key(self, user_id: int) -> Optional[bytes]:
-        with self._lock:
-            if user_id in self._sessions:
-                session = self._sessions[user_id]
-                if datetime.now(UTC) - session['last_access'] < self._session_timeout:
-                    session['last_access'] = datetime.now(UTC)
-                    return session['master_key']
-                else:
-                    del self._sessions[user_id]
-            return None
-        
+        return self._backend.get(user_id, self._session_timeout)
+
     def clear_session(self, user_id: int):
-        with self._lock:
-            if user_id in self._sessions:
-                del self._sessions[user_id]
-
-    def _cleanup_expired(self):
-        now = datetime.now(UTC)
-        expired = [
-            user_id for user_id, session in self._sessions.items()
-            if now - session['last_access'] >= self._session_timeout
-        ]
-        for user_id in expired:
-            del self._sessions[user_id]
-
-session_manager = SecureSessionManager()
\ No newline at end of file
+        master_key = self._backend.get(user_id, self._session_timeout)
+        self._backend.delete(user_id)
+        if master_key is not None:
+            forget_master_key(master_key)
+
+    def close(self):
+        self._backend.close()
+
+session_manager = SecureSessionManager(create_session_backend())
@@ -0,0 +1,31 @@
+from typing import BinaryIO
+
+from anyio import to_thread
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models.file_blob_chunk import FileBlobChunk
+
+# Storage tiers, recorded per file in File.storage_tier
+TIER_DATABASE = "database"
+TIER_FILESYSTEM = "filesystem"
+
+# Size of the file_blob_chunks rows of database-stored files
+DB_BLOB_CHUNK_SIZE = 1024 * 1024
+
+
+def storage_tier_for(size: int) -> str:
+    """Where a file of `size` bytes belongs under the current settings."""
+    threshold = settings.FILE_DB_TIER_MAX_KB * 1024
+    if settings.STORE_FILES_IN_DB or (threshold and size <= threshold):
+        return TIER_DATABASE
+    return TIER_FILESYSTEM
+
+
+async def store_in_database(db: AsyncSession, file_id: int, source: BinaryIO):
+    """Copy a stored file from `source` into the file's database chunks, one chunk at a time."""
+    index = 0
+    while data := await to_thread.run_sync(source.read, DB_BLOB_CHUNK_SIZE):
+        await db.execute(insert(FileBlobChunk).values(file_id=file_id, chunk_index=index, data=data))
+        index += 1
@@ -0,0 +1,46 @@
+from functools import partial
+from pathlib import Path
+from typing import List
+import shutil
+
+from anyio import to_thread
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models.upload_session import UploadSession, UploadSessionChunk
+
+# Received chunks of upload sessions wait here, on local disk whatever the blob store
+UPLOAD_SCRATCH_PATH = Path(settings.FILE_STORAGE_PATH) / ".uploads"
+
+
+def session_dir(session: UploadSession) -> Path:
+    return UPLOAD_SCRATCH_PATH / session.id
+
+
+async def delete_sessions(db: AsyncSession, sessions: List[UploadSession]) -> List[Path]:
+    """Delete sessions with their chunk rows, without committing.
+
+    Returns their scratch directories, to remove with `remove_session_dirs`
+    once the deletion is committed.
+    """
+    if not sessions:
+        return []
+    ids = [session.id for session in sessions]
+    await db.execute(delete(UploadSessionChunk).where(UploadSessionChunk.session_id.in_(ids)))
+    await db.execute(
+        delete(UploadSession).where(UploadSession.id.in_(ids)).execution_options(synchronize_session=False)
+    )
+    return [session_dir(session) for session in sessions]
+
+
+async def remove_session_dirs(directories: List[Path]):
+    for directory in directories:
+        await to_thread.run_sync(partial(shutil.rmtree, directory, ignore_errors=True))
+
+
+async def discard_sessions(db: AsyncSession, sessions: List[UploadSession]):
+    """Delete sessions with their chunks, on disk once the deletion is committed."""
+    directories = await delete_sessions(db, sessions)
+    await db.commit()
+    await remove_session_dirs(directories)
@@ -1,8 +1,31 @@
+from contextlib import asynccontextmanager
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api.routes import auth, notes, folders
+from .api.routes import auth, notes, folders, files, metrics, sync, uploads
+from .api.file_sweeper import sweep_periodically
+from .api.file_tiers import migrate_file_tiers
+from .api.throttling import AuthThrottleMiddleware
+from .config import settings
+from .core.rate_limit import auth_rate_limiter
+from .core.session_manager import session_manager
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Files left in the wrong tier by a change of the tier settings are moved in the background
+    migration = asyncio.create_task(migrate_file_tiers()) if settings.FILE_TIER_MIGRATION else None
+    # Orphaned blobs and file rows without a blob are looked for periodically
+    sweeper = None
+    if settings.FILE_SWEEP_INTERVAL_HOURS > 0:
+        sweeper = asyncio.create_task(sweep_periodically(settings.FILE_SWEEP_INTERVAL_HOURS * 3600))
+    yield
+    for task in (migration, sweeper):
+        if task:
+            task.cancel()
+    session_manager.close()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,12 +33,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+if settings.AUTH_RATE_LIMIT_ENABLED:
+    app.add_middleware(AuthThrottleMiddleware, limiter=auth_rate_limiter)
+
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 
 app.include_router(notes.router, prefix="/notes", tags=["notes"])
 
 app.include_router(folders.router, prefix="/folders", tags=["folders"])
 
+app.include_router(files.router, prefix="/files", tags=["files"])
+
+app.include_router(uploads.router, prefix="/uploads", tags=["uploads"])
+
+app.include_router(sync.router, prefix="/sync", tags=["sync"])
+
+# Process counters are for operators only, and not served at all without a token
+if settings.METRICS_TOKEN:
+    app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
+
 # app.include_router(users.router, prefix="/users", tags=["users"])
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, LargeBinary
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
@@ -11,15 +11,23 @@ class File(Base):
     content_type = Column(String, nullable=False)  # MIME type
     size = Column(Integer, nullable=False)  # Size in bytes
     is_encrypted = Column(Boolean, default=True)
-    file_path = Column(String, nullable=True)  # For external storage option
-    file_data = Column(LargeBinary, nullable=True)  # For DB storage option
+    file_path = Column(String, nullable=True)  # Key in the blob store, NULL when stored in the database
+    storage_tier = Column(String(16), nullable=False, default="filesystem", server_default="filesystem")  # "database" or "filesystem"
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Foreign keys
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True)
+    content_id = Column(Integer, ForeignKey("file_contents.id"), nullable=True)  # Set for deduplicated files
+    version = Column(Integer, default=0, server_default="0", nullable=False)  # User change version of the last write
     
     # Relationships
     owner = relationship("User", back_populates="files")
-    folder = relationship("Folder", back_populates="files")
\ No newline at end of file
+    folder = relationship("Folder", back_populates="files")
+    content = relationship("FileContent", back_populates="files")
+
+    __table_args__ = (
+        Index("ix_files_user_id_version", "user_id", "version"),
+        Index("ix_files_storage_tier_size", "storage_tier", "size"),
+    )
\ No newline at end of file
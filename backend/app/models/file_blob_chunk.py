@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, ForeignKey, LargeBinary
+from ..database import Base
+
+class FileBlobChunk(Base):
+    """A piece of a file stored in the database (STORE_FILES_IN_DB).
+
+    Blobs live apart from the file rows, so listing and editing files never
+    loads their bytes, and are split in chunks so downloads read them a piece
+    at a time.
+    """
+    __tablename__ = "file_blob_chunks"
+
+    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from ..database import Base
+
+class FileContent(Base):
+    """A deduplicated, content-addressed blob shared by a user's identical files.
+
+    `digest` is an HMAC of the plaintext keyed with the user's master key, so
+    equal files of different users never share a digest or a blob.
+    """
+    __tablename__ = "file_contents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    digest = Column(String(64), nullable=False)
+    is_encrypted = Column(Boolean, nullable=False)
+    size = Column(Integer, nullable=False)
+    file_path = Column(String, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    files = relationship("File", back_populates="content")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "digest", "is_encrypted", name="uq_file_contents_user_id_digest"),
+    )
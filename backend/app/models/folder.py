@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
@@ -10,6 +10,11 @@ class Folder(Base):
     name = Column(String, nullable=False)
     parent_id = Column(Integer, ForeignKey("folders.id"), nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Materialized path of ids from the root down to this folder, e.g. "/3/17/42/".
+    # Descendants are exactly the folders whose path starts with this one's.
+    path = Column(String, nullable=False)
+    depth = Column(Integer, nullable=False, default=0)  # 0 for root folders
+    version = Column(Integer, default=0, server_default="0", nullable=False)  # User change version of the last write
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -23,4 +28,14 @@ class Folder(Base):
     # Relationship with user
     owner = relationship("User", back_populates="folders")
     
-    # files = relationship("File", back_populates="folder", cascade="all, delete-orphan")
+    files = relationship("File", back_populates="folder")
+
+    __table_args__ = (
+        # Prefix (LIKE 'path%') lookups of subtrees
+        Index("ix_folders_user_id_path", "user_id", "path", postgresql_ops={"path": "varchar_pattern_ops"}),
+        Index("ix_folders_user_id_version", "user_id", "version"),
+    )
+
+    @staticmethod
+    def child_path(parent_path: str, folder_id: int) -> str:
+        return f"{parent_path or '/'}{folder_id}/"
@@ -1,21 +1,54 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, ARRAY
+from datetime import datetime, timezone
+from typing import Union
+
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, ARRAY, Index, JSON, LargeBinary, false
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
 
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class Note(Base):
     __tablename__ = "notes"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
-    content = Column(String)
-    tags = Column(ARRAY(String), nullable=True)
+    content = Column(String)  # Plaintext of unencrypted notes, Fernet token of legacy encrypted ones
+    encrypted_content = Column(LargeBinary, nullable=True)  # Binary ciphertext envelope of encrypted notes
+    tags = Column(ARRAY(String).with_variant(JSON, "sqlite"), nullable=True)  # JSON on SQLite test databases
     is_encrypted = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    search_indexed = Column(Boolean, default=False, server_default=false(), nullable=False)
+    # Set client side so every timestamp is stored in the format its bound
+    # values (e.g. pagination cursors) use; SQLite compares them as text
+    created_at = Column(DateTime(timezone=True), default=_utcnow, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), default=_utcnow, server_default=func.now(), onupdate=_utcnow)
     user_id = Column(Integer, ForeignKey("users.id"))
     folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True)
+    version = Column(Integer, default=0, server_default="0", nullable=False)  # User change version of the last write
+    content_digest = Column(String(64), nullable=True)  # Keyed hash of the plaintext of encrypted notes
 
     # Relationships
     owner = relationship("User", back_populates="notes")
-    folder = relationship("Folder", back_populates="notes")
\ No newline at end of file
+    folder = relationship("Folder", back_populates="notes")
+
+    # Keyset pagination indexes for the note listing: (user_id, sort key, id)
+    __table_args__ = (
+        Index("ix_notes_user_id_updated_at_id", "user_id", "updated_at", "id"),
+        Index("ix_notes_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_notes_user_id_version", "user_id", "version"),
+    )
+
+    @property
+    def ciphertext(self) -> Union[bytes, str, None]:
+        """The stored ciphertext of an encrypted note, an envelope or a legacy Fernet token."""
+        return self.encrypted_content if self.encrypted_content is not None else self.content
+
+    def store_content(self, content: Union[str, bytes, None]):
+        """Store the plaintext (str) of an unencrypted note or the ciphertext (bytes) of an encrypted one."""
+        if isinstance(content, bytes):
+            self.content, self.encrypted_content = None, content
+        else:
+            self.content, self.encrypted_content = content, None
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from ..database import Base
+
+class NoteSearchToken(Base):
+    """Blind index entry: one keyed HMAC token of a term that occurs in a note."""
+    __tablename__ = "note_search_tokens"
+
+    id = Column(Integer, primary_key=True)
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    token = Column(String(32), nullable=False)
+
+    __table_args__ = (
+        Index("ix_note_search_tokens_user_id_token", "user_id", "token"),
+    )
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from ..database import Base
+
+class Tombstone(Base):
+    """Record of a deleted note, folder or file, so sync clients learn about the deletion."""
+    __tablename__ = "tombstones"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    entity_type = Column(String(16), nullable=False)  # "note", "folder" or "file"
+    entity_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_tombstones_user_id_version", "user_id", "version"),
+    )
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.sql import func
+from ..database import Base
+
+class UploadSession(Base):
+    """A file being uploaded in numbered chunks, which may arrive in any order.
+
+    Received chunks are encrypted on arrival and kept on disk until the
+    session is completed, aborted or expires.
+    """
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(36), primary_key=True)  # Random UUID, also names the chunk directory
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    folder_id = Column(Integer, ForeignKey("folders.id", ondelete="SET NULL"), nullable=True)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)  # Plaintext size of the whole file
+    chunk_size = Column(Integer, nullable=False)
+    is_encrypted = Column(Boolean, nullable=False)
+    file_header = Column(LargeBinary, nullable=True)  # Header of the encrypted file, shared by all chunks
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+class UploadSessionChunk(Base):
+    """A chunk of an upload session that was received completely."""
+    __tablename__ = "upload_session_chunks"
+
+    session_id = Column(String(36), ForeignKey("upload_sessions.id", ondelete="CASCADE"), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    size = Column(Integer, nullable=False)
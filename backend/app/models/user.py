@@ -13,12 +13,14 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)  # Bumped to revoke issued tokens
+    change_version = Column(Integer, default=0, server_default="0", nullable=False)  # Last sync version handed out
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     encryption_salt = Column(String, nullable=True)  # Changed to nullable=True
     encrypted_master_key = Column(String, nullable=True)
     
-    # files = relationship("File", back_populates="owner", cascade="all, delete-orphan")
+    files = relationship("File", back_populates="owner")
     
     folders = relationship("Folder", back_populates="owner")
 
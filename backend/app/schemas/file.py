@@ -1,5 +1,5 @@
-from typing import Optional
-from pydantic import BaseModel
+from typing import List, Optional
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 class FileBase(BaseModel):
@@ -24,4 +24,21 @@ class FileResponse(FileBase):
     # Note: we don't include file_data or file_path in responses
     
     class Config:
-        orm_mode = True
\ No newline at end of file
+        from_attributes = True
+class UploadSessionCreate(BaseModel):
+    filename: str
+    content_type: str = "application/octet-stream"
+    size: int = Field(..., ge=0)
+    is_encrypted: bool = True
+    folder_id: Optional[int] = None
+
+class UploadSessionResponse(BaseModel):
+    """State of an upload session. Resume by sending the chunks missing from `received`."""
+    id: str
+    filename: str
+    size: int
+    chunk_size: int
+    chunk_count: int
+    received: List[int] = []
+    received_bytes: int = 0
+    expires_at: datetime
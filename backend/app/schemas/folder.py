@@ -25,14 +25,16 @@ class FolderResponse(FolderBase):
     updated_at: Optional[datetime] = None
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 # Recursive schema for folder tree response (including children)
 class FolderTreeResponse(FolderResponse):
+    note_count: int = 0
+    file_count: int = 0
     children: List['FolderTreeResponse'] = []
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 # This handles the recursive reference
 FolderTreeResponse.update_forward_refs()
\ No newline at end of file
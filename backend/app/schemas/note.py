@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Literal, Optional, List, Union
 from datetime import datetime
 
 
@@ -34,10 +34,60 @@ class Note(NoteBase):
 
 
 class NoteResponse(NoteBase):  # Add this class
+    content: Optional[str] = None  # Filled in with the plaintext, encrypted notes store none
     id: int
     user_id: int
     created_at: datetime
     updated_at: Optional[datetime]
+    version: int = 0  # Sent back in If-Match as "note-{id}-{version}"
 
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+
+class NoteSummary(BaseModel):
+    """Metadata-only view of a note, returned by listings without `include=content`."""
+    id: int
+    user_id: int
+    title: Optional[str] = None
+    tags: Optional[List[str]] = []
+    is_encrypted: bool = True
+    folder_id: Optional[int] = None
+    created_at: datetime
+    updated_at: Optional[datetime]
+    version: int = 0
+
+    class Config:
+        from_attributes = True
+
+
+class NotePage(BaseModel):
+    """One page of a keyset-paginated note listing."""
+    items: List[Union[NoteResponse, NoteSummary]]
+    next_cursor: Optional[str] = None
+
+
+class NoteBatchOperation(BaseModel):
+    """One operation of a batch. `create` and `update` take `data`, `move` takes `folder_id`."""
+    op: Literal["create", "update", "delete", "move"]
+    id: Optional[int] = None  # Target note, for everything but create
+    client_id: Optional[str] = None  # Echoed back, lets clients match created notes to local drafts
+    data: Optional[NoteUpdate] = None
+    folder_id: Optional[int] = None
+
+
+class NoteBatchRequest(BaseModel):
+    operations: List[NoteBatchOperation]
+
+
+class NoteBatchResult(BaseModel):
+    op: str
+    id: Optional[int] = None
+    client_id: Optional[str] = None
+    status_code: int = 200
+    error: Optional[str] = None
+    note: Optional[NoteResponse] = None  # The note after a create or update
+
+
+class NoteBatchResponse(BaseModel):
+    results: List[NoteBatchResult]
@@ -0,0 +1,28 @@
+from typing import List
+from pydantic import BaseModel
+
+from .note import NoteResponse
+from .folder import FolderResponse
+from .file import FileResponse
+
+
+class TombstoneResponse(BaseModel):
+    entity_type: str
+    entity_id: int
+    version: int
+
+    class Config:
+        from_attributes = True
+
+
+class SyncResponse(BaseModel):
+    """Changes since the requested version. Pass `version` as `since` on the next sync.
+
+    With `has_more`, `version` is where this page stops and the next one follows at once.
+    """
+    version: int
+    has_more: bool = False
+    notes: List[NoteResponse]
+    folders: List[FolderResponse]
+    files: List[FileResponse]
+    deleted: List[TombstoneResponse]
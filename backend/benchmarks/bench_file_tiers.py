@@ -0,0 +1,79 @@
+# Upload and download throughput of the two file storage tiers.
+#
+# Drives the files API in process, once with every file placed in the
+# database tier and once with every file on disk, for a range of file
+# sizes. Uses a throwaway SQLite database unless DATABASE_URL is set, so
+# point it at Postgres for numbers that match a deployment.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_file_tiers
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp(prefix="semper-tutus-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/bench.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ.setdefault("FILE_STORAGE_PATH", os.path.join(_tmp, "files"))
+os.environ["FILE_TIER_MIGRATION"] = "false"
+os.environ["AUTH_RATE_LIMIT_ENABLED"] = "false"
+
+from fastapi.testclient import TestClient
+from app.config import settings
+from app.database import Base, engine
+from app.main import app
+
+
+def login(client: TestClient) -> dict:
+    credentials = {"username": "bench", "password": "benchmark password"}
+    client.post("/auth/register", json={**credentials, "email": "bench@example.com"})
+    token = client.post("/auth/login", data=credentials).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def run(sizes, count: int, encrypted: bool):
+    Base.metadata.create_all(bind=engine)
+    print(f"{engine.url.get_backend_name()}, {count} files per run, encrypted: {encrypted}")
+    print(f"{'file size':>10} {'tier':<11} {'uploads/s':>10} {'downloads/s':>12}")
+
+    with TestClient(app) as client:
+        headers = login(client)
+        for size in sizes:
+            body = os.urandom(size)
+            for tier, in_db in (("database", True), ("filesystem", False)):
+                settings.STORE_FILES_IN_DB = in_db
+                start = time.perf_counter()
+                ids = [
+                    client.post(
+                        "/files/",
+                        headers=headers,
+                        params={"is_encrypted": encrypted},
+                        files={"file": ("bench.bin", body, "application/octet-stream")},
+                    ).json()["id"]
+                    for _ in range(count)
+                ]
+                upload = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for file_id in ids:
+                    client.get(f"/files/{file_id}/download", headers=headers).content
+                download = time.perf_counter() - start
+
+                for file_id in ids:
+                    client.delete(f"/files/{file_id}", headers=headers)
+                print(f"{size:>10} {tier:<11} {count / upload:>10,.0f} {count / download:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="File storage tier benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 16 * 1024, 256 * 1024, 4 * 1024 * 1024])
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--plain", action="store_true", help="Upload unencrypted files")
+    args = parser.parse_args()
+    run(args.sizes, args.count, not args.plain)
@@ -0,0 +1,65 @@
+# Throughput benchmark for note encryption.
+#
+# Compares the per-note helpers (a fresh Fernet per call, the old get_notes
+# behaviour) against the batch API, sequentially and on the worker pool.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_note_encryption
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cryptography.fernet import Fernet
+from app.core.encryption import generate_master_key, decrypt_many, encrypt_many
+
+
+def make_notes(count: int, size: int) -> list:
+    body = ("lorem ipsum dolor sit amet " * (size // 27 + 1))[:size]
+    return [f"{i} {body}" for i in range(count)]
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(sizes, note_size: int, repeat: int):
+    master_key = generate_master_key()
+    print(f"note size: {note_size} bytes, best of {repeat}")
+    print(f"{'notes':>7} {'mode':<18} {'encrypt/s':>12} {'decrypt/s':>12}")
+
+    for count in sizes:
+        contents = make_notes(count, note_size)
+        tokens = encrypt_many(contents, master_key, parallel=False)
+
+        modes = {
+            "per-note Fernet": (
+                lambda: [Fernet(master_key).encrypt(c.encode()).decode() for c in contents],
+                lambda: [Fernet(master_key).decrypt(t.encode()).decode() for t in tokens],
+            ),
+            "batch sequential": (
+                lambda: encrypt_many(contents, master_key, parallel=False),
+                lambda: decrypt_many(tokens, master_key, parallel=False),
+            ),
+            "batch pool": (
+                lambda: encrypt_many(contents, master_key, parallel=True),
+                lambda: decrypt_many(tokens, master_key, parallel=True),
+            ),
+        }
+        for mode, (encrypt, decrypt) in modes.items():
+            enc = min(timed(encrypt) for _ in range(repeat))
+            dec = min(timed(decrypt) for _ in range(repeat))
+            print(f"{count:>7} {mode:<18} {count / enc:>12,.0f} {count / dec:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Note encryption throughput benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--note-size", type=int, default=2048)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.sizes, args.note_size, args.repeat)
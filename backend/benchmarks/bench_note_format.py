@@ -0,0 +1,68 @@
+# Storage and speed benchmark for the note ciphertext formats.
+#
+# Compares the legacy Fernet tokens (AES-CBC + HMAC, base64 text) with the
+# binary AES-GCM envelope, per note size: bytes stored per note and
+# sequential encrypt/decrypt throughput.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_note_format
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cryptography.fernet import Fernet
+from app.core.encryption import generate_master_key, decrypt_many, encrypt_many
+
+
+def make_notes(count: int, size: int) -> list:
+    body = ("lorem ipsum dolor sit amet " * (size // 27 + 1))[:size]
+    return [body for _ in range(count)]
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(note_sizes, count: int, repeat: int):
+    master_key = generate_master_key()
+    fernet = Fernet(master_key)
+    print(f"{count} notes per run, best of {repeat}")
+    print(f"{'note size':>9} {'format':<9} {'stored':>8} {'overhead':>9} {'encrypt/s':>12} {'decrypt/s':>12}")
+
+    for size in note_sizes:
+        contents = make_notes(count, size)
+        tokens = [fernet.encrypt(c.encode()).decode() for c in contents]
+        envelopes = encrypt_many(contents, master_key, parallel=False)
+
+        formats = {
+            "fernet": (
+                tokens,
+                lambda: [fernet.encrypt(c.encode()).decode() for c in contents],
+                lambda: [fernet.decrypt(t.encode()).decode() for t in tokens],
+            ),
+            "envelope": (
+                envelopes,
+                lambda: encrypt_many(contents, master_key, parallel=False),
+                lambda: decrypt_many(envelopes, master_key, parallel=False),
+            ),
+        }
+        for name, (stored, encrypt, decrypt) in formats.items():
+            stored_size = len(stored[0])
+            enc = min(timed(encrypt) for _ in range(repeat))
+            dec = min(timed(decrypt) for _ in range(repeat))
+            overhead = f"{(stored_size - size) / size:.0%}"
+            print(f"{size:>9} {name:<9} {stored_size:>8} {overhead:>9} {count / enc:>12,.0f} {count / dec:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Note ciphertext format benchmark")
+    parser.add_argument("--note-sizes", type=int, nargs="+", default=[64, 1024, 16384, 262144])
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.note_sizes, args.count, args.repeat)
@@ -0,0 +1,95 @@
+# Concurrency benchmark for the in-memory session backend.
+#
+# Compares the previous implementation (one global lock, wall-clock
+# datetimes and a full scan on every store) with the striped, heap-based
+# InMemorySessionBackend. Worker threads mix get_master_key lookups with
+# logins (stores) against a population of active sessions.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_session_manager
+
+from datetime import datetime, timedelta, UTC
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+from app.core.session_manager import InMemorySessionBackend, SessionBackend
+
+
+class LegacySessionBackend(SessionBackend):
+    """The session store as it was before lock striping and heap expiry."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def store(self, user_id, master_key, timeout):
+        with self._lock:
+            self._sessions[user_id] = {'master_key': master_key, 'last_access': datetime.now(UTC)}
+            now = datetime.now(UTC)
+            expired = [uid for uid, s in self._sessions.items() if now - s['last_access'] >= timeout]
+            for uid in expired:
+                del self._sessions[uid]
+
+    def get(self, user_id, timeout):
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session and datetime.now(UTC) - session['last_access'] < timeout:
+                session['last_access'] = datetime.now(UTC)
+                return session['master_key']
+            return None
+
+    def delete(self, user_id):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+
+def run_workers(backend, sessions: int, threads: int, ops: int, store_ratio: float) -> float:
+    timeout = timedelta(hours=4)
+    key = os.urandom(44)
+    for user_id in range(sessions):
+        backend.store(user_id, key, timeout)
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        for _ in range(ops):
+            user_id = rng.randrange(sessions)
+            if rng.random() < store_ratio:
+                backend.store(user_id, key, timeout)
+            else:
+                backend.get(user_id, timeout)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return threads * ops / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Session manager concurrency benchmark")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=5000, help="operations per thread")
+    parser.add_argument("--store-ratio", type=float, default=0.01, help="share of operations that are logins")
+    args = parser.parse_args()
+
+    print(f"threads: {args.threads}, ops/thread: {args.ops}, store ratio: {args.store_ratio}")
+    print(f"{'sessions':>9} {'backend':<10} {'ops/s':>12}")
+    for sessions in args.sessions:
+        for name, backend in (
+            ("legacy", LegacySessionBackend()),
+            ("striped", InMemorySessionBackend(sweep_interval=None)),
+        ):
+            rate = run_workers(backend, sessions, args.threads, args.ops, args.store_ratio)
+            print(f"{sessions:>9} {name:<10} {rate:>12,.0f}")
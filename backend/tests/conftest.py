@@ -0,0 +1,67 @@
+# Shared fixtures. The suite runs against a throwaway SQLite database by
+# default (through aiosqlite); set TEST_DATABASE_URL to a Postgres URL to run
+# it against Postgres instead.
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp(prefix="semper-tutus-tests-")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ["FILE_STORAGE_PATH"] = os.path.join(_tmp, "files")
+os.environ["SESSION_BACKEND"] = "memory"
+os.environ["FILE_TIER_MIGRATION"] = "false"
+os.environ["FILE_SWEEP_INTERVAL_HOURS"] = "0"
+os.environ["METRICS_TOKEN"] = "test-metrics-token"
+# Every test client request comes from the same address
+os.environ["AUTH_RATE_LIMIT_IP_BURST"] = "1000"
+
+from fastapi.testclient import TestClient
+from app.database import Base, engine
+from app.main import app
+from app.models.user import User  # noqa: F401
+from app.models.note import Note  # noqa: F401
+from app.models.note_search_token import NoteSearchToken  # noqa: F401
+from app.models.folder import Folder  # noqa: F401
+from app.models.file import File  # noqa: F401
+from app.models.file_content import FileContent  # noqa: F401
+from app.models.tombstone import Tombstone  # noqa: F401
+from app.models.file_blob_chunk import FileBlobChunk  # noqa: F401
+from app.models.upload_session import UploadSession, UploadSessionChunk  # noqa: F401
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def auth_headers(client, request):
+    """Register and log in a fresh user, returning its Authorization header."""
+    username = f"user{abs(hash(request.node.nodeid))}"
+    password = "correct horse battery staple"
+    response = client.post("/auth/register", json={
+        "email": f"{username}@example.com",
+        "username": username,
+        "password": password,
+    })
+    assert response.status_code == 200, response.text
+    response = client.post("/auth/login", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,686 @@
+import os
+
+import pytest
+
+
+def test_note_lifecycle(client, auth_headers):
+    response = client.post("/notes/", headers=auth_headers, json={
+        "title": "Groceries",
+        "content": "apples and oranges",
+        "tags": ["home"],
+        "is_encrypted": True,
+    })
+    assert response.status_code == 200, response.text
+    note_id = response.json()["id"]
+
+    response = client.get(f"/notes/{note_id}", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["content"] == "apples and oranges"
+
+    response = client.get("/notes/search", headers=auth_headers, params={"q": "orang"})
+    assert [n["id"] for n in response.json()] == [note_id]
+
+    response = client.put(f"/notes/{note_id}", headers=auth_headers, json={"content": "pears"})
+    assert response.status_code == 200
+    assert response.json()["content"] == "pears"
+
+    response = client.get("/notes/", headers=auth_headers, params={"include": "content"})
+    assert [n["content"] for n in response.json()["items"]] == ["pears"]
+
+    assert client.delete(f"/notes/{note_id}", headers=auth_headers).status_code in (200, 204)
+    assert client.get(f"/notes/{note_id}", headers=auth_headers).status_code == 404
+
+
+
+def test_note_search(client, auth_headers):
+    def create(title, content, is_encrypted=True, headers=auth_headers):
+        response = client.post("/notes/", headers=headers, json={
+            "title": title, "content": content, "is_encrypted": is_encrypted,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    def search(q, headers=auth_headers):
+        response = client.get("/notes/search", headers=headers, params={"q": q})
+        assert response.status_code == 200, response.text
+        return {n["id"] for n in response.json()}
+
+    trip = create("Trip", "Pack passport, sunscreen and hiking boots")
+    recipe = create("Recipe", "Knead the dough, then bake the bread")
+    plain = create("Shopping", "bread and sunscreen", is_encrypted=False)
+
+    # Prefixes of content words, case-insensitively
+    assert search("pass") == {trip}
+    assert search("SUNSC") == {trip, plain}
+    # Every term must match
+    assert search("bread knead") == {recipe}
+    assert search("sunscreen boots") == {trip}
+    assert search("bread passport") == set()
+
+    response = client.get("/notes/search", headers=auth_headers, params={"q": "pa"})
+    assert response.status_code == 400
+    response = client.get("/notes/search", headers=auth_headers, params={"q": "bread ab"})
+    assert response.status_code == 400
+
+    # Another user's notes are never returned, though they hold the same words
+    username = "searchneighbour"
+    password = "correct horse battery staple"
+    client.post("/auth/register", json={
+        "email": f"{username}@example.com", "username": username, "password": password,
+    })
+    token = client.post("/auth/login", data={"username": username, "password": password}).json()["access_token"]
+    other_headers = {"Authorization": f"Bearer {token}"}
+    other = create("Trip", "Pack passport", headers=other_headers)
+    assert search("passport") == {trip}
+    assert search("passport", headers=other_headers) == {other}
+
+
+def test_notes_from_before_the_search_index_are_indexed(client, auth_headers):
+    import asyncio
+    from app.api.routes.notes import index_pending_notes
+    from app.core.session_manager import session_manager
+    from app.database import SessionLocal
+    from app.models.note import Note
+    from app.models.note_search_token import NoteSearchToken
+
+    note_id = client.post("/notes/", headers=auth_headers, json={
+        "title": "Old", "content": "legacy lighthouse", "is_encrypted": True,
+    }).json()["id"]
+    with SessionLocal() as db:
+        db.query(NoteSearchToken).filter_by(note_id=note_id).delete()
+        db.query(Note).filter_by(id=note_id).update({"search_indexed": False})
+        db.commit()
+    assert client.get("/notes/search", headers=auth_headers, params={"q": "lightho"}).json() == []
+
+    user_id = client.get(f"/notes/{note_id}", headers=auth_headers).json()["user_id"]
+    assert asyncio.run(index_pending_notes(user_id, session_manager.get_master_key(user_id))) == 1
+    found = client.get("/notes/search", headers=auth_headers, params={"q": "lightho"}).json()
+    assert [n["id"] for n in found] == [note_id]
+    assert asyncio.run(index_pending_notes(user_id, session_manager.get_master_key(user_id))) == 0
+
+
+def test_file_upload_and_range_download(client, auth_headers):
+    body = bytes(range(256)) * 1024
+    response = client.post(
+        "/files/",
+        headers=auth_headers,
+        files={"file": ("blob.bin", body, "application/octet-stream")},
+    )
+    assert response.status_code == 200, response.text
+    file_id = response.json()["id"]
+
+    response = client.get(f"/files/{file_id}/download", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.content == body
+
+    response = client.get(f"/files/{file_id}/download", headers={**auth_headers, "Range": "bytes=70000-70099"})
+    assert response.status_code == 206
+    assert response.content == body[70000:70100]
+
+    assert client.delete(f"/files/{file_id}", headers=auth_headers).status_code == 204
+
+
+def test_files_stored_in_database(client, auth_headers, monkeypatch):
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.models.file_blob_chunk import FileBlobChunk
+    monkeypatch.setattr(settings, "STORE_FILES_IN_DB", True)
+
+    # Larger than one database chunk, so reads cross chunk boundaries
+    body = os.urandom(1024 * 1024 * 2 + 12345)
+    for encrypted in ("true", "false"):
+        response = client.post(
+            "/files/",
+            headers=auth_headers,
+            params={"is_encrypted": encrypted},
+            files={"file": ("blob.bin", body, "application/octet-stream")},
+        )
+        assert response.status_code == 200, response.text
+        file_id = response.json()["id"]
+
+        assert client.get(f"/files/{file_id}/download", headers=auth_headers).content == body
+        response = client.get(
+            f"/files/{file_id}/download", headers={**auth_headers, "Range": "bytes=1048000-1049999"}
+        )
+        assert response.status_code == 206 and response.content == body[1048000:1050000]
+
+        assert client.delete(f"/files/{file_id}", headers=auth_headers).status_code == 204
+        with SessionLocal() as db:
+            assert db.query(FileBlobChunk).filter_by(file_id=file_id).count() == 0
+
+
+def test_missing_database_chunk_fails_the_download(client, auth_headers, monkeypatch):
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.models.file_blob_chunk import FileBlobChunk
+    monkeypatch.setattr(settings, "STORE_FILES_IN_DB", True)
+
+    body = os.urandom(1024 * 1024 + 100)
+    response = client.post(
+        "/files/",
+        headers=auth_headers,
+        files={"file": ("blob.bin", body, "application/octet-stream")},
+    )
+    file_id = response.json()["id"]
+    with SessionLocal() as db:
+        db.query(FileBlobChunk).filter_by(file_id=file_id, chunk_index=1).delete()
+        db.commit()
+
+    # A silently shortened download would look like a complete file
+    with pytest.raises(IOError, match="missing"):
+        client.get(f"/files/{file_id}/download", headers=auth_headers)
+
+
+def test_deduplicated_files(client, auth_headers, monkeypatch):
+    from app.config import settings
+    from app.core.blob_store import blob_store
+    from app.database import SessionLocal
+    from app.models.file import File
+    from app.models.file_content import FileContent
+    monkeypatch.setattr(settings, "FILE_DEDUPLICATION", True)
+
+    def upload(body, name, folder_id=None):
+        params = {"folder_id": folder_id} if folder_id else {}
+        response = client.post(
+            "/files/", headers=auth_headers, params=params,
+            files={"file": (name, body, "application/octet-stream")},
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    def content_of(file_id):
+        with SessionLocal() as db:
+            content_id = db.get(File, file_id).content_id
+            return db.get(FileContent, content_id) if content_id else None
+
+    body = os.urandom(100000)
+    folder = client.post("/folders/", headers=auth_headers, json={"name": "copies"}).json()["id"]
+    first = upload(body, "a.bin")
+    second = upload(body, "b.bin")
+    nested = upload(body, "c.bin", folder_id=folder)
+    other = upload(os.urandom(1000), "d.bin")
+
+    # Identical uploads share one content row and blob
+    content = content_of(first)
+    assert content is not None and content.ref_count == 3
+    assert content_of(second).id == content_of(nested).id == content.id
+    assert content_of(other).id != content.id
+    for file_id in (first, second, nested):
+        assert client.get(f"/files/{file_id}/download", headers=auth_headers).content == body
+
+    # Deleting a copy only drops a reference
+    assert client.delete(f"/files/{second}", headers=auth_headers).status_code == 204
+    assert content_of(first).ref_count == 2
+    assert client.delete(f"/folders/{folder}", headers=auth_headers, params={"recursive": True}).status_code == 204
+    assert content_of(first).ref_count == 1
+    assert blob_store.exists(content.file_path)
+    assert client.get(f"/files/{first}/download", headers=auth_headers).content == body
+
+    # The last reference removes the content row and the blob
+    assert client.delete(f"/files/{first}", headers=auth_headers).status_code == 204
+    with SessionLocal() as db:
+        assert db.get(FileContent, content.id) is None
+    assert not blob_store.exists(content.file_path)
+
+
+
+def test_late_delete_of_a_released_blob_spares_a_reupload(client, auth_headers, monkeypatch):
+    from app.config import settings
+    from app.core.blob_store import blob_store
+    monkeypatch.setattr(settings, "FILE_DEDUPLICATION", True)
+
+    def upload():
+        response = client.post("/files/", headers=auth_headers, files={"file": ("a.bin", body, "application/octet-stream")})
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+
+    body = os.urandom(50000)
+    first = upload()
+
+    # Hold back blob deletes, as if they ran after a concurrent upload
+    pending = []
+    real_delete = blob_store.delete
+    monkeypatch.setattr(blob_store, "delete", pending.append)
+    assert client.delete(f"/files/{first}", headers=auth_headers).status_code == 204
+    assert len(pending) == 1
+
+    second = upload()
+    for key in pending:
+        real_delete(key)
+    assert client.get(f"/files/{second}/download", headers=auth_headers).content == body
+
+
+def test_file_storage_tiers(client, auth_headers, monkeypatch):
+    import asyncio
+    from app.api.file_tiers import migrate_file_tiers
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.models.file import File
+    monkeypatch.setattr(settings, "FILE_DB_TIER_MAX_KB", 64)
+    # Deduplicated blobs are shared and never change tier
+    monkeypatch.setattr(settings, "FILE_DEDUPLICATION", False)
+
+    bodies = {size: os.urandom(size) for size in (1000, 100 * 1024)}
+    ids = {}
+    for size, body in bodies.items():
+        response = client.post("/files/", headers=auth_headers, files={"file": ("f.bin", body, "application/octet-stream")})
+        assert response.status_code == 200, response.text
+        ids[size] = response.json()["id"]
+
+    def tiers():
+        with SessionLocal() as db:
+            return {size: db.get(File, file_id).storage_tier for size, file_id in ids.items()}
+
+    assert tiers() == {1000: "database", 100 * 1024: "filesystem"}
+
+    # Raising the threshold moves the larger file into the database, lowering it moves both out
+    for threshold, expected in ((1024, "database"), (0, "filesystem")):
+        monkeypatch.setattr(settings, "FILE_DB_TIER_MAX_KB", threshold)
+        asyncio.run(migrate_file_tiers())
+        assert set(tiers().values()) == {expected}
+        for size, file_id in ids.items():
+            assert client.get(f"/files/{file_id}/download", headers=auth_headers).content == bodies[size]
+
+    for file_id in ids.values():
+        assert client.delete(f"/files/{file_id}", headers=auth_headers).status_code == 204
+
+
+def test_resumable_upload(client, auth_headers):
+    body = os.urandom(9 * 1024 * 1024 + 12345)
+    session = client.post("/uploads/", headers=auth_headers, json={"filename": "big.bin", "size": len(body)}).json()
+    chunk_size = session["chunk_size"]
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    assert session["chunk_count"] == len(chunks) == 3
+
+    # Chunks may arrive in any order; the file can't be completed until all are there
+    for index in (2, 0):
+        response = client.put(f"/uploads/{session['id']}/chunks/{index}", headers=auth_headers, content=chunks[index])
+        assert response.status_code == 200, response.text
+    assert client.post(f"/uploads/{session['id']}/complete", headers=auth_headers).status_code == 409
+    assert client.put(f"/uploads/{session['id']}/chunks/1", headers=auth_headers, content=b"short").status_code == 400
+
+    progress = client.get(f"/uploads/{session['id']}", headers=auth_headers).json()
+    assert progress["received"] == [0, 2]
+    assert progress["received_bytes"] == len(chunks[0]) + len(chunks[2])
+
+    client.put(f"/uploads/{session['id']}/chunks/1", headers=auth_headers, content=chunks[1])
+    response = client.post(f"/uploads/{session['id']}/complete", headers=auth_headers)
+    assert response.status_code == 200, response.text
+    file_id = response.json()["id"]
+    assert client.get(f"/uploads/{session['id']}", headers=auth_headers).status_code == 404
+
+    assert client.get(f"/files/{file_id}/download", headers=auth_headers).content == body
+    start = chunk_size - 100
+    response = client.get(f"/files/{file_id}/download", headers={**auth_headers, "Range": f"bytes={start}-{start + 199}"})
+    assert response.content == body[start:start + 200]
+    assert client.delete(f"/files/{file_id}", headers=auth_headers).status_code == 204
+
+    session = client.post("/uploads/", headers=auth_headers, json={"filename": "gone.bin", "size": 10}).json()
+    client.put(f"/uploads/{session['id']}/chunks/0", headers=auth_headers, content=b"0123456789")
+    assert client.delete(f"/uploads/{session['id']}", headers=auth_headers).status_code == 204
+    assert client.get(f"/uploads/{session['id']}", headers=auth_headers).status_code == 404
+
+
+def test_file_storage_sweep(client, auth_headers, tmp_path):
+    import asyncio
+    import time
+    from datetime import datetime, timedelta, timezone
+    from app.api.file_sweeper import sweep_file_storage
+    from app.core.blob_store import blob_store
+    from app.database import SessionLocal
+    from app.models.file import File
+    from app.models.upload_session import UploadSession
+
+    kept, lost = (
+        client.post("/files/", headers=auth_headers, files={"file": ("f.bin", os.urandom(1000), "text/plain")}).json()["id"]
+        for _ in range(2)
+    )
+    with SessionLocal() as db:
+        blob_store.delete(db.get(File, lost).file_path)
+
+    # Only the old orphan is swept, the new one may belong to an upload in progress
+    for key, age in (("999/old.bin", 7200), ("999/new.bin", 0)):
+        writer = blob_store.create_writer()
+        writer.write(b"orphan")
+        writer.commit(key)
+        os.utime(blob_store.path_for(key), (time.time() - age,) * 2)
+
+    session = client.post("/uploads/", headers=auth_headers, json={"filename": "x.bin", "size": 3}).json()
+    client.put(f"/uploads/{session['id']}/chunks/0", headers=auth_headers, content=b"abc")
+    with SessionLocal() as db:
+        db.get(UploadSession, session["id"]).expires_at = datetime.now(timezone.utc) - timedelta(hours=1)
+        db.commit()
+
+    def sweep(repair):
+        return asyncio.run(sweep_file_storage(
+            repair=repair, ops_per_second=0, grace_seconds=3600, state_path=tmp_path / "sweep.json"
+        ))
+
+    report = sweep(repair=False)
+    assert (report["orphan_blobs"], report["dangling_files"], report["expired_upload_sessions"]) == (1, 1, 1)
+    assert report["repaired"] == 0
+    assert blob_store.exists("999/old.bin")
+
+    assert sweep(repair=True)["repaired"] == 3
+    assert not blob_store.exists("999/old.bin")
+    assert blob_store.exists("999/new.bin")
+    listed = {f["id"] for f in client.get("/files/", headers=auth_headers).json()}
+    assert kept in listed and lost not in listed
+    with SessionLocal() as db:
+        assert db.get(UploadSession, session["id"]) is None
+
+    blob_store.delete("999/new.bin")
+    assert client.delete(f"/files/{kept}", headers=auth_headers).status_code == 204
+
+
+def test_logout_revokes_token(client, auth_headers):
+    assert client.get("/notes/", headers=auth_headers).status_code == 200
+    assert client.post("/auth/logout", headers=auth_headers).status_code == 200
+    assert client.get("/notes/", headers=auth_headers).status_code == 401
+
+
+
+def test_metrics_require_the_metrics_token(client, auth_headers):
+    assert client.get("/metrics/").status_code == 401
+    assert client.get("/metrics/", headers=auth_headers).status_code == 401
+    response = client.get("/metrics/", headers={"Authorization": "Bearer test-metrics-token"})
+    assert response.status_code == 200
+    assert "principal_cache" in response.json()
+
+def test_repeated_failed_logins_are_throttled(client):
+    statuses = [
+        client.post("/auth/login", data={"username": "nobody", "password": "wrong password"}).status_code
+        for _ in range(10)
+    ]
+    assert statuses[0] == 401
+    assert statuses[-1] == 429
+    response = client.post("/auth/login", data={"username": "nobody", "password": "wrong password"})
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_oversized_auth_body_is_rejected(client):
+    from app.api.throttling import MAX_INSPECTED_BODY
+    body = b"username=somebody&password=" + b"x" * MAX_INSPECTED_BODY
+
+    response = client.post(
+        "/auth/login", content=body, headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    assert response.status_code == 413
+
+    # Without a Content-Length the body is cut off once it passes the limit
+    def chunked():
+        yield body[:1024]
+        yield body[1024:]
+
+    response = client.post(
+        "/auth/login", content=chunked(), headers={"Content-Type": "application/x-www-form-urlencoded"}
+    )
+    assert response.status_code == 413
+
+
+def test_folder_tree(client, auth_headers):
+    def create(name, parent_id=None):
+        response = client.post("/folders/", headers=auth_headers, json={"name": name, "parent_id": parent_id})
+        return response.json()["id"]
+
+    work = create("work")
+    projects = create("projects", work)
+    archive = create("archive", projects)
+    create("personal")
+    client.post("/notes/", headers=auth_headers, json={
+        "title": "plan", "content": "x", "is_encrypted": False, "folder_id": projects,
+    })
+
+    tree = client.get("/folders/tree", headers=auth_headers).json()
+    assert [f["name"] for f in tree] == ["personal", "work"]
+    projects_node = tree[1]["children"][0]
+    assert projects_node["note_count"] == 1
+    assert [f["id"] for f in projects_node["children"]] == [archive]
+
+    subtree = client.get("/folders/tree", headers=auth_headers, params={"root_id": work, "max_depth": 1}).json()
+    assert [f["id"] for f in subtree] == [work]
+    assert subtree[0]["children"][0]["children"] == []
+
+
+def test_folder_moves_keep_paths_consistent(client, auth_headers):
+    def create(name, parent_id=None):
+        return client.post("/folders/", headers=auth_headers, json={"name": name, "parent_id": parent_id}).json()["id"]
+
+    a = create("a")
+    b = create("b", a)
+    c = create("c", b)
+    d = create("d")
+
+    response = client.put(f"/folders/{a}", headers=auth_headers, json={"parent_id": c})
+    assert response.status_code == 400
+
+    assert client.put(f"/folders/{b}", headers=auth_headers, json={"parent_id": d}).status_code == 200
+    tree = client.get("/folders/tree", headers=auth_headers, params={"root_id": d}).json()
+    assert tree[0]["children"][0]["id"] == b
+    assert tree[0]["children"][0]["children"][0]["id"] == c
+
+    assert client.put(f"/folders/{b}", headers=auth_headers, json={"parent_id": None}).status_code == 200
+    assert client.put(f"/folders/{d}", headers=auth_headers, json={"parent_id": c}).status_code == 200
+    subtree = client.get("/folders/tree", headers=auth_headers, params={"root_id": b, "max_depth": 2}).json()
+    assert subtree[0]["children"][0]["children"][0]["id"] == d
+
+
+def test_recursive_folder_delete_removes_notes_and_files(client, auth_headers):
+    top = client.post("/folders/", headers=auth_headers, json={"name": "top"}).json()["id"]
+    nested = client.post("/folders/", headers=auth_headers, json={"name": "nested", "parent_id": top}).json()["id"]
+    note_id = client.post("/notes/", headers=auth_headers, json={
+        "title": "deep", "content": "x", "is_encrypted": True, "folder_id": nested,
+    }).json()["id"]
+    response = client.post(
+        "/files/",
+        headers=auth_headers,
+        params={"folder_id": nested},
+        files={"file": ("a.txt", b"contents", "text/plain")},
+    )
+    file_id = response.json()["id"]
+
+    assert client.delete(f"/folders/{top}", headers=auth_headers).status_code == 400
+    assert client.delete(f"/folders/{top}", headers=auth_headers, params={"recursive": True}).status_code == 204
+
+    assert client.get(f"/notes/{note_id}", headers=auth_headers).status_code == 404
+    assert client.get(f"/files/{file_id}/download", headers=auth_headers).status_code == 404
+    assert client.get("/folders/tree", headers=auth_headers).json() == []
+
+
+def test_note_batch(client, auth_headers):
+    folder = client.post("/folders/", headers=auth_headers, json={"name": "inbox"}).json()["id"]
+    existing = client.post("/notes/", headers=auth_headers, json={
+        "title": "old", "content": "secret words", "is_encrypted": True,
+    }).json()["id"]
+    doomed = client.post("/notes/", headers=auth_headers, json={
+        "title": "doomed", "content": "x", "is_encrypted": False,
+    }).json()["id"]
+
+    response = client.post("/notes/batch", headers=auth_headers, json={"operations": [
+        {"op": "create", "client_id": "draft-1", "data": {"title": "new", "content": "fresh text"}},
+        {"op": "update", "id": existing, "data": {"title": "renamed"}},
+        {"op": "move", "id": existing, "folder_id": folder},
+        {"op": "delete", "id": doomed},
+        {"op": "update", "id": 999999, "data": {"title": "missing"}},
+    ]})
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [r["status_code"] for r in results] == [200, 200, 409, 200, 404]
+    assert results[0]["client_id"] == "draft-1"
+    assert results[0]["note"]["content"] == "fresh text"
+    assert results[1]["note"]["content"] == "secret words"
+
+    created = client.get(f"/notes/{results[0]['id']}", headers=auth_headers).json()
+    assert created["is_encrypted"] and created["content"] == "fresh text"
+    assert client.get(f"/notes/{existing}", headers=auth_headers).json()["title"] == "renamed"
+    assert client.get(f"/notes/{doomed}", headers=auth_headers).status_code == 404
+    hits = client.get("/notes/search", headers=auth_headers, params={"q": "fresh"}).json()
+    assert [n["id"] for n in hits] == [results[0]["id"]]
+
+
+def test_incremental_sync(client, auth_headers):
+    full = client.get("/sync/", headers=auth_headers).json()
+    assert full["notes"] == [] and full["deleted"] == []
+    since = full["version"]
+
+    folder = client.post("/folders/", headers=auth_headers, json={"name": "f"}).json()["id"]
+    kept = client.post("/notes/", headers=auth_headers, json={
+        "title": "kept", "content": "hello", "is_encrypted": True, "folder_id": folder,
+    }).json()["id"]
+    gone = client.post("/notes/", headers=auth_headers, json={"title": "gone", "content": "x"}).json()["id"]
+
+    changes = client.get("/sync/", headers=auth_headers, params={"since": since}).json()
+    assert {n["id"] for n in changes["notes"]} == {kept, gone}
+    assert [f["id"] for f in changes["folders"]] == [folder]
+    assert next(n for n in changes["notes"] if n["id"] == kept)["content"] == "hello"
+    since = changes["version"]
+
+    client.delete(f"/notes/{gone}", headers=auth_headers)
+    client.put(f"/notes/{kept}", headers=auth_headers, json={"title": "kept v2"})
+    changes = client.get("/sync/", headers=auth_headers, params={"since": since}).json()
+    assert [n["title"] for n in changes["notes"]] == ["kept v2"]
+    assert changes["folders"] == []
+    assert changes["deleted"] == [{"entity_type": "note", "entity_id": gone, "version": changes["version"] - 1}]
+
+    client.delete(f"/folders/{folder}", headers=auth_headers, params={"recursive": True})
+    changes = client.get("/sync/", headers=auth_headers, params={"since": changes["version"]}).json()
+    assert {(d["entity_type"], d["entity_id"]) for d in changes["deleted"]} == {("note", kept), ("folder", folder)}
+    assert client.get("/sync/", headers=auth_headers, params={"since": changes["version"]}).json()["deleted"] == []
+
+
+
+def test_sync_pages(client, auth_headers):
+    since = client.get("/sync/", headers=auth_headers).json()["version"]
+    for i in range(5):
+        client.post("/notes/", headers=auth_headers, json={"title": f"note {i}", "content": "x"})
+    # One version covering more rows than a page
+    response = client.post("/notes/batch", headers=auth_headers, json={"operations": [
+        {"op": "create", "data": {"title": f"batch {i}", "content": "y"}} for i in range(4)
+    ]})
+    assert response.status_code == 200, response.text
+    client.post("/folders/", headers=auth_headers, json={"name": "last"})
+
+    titles, pages = [], 0
+    while True:
+        page = client.get("/sync/", headers=auth_headers, params={"since": since, "limit": 3}).json()
+        pages += 1
+        assert page["version"] > since
+        titles += [n["title"] for n in page["notes"]] + [f["name"] for f in page["folders"]]
+        since = page["version"]
+        if not page["has_more"]:
+            break
+        assert pages < 10, "sync did not terminate"
+
+    assert titles == [f"note {i}" for i in range(5)] + [f"batch {i}" for i in range(4)] + ["last"]
+    assert pages >= 3
+    assert client.get("/sync/", headers=auth_headers, params={"since": since}).json()["notes"] == []
+
+
+def test_conditional_get(client, auth_headers):
+    note_id = client.post("/notes/", headers=auth_headers, json={"title": "t", "content": "c"}).json()["id"]
+
+    first = client.get(f"/notes/{note_id}", headers=auth_headers)
+    etag = first.headers["ETag"]
+    cached = client.get(f"/notes/{note_id}", headers={**auth_headers, "If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+
+    listing = client.get("/notes/", headers=auth_headers)
+    list_etag = listing.headers["ETag"]
+    assert client.get("/notes/", headers={**auth_headers, "If-None-Match": list_etag}).status_code == 304
+    other_page = client.get("/notes/", headers={**auth_headers, "If-None-Match": list_etag}, params={"limit": 5})
+    assert other_page.status_code == 200
+
+    client.put(f"/notes/{note_id}", headers=auth_headers, json={"content": "changed"})
+    assert client.get(f"/notes/{note_id}", headers={**auth_headers, "If-None-Match": etag}).status_code == 200
+    assert client.get("/notes/", headers={**auth_headers, "If-None-Match": list_etag}).status_code == 200
+
+    for path in ("/folders/", "/folders/tree", "/files/"):
+        tag = client.get(path, headers=auth_headers).headers["ETag"]
+        assert client.get(path, headers={**auth_headers, "If-None-Match": tag}).status_code == 304
+
+
+def test_conditional_update(client, auth_headers):
+    note = client.post("/notes/", headers=auth_headers, json={"title": "t", "content": "draft"}).json()
+    path = f"/notes/{note['id']}"
+
+    # Saving identical content is a no-op: same version, nothing new to sync
+    since = client.get("/sync/", headers=auth_headers).json()["version"]
+    unchanged = client.put(path, headers=auth_headers, json={"title": "t", "content": "draft"})
+    assert unchanged.status_code == 200 and unchanged.json()["version"] == note["version"]
+    assert client.get("/sync/", headers=auth_headers, params={"since": since}).json()["notes"] == []
+
+    etag = unchanged.headers["ETag"]
+    saved = client.put(path, headers={**auth_headers, "If-Match": etag}, json={"content": "final"})
+    assert saved.status_code == 200
+    assert saved.json()["content"] == "final" and saved.json()["version"] > note["version"]
+    assert saved.headers["ETag"] != etag
+
+    # A second tab still holding the old ETag must not overwrite the change
+    stale = client.put(path, headers={**auth_headers, "If-Match": etag}, json={"content": "other tab"})
+    assert stale.status_code == 412 and stale.headers["ETag"] == saved.headers["ETag"]
+    assert client.get(path, headers=auth_headers).json()["content"] == "final"
+
+
+def test_legacy_note_ciphertext(client, auth_headers):
+    import asyncio
+    from cryptography.fernet import Fernet
+    from app.api.routes.notes import upgrade_note_ciphertexts
+    from app.core.session_manager import session_manager
+    from app.database import SessionLocal
+    from app.models.note import Note
+
+    note = client.post("/notes/", headers=auth_headers, json={"title": "old", "content": "from before"}).json()
+    master_key = session_manager.get_master_key(note["user_id"])
+
+    # Turn the note back into a row written before the binary envelope
+    with SessionLocal() as db:
+        row = db.get(Note, note["id"])
+        assert row.encrypted_content[:1] == b"\x01" and row.content is None
+        row.store_content(Fernet(master_key).encrypt(b"from before").decode())
+        row.content_digest = None
+        db.commit()
+
+    assert client.get(f"/notes/{note['id']}", headers=auth_headers).json()["content"] == "from before"
+
+    assert asyncio.run(upgrade_note_ciphertexts(note["user_id"], master_key)) == 1
+    with SessionLocal() as db:
+        row = db.get(Note, note["id"])
+        assert row.content is None and row.encrypted_content[:1] == b"\x01" and row.content_digest
+    assert client.get(f"/notes/{note['id']}", headers=auth_headers).json()["content"] == "from before"
+
+
+def test_note_listing_pagination(client, auth_headers):
+    created = []
+    for i in range(9):
+        response = client.post("/notes/", headers=auth_headers, json={"title": f"Page note {i}", "content": "x"})
+        assert response.status_code == 200, response.text
+        created.append(response.json()["id"])
+    # Bump one note so updated_at order differs from creation order
+    response = client.put(f"/notes/{created[3]}", headers=auth_headers, json={"title": "Page note 3*"})
+    assert response.status_code == 200, response.text
+
+    for sort in ("updated_at", "created_at"):
+        for order in ("asc", "desc"):
+            seen, cursor, pages = [], None, 0
+            while True:
+                params = {"limit": 4, "sort": sort, "order": order}
+                if cursor:
+                    params["cursor"] = cursor
+                response = client.get("/notes/", headers=auth_headers, params=params)
+                assert response.status_code == 200, response.text
+                page = response.json()
+                seen += [n["id"] for n in page["items"]]
+                pages += 1
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+                assert pages < 10, "pagination did not terminate"
+
+            assert len(seen) == len(set(seen)) == len(created), (sort, order, seen)
+            expected = created
+            if sort == "updated_at":
+                expected = [i for i in created if i != created[3]] + [created[3]]
+            assert seen == (expected if order == "asc" else expected[::-1]), (sort, order, seen)
+
+    response = client.get("/notes/", headers=auth_headers, params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from app.core.blob_store import LocalBlobStore, S3BlobStore
+
+
+def _roundtrip(store):
+    writer = store.create_writer()
+    writer.write(b"hello ")
+    writer.write(b"world")
+    writer.seek(0)
+    assert writer.read() == b"hello world"
+    writer.commit("7/a.txt")
+    writer.discard()
+
+    with store.open("7/a.txt") as f:
+        f.seek(6)
+        assert f.read() == b"world"
+    assert store.exists("7/a.txt")
+
+    abandoned = store.create_writer()
+    abandoned.write(b"partial")
+    abandoned.discard()
+    assert not store.exists("7/b.txt")
+
+    store.delete("7/a.txt")
+    store.delete("7/a.txt")
+    assert not store.exists("7/a.txt")
+    with pytest.raises(FileNotFoundError):
+        store.open("7/a.txt")
+
+
+def test_local_blob_store(tmp_path):
+    store = LocalBlobStore(str(tmp_path), fsync=True)
+    _roundtrip(store)
+
+    # Blobs land in hash-sharded directories and nothing is left in the temp dir
+    writer = store.create_writer()
+    writer.write(b"x")
+    writer.commit("7/c.bin")
+    path = store.path_for("7/c.bin")
+    assert path.relative_to(tmp_path).parts[:2] == (path.parent.parent.name, path.parent.name)
+    assert len(path.parent.name) == 2 and path.name == "7%2Fc.bin"
+    assert os.listdir(store.temp_dir) == []
+
+    # Blobs from the flat per-user layout are still found
+    (tmp_path / "7").mkdir()
+    (tmp_path / "7" / "old.bin").write_bytes(b"legacy")
+    with store.open("7/old.bin") as f:
+        assert f.read() == b"legacy"
+
+    # Listings cover both layouts and resume after a marker
+    listed = list(store.iter_blobs())
+    assert sorted(blob.key for blob in listed) == ["7/c.bin", "7/old.bin"]
+    assert [blob.key for blob in store.iter_blobs(after=listed[0].marker)] == [listed[1].key]
+    store.delete("7/old.bin")
+    assert not (tmp_path / "7" / "old.bin").exists()
+
+
+def test_s3_blob_store():
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="blobs")
+        store = S3BlobStore("blobs", prefix="files/", client=client)
+        _roundtrip(store)
@@ -0,0 +1,81 @@
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+import pytest
+
+from app.core import encryption, search_index
+from app.core.encryption import decrypt_many, decrypt_note_content, encrypt_many, encrypt_note_content
+from app.core.session_manager import InMemorySessionBackend, SecureSessionManager
+
+MASTER_KEY = Fernet.generate_key()
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_batch_round_trip(parallel):
+    contents = [f"note {i} " * (i % 7) for i in range(600)] + ["", "ünïcödé ✓"]
+    envelopes = encrypt_many(contents, MASTER_KEY, parallel=parallel)
+
+    assert len(envelopes) == len(contents)
+    assert all(isinstance(envelope, bytes) for envelope in envelopes)
+    # A fresh nonce per note, even for equal contents
+    assert len(set(envelopes)) == len(envelopes)
+    assert decrypt_many(envelopes, MASTER_KEY, parallel=parallel) == contents
+    assert decrypt_many(envelopes, MASTER_KEY, parallel=not parallel) == contents
+    assert [decrypt_note_content(envelope, MASTER_KEY) for envelope in envelopes[:5]] == contents[:5]
+
+
+def test_default_batches_use_the_worker_pool(monkeypatch):
+    monkeypatch.setattr(encryption, "MAX_CRYPTO_WORKERS", 2)
+    monkeypatch.setattr(encryption, "_executor", None)
+    contents = [str(i) for i in range(encryption.PARALLEL_BATCH_THRESHOLD)]
+    assert decrypt_many(encrypt_many(contents, MASTER_KEY), MASTER_KEY) == contents
+    assert encryption._executor is not None
+
+
+def test_ciphers_are_cached_per_key():
+    other_key = Fernet.generate_key()
+    assert encryption._note_cipher(MASTER_KEY) is encryption._note_cipher(MASTER_KEY)
+    assert encryption._note_cipher(MASTER_KEY) is not encryption._note_cipher(other_key)
+    with pytest.raises(InvalidTag):
+        decrypt_many(encrypt_many(["secret"], MASTER_KEY), other_key)
+
+
+def test_clearing_a_session_forgets_its_ciphers():
+    manager = SecureSessionManager(InMemorySessionBackend(sweep_interval=None))
+    master_key = Fernet.generate_key()
+    manager.store_master_key(1, master_key)
+    encryption.note_content_digest("note", master_key)
+    search_index.note_search_tokens("title", "content", master_key)
+    cipher = encryption._note_cipher(master_key)
+    assert len(encryption._key_cache[master_key]) == 3
+
+    manager.clear_session(1)
+    assert master_key not in encryption._key_cache
+    assert encryption._note_cipher(master_key) is not cipher
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_mixed_batch_with_legacy_tokens(parallel):
+    legacy = Fernet(MASTER_KEY).encrypt(b"legacy note").decode()
+    batch = [legacy if i % 50 == 0 else encrypt_note_content(f"note {i}", MASTER_KEY) for i in range(300)]
+    expected = ["legacy note" if i % 50 == 0 else f"note {i}" for i in range(300)]
+    assert decrypt_many(batch, MASTER_KEY, parallel=parallel) == expected
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_invalid_token_fails_the_batch(parallel):
+    batch = encrypt_many([f"note {i}" for i in range(300)], MASTER_KEY)
+
+    tampered = list(batch)
+    tampered[123] = tampered[123][:-1] + bytes([tampered[123][-1] ^ 1])
+    with pytest.raises(InvalidTag):
+        decrypt_many(tampered, MASTER_KEY, parallel=parallel)
+
+    unknown_version = list(batch)
+    unknown_version[7] = b"\x02" + unknown_version[7][1:]
+    with pytest.raises(ValueError, match="Unknown note ciphertext version"):
+        decrypt_many(unknown_version, MASTER_KEY, parallel=parallel)
+
+    bad_legacy = list(batch)
+    bad_legacy[250] = "not a fernet token"
+    with pytest.raises(InvalidToken):
+        decrypt_many(bad_legacy, MASTER_KEY, parallel=parallel)
@@ -0,0 +1,27 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.kdf_executor import KDFExecutor, KDFPoolSaturated
+
+
+def test_rejects_jobs_beyond_the_queue_bound():
+    executor = KDFExecutor(workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run("slow", release.wait))
+        queued = asyncio.ensure_future(executor.run("slow", release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(KDFPoolSaturated):
+            await executor.run("slow", release.wait)
+        assert executor.stats()["queue_depth"] == 1
+        release.set()
+        await asyncio.gather(running, queued)
+
+    asyncio.run(scenario())
+    stats = executor.stats()
+    assert stats["rejected"] == 1
+    assert stats["jobs"]["slow"]["count"] == 2
+    assert stats["in_flight"] == 0
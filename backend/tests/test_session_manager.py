@@ -0,0 +1,188 @@
+from datetime import timedelta
+from types import SimpleNamespace
+import os
+import stat
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from app.core import local_files, session_manager as session_module
+from app.core.session_manager import InMemorySessionBackend, SQLiteSessionBackend
+
+TIMEOUT = timedelta(seconds=10)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A manually advanced monotonic clock for the session backends."""
+    now = [1000.0]
+    monkeypatch.setattr(session_module, "time", SimpleNamespace(
+        monotonic=lambda: now[0], time=lambda: now[0], sleep=lambda seconds: None
+    ))
+
+    def advance(seconds: float):
+        now[0] += seconds
+
+    return advance
+
+
+def _heap_size(backend: InMemorySessionBackend) -> int:
+    return sum(len(stripe.expiry_heap) for stripe in backend._stripes)
+
+
+def test_memory_sessions_expire_after_inactivity(clock):
+    backend = InMemorySessionBackend(stripes=4, sweep_interval=None)
+    backend.store(1, b"key-1", TIMEOUT)
+    backend.store(2, b"key-2", TIMEOUT)
+
+    clock(8)
+    # A lookup refreshes the session, an idle one runs out
+    assert backend.get(1, TIMEOUT) == b"key-1"
+    clock(8)
+    assert backend.get(1, TIMEOUT) == b"key-1"
+    assert backend.get(2, TIMEOUT) is None
+
+    backend.delete(1)
+    assert backend.get(1, TIMEOUT) is None
+    assert len(backend) == 0
+
+
+def test_memory_purge_evicts_expired_sessions(clock):
+    backend = InMemorySessionBackend(stripes=4, sweep_interval=None)
+    for user_id in range(10):
+        backend.store(user_id, b"key", TIMEOUT)
+    clock(5)
+    backend.get(3, TIMEOUT)
+    clock(6)
+
+    assert backend.purge_expired() == 9
+    assert len(backend) == 1
+    assert backend.get(3, TIMEOUT) == b"key"
+    clock(11)
+    assert backend.purge_expired() == 1
+    assert len(backend) == 0 and _heap_size(backend) == 0
+
+
+def test_memory_keeps_one_heap_entry_per_user(clock):
+    backend = InMemorySessionBackend(stripes=1, sweep_interval=None)
+    for _ in range(100):
+        backend.store(7, b"key", TIMEOUT)
+        clock(0.05)
+        backend.get(7, TIMEOUT)
+    backend.delete(7)
+    backend.store(7, b"key", TIMEOUT)
+    assert _heap_size(backend) == 1
+
+    # A store with a shorter timeout than the queued entry is tracked by a new entry
+    backend.store(7, b"key", timedelta(seconds=1))
+    clock(2)
+    assert backend.purge_expired() == 1
+    assert _heap_size(backend) == 1
+    clock(20)
+    backend.purge_expired()
+    assert _heap_size(backend) == 0
+
+
+def test_memory_stores_evict_a_bounded_number_of_sessions(clock):
+    backend = InMemorySessionBackend(stripes=1, eviction_budget=2, sweep_interval=None)
+    for user_id in range(5):
+        backend.store(user_id, b"key", TIMEOUT)
+    clock(11)
+    backend.store(100, b"key", TIMEOUT)
+    assert len(backend) == 4
+
+
+def test_memory_close_stops_the_sweeper():
+    backend = InMemorySessionBackend(sweep_interval=0.01)
+    sweeper = backend._sweeper
+    assert sweeper.is_alive()
+    backend.close()
+    assert not sweeper.is_alive()
+
+
+def test_sqlite_sessions_store_get_and_delete(tmp_path):
+    backend = SQLiteSessionBackend(str(tmp_path / "sessions.db"), "secret")
+    backend.store(1, b"key-1", TIMEOUT)
+    backend.store(2, b"key-2", TIMEOUT)
+    assert backend.get(1, TIMEOUT) == b"key-1"
+    assert backend.get(3, TIMEOUT) is None
+
+    backend.store(1, b"key-1b", TIMEOUT)
+    assert backend.get(1, TIMEOUT) == b"key-1b"
+    backend.delete(1)
+    assert backend.get(1, TIMEOUT) is None
+    assert backend.get(2, TIMEOUT) == b"key-2"
+
+    # Keys are only stored wrapped
+    assert b"key-2" not in (tmp_path / "sessions.db").read_bytes()
+
+
+def test_sqlite_sessions_expire_after_inactivity(tmp_path, clock):
+    backend = SQLiteSessionBackend(str(tmp_path / "sessions.db"), "secret")
+    backend.store(1, b"key-1", TIMEOUT)
+    backend.store(2, b"key-2", TIMEOUT)
+
+    clock(8)
+    assert backend.get(1, TIMEOUT) == b"key-1"
+    clock(8)
+    assert backend.get(1, TIMEOUT) == b"key-1"
+    assert backend.get(2, TIMEOUT) is None
+
+
+def test_sqlite_sessions_are_shared_between_instances(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first = SQLiteSessionBackend(path, "secret")
+    second = SQLiteSessionBackend(path, "secret")
+
+    first.store(1, b"key-1", TIMEOUT)
+    assert second.get(1, TIMEOUT) == b"key-1"
+    second.delete(1)
+    assert first.get(1, TIMEOUT) is None
+
+    # A different wrapping secret can't unwrap the stored keys
+    second.store(2, b"key-2", TIMEOUT)
+    with pytest.raises(InvalidTag):
+        SQLiteSessionBackend(path, "other secret").get(2, TIMEOUT)
+
+
+def test_sqlite_session_files_are_owner_only(tmp_path):
+    path = tmp_path / "sessions.db"
+    stale_wal = tmp_path / "sessions.db-wal"
+    stale_wal.write_bytes(b"")
+    stale_wal.chmod(0o644)
+
+    backend = SQLiteSessionBackend(str(path), "secret")
+    backend.store(1, b"key-1", TIMEOUT)
+    for name in ("sessions.db", "sessions.db-wal", "sessions.db-shm"):
+        assert stat.S_IMODE(os.stat(tmp_path / name).st_mode) == 0o600, name
+
+
+def test_sqlite_session_files_refuse_symlinks_and_foreign_owners(tmp_path, monkeypatch):
+    target = tmp_path / "elsewhere.db"
+    target.write_bytes(b"")
+    (tmp_path / "sessions.db").symlink_to(target)
+    with pytest.raises(OSError):
+        SQLiteSessionBackend(str(tmp_path / "sessions.db"), "secret")
+
+    (tmp_path / "other.db-wal").symlink_to(target)
+    with pytest.raises(OSError):
+        SQLiteSessionBackend(str(tmp_path / "other.db"), "secret")
+
+    uid = os.getuid()
+    monkeypatch.setattr(local_files.os, "getuid", lambda: uid + 1)
+    with pytest.raises(PermissionError, match="owned by"):
+        SQLiteSessionBackend(str(tmp_path / "plain.db"), "secret")
+
+
+def test_default_session_file_lives_in_a_private_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_files.tempfile, "gettempdir", lambda: str(tmp_path))
+    path = local_files.private_state_path("sessions.db")
+    directory = os.path.dirname(path)
+    assert os.path.dirname(directory) == str(tmp_path)
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+    # A name planted in the shared temp dir by someone else is refused
+    os.rmdir(directory)
+    os.symlink(tmp_path, directory)
+    with pytest.raises(PermissionError):
+        local_files.private_state_path("sessions.db")
@@ -18,6 +18,7 @@ interface Note {
     updated_at: string | null;
     user_id: number;
     folder_id: number | null;
+    version?: number;
 }
 
 interface Folder {
@@ -49,23 +50,48 @@ export default function Dashboard() {
 
     // Track if there are pending changes
     const pendingChanges = useRef<{ [key: number]: boolean }>({});
+    // Last version seen of each note, sent with saves so stale tabs can't overwrite newer edits
+    const noteVersions = useRef<{ [key: number]: number }>({});
     // Create debounced update function that persists between renders
     const debouncedUpdateNoteRef = useRef<any>(null);
     // Track if API is initialized
     const apiRef = useRef<any>(null);
 
-    // Search notes based on query
     useEffect(() => {
-        if (searchQuery.trim() === '') {
+        for (const note of notes) {
+            if (note.version !== undefined) {
+                noteVersions.current[note.id] = note.version;
+            }
+        }
+    }, [notes]);
+
+    // Search notes on the server based on query
+    useEffect(() => {
+        // The server rejects terms shorter than its minimum prefix length (3)
+        const terms = searchQuery.split(new RegExp('[^\\p{L}\\p{N}_]+', 'u')).filter(term => term !== '');
+        if (searchQuery.trim() === '' || terms.some(term => term.length < 3)) {
             setFilteredNotes(notes);
-        } else {
-            const query = searchQuery.toLowerCase();
-            const matched = notes.filter(note =>
-                note.title.toLowerCase().includes(query) ||
-                note.content.toLowerCase().includes(query)
-            );
-            setFilteredNotes(matched);
+            return;
         }
+
+        let cancelled = false;
+        const timer = setTimeout(async () => {
+            try {
+                const matched: Note[] = await apiRef.current.searchNotes(searchQuery.trim());
+                if (!cancelled) {
+                    // Keep the local copies so unsaved edits stay visible
+                    const matchedIds = new Set(matched.map(note => note.id));
+                    setFilteredNotes(notes.filter(note => matchedIds.has(note.id)));
+                }
+            } catch (err) {
+                console.error('Error searching notes:', err);
+            }
+        }, 250);
+
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
     }, [searchQuery, notes]);
 
     // Check if we're on mobile
@@ -118,8 +144,14 @@ export default function Dashboard() {
                     console.log('Fetching data');
                     setLoading(true);
 
-                    // Fetch folders
-                    const folderData = await apiRef.current.getFolders();
+                    // Fetch the folder hierarchy in one request and flatten it for the sidebar
+                    const tree = await apiRef.current.getFolderTree();
+                    const folderData: Folder[] = [];
+                    const flatten = (nodes: typeof tree) => nodes.forEach(({ children, ...folder }) => {
+                        folderData.push(folder);
+                        flatten(children);
+                    });
+                    flatten(tree);
                     setFolders(folderData);
                     console.log('Folders loaded:', folderData.length);
 
@@ -371,7 +403,7 @@ export default function Dashboard() {
         setSaveStatus(prev => ({ ...prev, [id]: 'Saving...' }));
 
         try {
-            const updatedNote = await apiRef.current.updateNote(id, updatedFields);
+            const updatedNote = await apiRef.current.updateNote(id, updatedFields, noteVersions.current[id]);
             setNotes(prevNotes => prevNotes.map(note => (note.id === id ? updatedNote : note)));
             setSaveStatus(prev => ({ ...prev, [id]: 'Saved' }));
 
@@ -391,7 +423,7 @@ export default function Dashboard() {
 
         } catch (err) {
             console.error('Failed to update note:', err);
-            setError('Failed to update note');
+            setError(err instanceof Error ? err.message : 'Failed to update note');
             setSaveStatus(prev => ({ ...prev, [id]: 'Error saving' }));
         }
     };
@@ -457,12 +489,37 @@ export default function Dashboard() {
             debouncedUpdateNoteRef.current.cancel();
         }
 
-        // Save all notes with pending changes
-        const promises = notes
-            .filter(note => pendingChanges.current[note.id])
-            .map(note => updateNote(note.id, { title: note.title, content: note.content }));
+        // Save all notes with pending changes in a single batch request
+        const pending = notes.filter(note => pendingChanges.current[note.id]);
+        if (pending.length === 0) return;
+
+        pending.forEach(note => setSaveStatus(prev => ({ ...prev, [note.id]: 'Saving...' })));
+        try {
+            const results = await apiRef.current.batchNotes(pending.map(note => ({
+                op: 'update' as const,
+                id: note.id,
+                data: { title: note.title, content: note.content },
+            })));
+
+            const saved = new Map<number, Note>();
+            results.forEach(result => {
+                if (result.note && result.id !== null) saved.set(result.id, result.note as Note);
+            });
+            setNotes(prevNotes => prevNotes.map(note => saved.get(note.id) ?? note));
+
+            const clearedChanges = { ...pendingChanges.current };
+            saved.forEach((_, id) => { clearedChanges[id] = false; });
+            pendingChanges.current = clearedChanges;
 
-        await Promise.all(promises);
+            results.forEach((result, i) => {
+                const id = pending[i].id;
+                setSaveStatus(prev => ({ ...prev, [id]: result.error ? 'Error saving' : 'Saved' }));
+            });
+        } catch (err) {
+            console.error('Failed to save notes:', err);
+            setError('Failed to save notes');
+            pending.forEach(note => setSaveStatus(prev => ({ ...prev, [note.id]: 'Error saving' })));
+        }
     };
     const handleSetActiveNote = (noteId: number) => {
         setActiveNote(noteId);
@@ -14,6 +14,9 @@ interface FileProps {
   updated_at: string | null;
 }
 
+// Files larger than this are uploaded in resumable chunks
+const RESUMABLE_UPLOAD_THRESHOLD = 4 * 1024 * 1024;
+
 // File Upload Component
 export function FileUploader({ 
   folderId, 
@@ -40,6 +43,22 @@ export function FileUploader({
     setError(null);
     
     try {
+      const onProgress = (progressEvent: { loaded: number; total: number }) => {
+        // Update progress
+        const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
+        setProgress(percentCompleted);
+      };
+
+      if (file.size > RESUMABLE_UPLOAD_THRESHOLD) {
+        // An interrupted upload continues from the chunks already received when retried
+        const uploadedFile = await api.uploadFileResumable(file, folderId, encrypt, onProgress);
+        onFileUploaded(uploadedFile);
+        if (fileInputRef.current) {
+          fileInputRef.current.value = '';
+        }
+        return;
+      }
+
       // Create FormData
       const formData = new FormData();
       formData.append('file', file);
@@ -52,11 +71,7 @@ export function FileUploader({
       queryParams.append('is_encrypted', encrypt.toString());
       
       // Use custom upload method from api
-      const uploadedFile = await api.uploadFile(formData, queryParams.toString(), (progressEvent) => {
-        // Update progress
-        const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-        setProgress(percentCompleted);
-      });
+      const uploadedFile = await api.uploadFile(formData, queryParams.toString(), onProgress);
       
       // Notify parent
       onFileUploaded(uploadedFile);
@@ -8,6 +8,12 @@ interface Note {
   updated_at: string | null;
   user_id: number;
   folder_id?: number | null;
+  version?: number;
+}
+
+interface NotePage {
+  items: Note[];
+  next_cursor: string | null;
 }
 
 interface Folder {
@@ -19,6 +25,12 @@ interface Folder {
   updated_at: string | null;
 }
 
+interface FolderTreeNode extends Folder {
+  note_count: number;
+  file_count: number;
+  children: FolderTreeNode[];
+}
+
 interface CreateNoteData {
   title: string;
   content: string;
@@ -27,6 +39,23 @@ interface CreateNoteData {
   folder_id?: number | null;
 }
 
+interface NoteBatchOperation {
+  op: 'create' | 'update' | 'delete' | 'move';
+  id?: number;
+  client_id?: string;
+  data?: Partial<CreateNoteData>;
+  folder_id?: number | null;
+}
+
+interface NoteBatchResult {
+  op: string;
+  id: number | null;
+  client_id: string | null;
+  status_code: number;
+  error: string | null;
+  note: Note | null;
+}
+
 interface CreateFolderData {
   name: string;
   parent_id?: number | null;
@@ -59,6 +88,21 @@ interface ProgressEvent {
   total: number;
 }
 
+interface UploadSession {
+  id: string;
+  filename: string;
+  size: number;
+  chunk_size: number;
+  chunk_count: number;
+  received: number[];
+  received_bytes: number;
+  expires_at: string;
+}
+
+// Chunks sent at once by a resumable upload, and attempts per chunk
+const UPLOAD_PARALLELISM = 3;
+const UPLOAD_CHUNK_ATTEMPTS = 3;
+
 export const useNoteApi = (token: string | null) => {
   console.log("useNoteApi called with token:", !!token);
 
@@ -73,9 +117,32 @@ export const useNoteApi = (token: string | null) => {
   const getNotes = async (): Promise<Note[]> => {
     if (!token) throw new Error('Not authenticated');
 
-    const response = await fetch(`${baseUrl}/notes/`, { headers });
+    // The listing is paginated; follow the cursor until every page is loaded
+    const notes: Note[] = [];
+    let cursor: string | null = null;
+    do {
+      const params = new URLSearchParams({ include: 'content', limit: '200' });
+      if (cursor) params.set('cursor', cursor);
+
+      const response = await fetch(`${baseUrl}/notes/?${params.toString()}`, { headers });
+      if (!response.ok) {
+        throw new Error('Failed to fetch notes');
+      }
+      const page: NotePage = await response.json();
+      notes.push(...page.items);
+      cursor = page.next_cursor;
+    } while (cursor);
+
+    return notes;
+  };
+
+  const searchNotes = async (query: string): Promise<Note[]> => {
+    if (!token) throw new Error('Not authenticated');
+
+    const params = new URLSearchParams({ q: query });
+    const response = await fetch(`${baseUrl}/notes/search?${params.toString()}`, { headers });
     if (!response.ok) {
-      throw new Error('Failed to fetch notes');
+      throw new Error('Failed to search notes');
     }
     return response.json();
   };
@@ -111,7 +178,8 @@ export const useNoteApi = (token: string | null) => {
     return response.json();
   };
 
-  const updateNote = async (id: number, data: Partial<CreateNoteData>): Promise<Note> => {
+  // With `version`, the update is refused if the note changed since that version was loaded
+  const updateNote = async (id: number, data: Partial<CreateNoteData>, version?: number): Promise<Note> => {
     if (!token) throw new Error('Not authenticated');
 
     // Handle empty content with encryption enabled
@@ -122,15 +190,35 @@ export const useNoteApi = (token: string | null) => {
 
     const response = await fetch(`${baseUrl}/notes/${id}`, {
       method: 'PUT',
-      headers,
+      headers: version === undefined ? headers : { ...headers, 'If-Match': `"note-${id}-${version}"` },
       body: JSON.stringify(data),
     });
 
+    if (response.status === 412) {
+      throw new Error('This note was changed elsewhere. Reload it before saving again.');
+    }
     if (!response.ok) {
       throw new Error('Failed to update note');
     }
     return response.json();
   };
+  // Applies several note changes in one request and one transaction
+  const batchNotes = async (operations: NoteBatchOperation[]): Promise<NoteBatchResult[]> => {
+    if (!token) throw new Error('Not authenticated');
+
+    const response = await fetch(`${baseUrl}/notes/batch`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify({ operations }),
+    });
+
+    if (!response.ok) {
+      throw new Error('Failed to save notes');
+    }
+    const data = await response.json();
+    return data.results;
+  };
+
   const deleteNote = async (id: number): Promise<void> => {
     if (!token) throw new Error('Not authenticated');
 
@@ -161,6 +249,22 @@ export const useNoteApi = (token: string | null) => {
     return response.json();
   };
 
+  // Whole hierarchy (or the subtree under rootId) with note/file counts, in one request
+  const getFolderTree = async (rootId?: number, maxDepth?: number): Promise<FolderTreeNode[]> => {
+    if (!token) throw new Error('Not authenticated');
+
+    const params = new URLSearchParams();
+    if (rootId !== undefined) params.set('root_id', String(rootId));
+    if (maxDepth !== undefined) params.set('max_depth', String(maxDepth));
+
+    const response = await fetch(`${baseUrl}/folders/tree?${params}`, { headers });
+    if (!response.ok) {
+      throw new Error('Failed to fetch folder tree');
+    }
+
+    return response.json();
+  };
+
   const getFolder = async (id: number): Promise<Folder> => {
     if (!token) throw new Error('Not authenticated');
 
@@ -268,6 +372,133 @@ export const useNoteApi = (token: string | null) => {
     });
   };
 
+  // Resumable uploads: create a session, PUT the chunks, then complete it
+  const createUploadSession = async (
+    file: globalThis.File,
+    folderId: number | null,
+    isEncrypted: boolean
+  ): Promise<UploadSession> => {
+    if (!token) throw new Error('Not authenticated');
+
+    const response = await fetch(`${baseUrl}/uploads/`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify({
+        filename: file.name,
+        content_type: file.type || 'application/octet-stream',
+        size: file.size,
+        is_encrypted: isEncrypted,
+        folder_id: folderId,
+      }),
+    });
+
+    if (!response.ok) {
+      throw new Error('Failed to start upload');
+    }
+    return response.json();
+  };
+
+  // Resolves to null once the session has expired or was completed
+  const getUploadSession = async (sessionId: string): Promise<UploadSession | null> => {
+    if (!token) throw new Error('Not authenticated');
+
+    const response = await fetch(`${baseUrl}/uploads/${sessionId}`, { headers });
+    if (response.status === 404) return null;
+    if (!response.ok) {
+      throw new Error('Failed to fetch upload progress');
+    }
+    return response.json();
+  };
+
+  const uploadChunk = async (sessionId: string, index: number, chunk: Blob): Promise<UploadSession> => {
+    if (!token) throw new Error('Not authenticated');
+
+    const response = await fetch(`${baseUrl}/uploads/${sessionId}/chunks/${index}`, {
+      method: 'PUT',
+      headers: { 'Content-Type': 'application/octet-stream', 'Authorization': `Bearer ${token}` },
+      body: chunk,
+    });
+
+    if (!response.ok) {
+      throw new Error(`Failed to upload chunk ${index}`);
+    }
+    return response.json();
+  };
+
+  const completeUploadSession = async (sessionId: string): Promise<File> => {
+    if (!token) throw new Error('Not authenticated');
+
+    const response = await fetch(`${baseUrl}/uploads/${sessionId}/complete`, {
+      method: 'POST',
+      headers,
+    });
+
+    if (!response.ok) {
+      throw new Error('Failed to complete upload');
+    }
+    return response.json();
+  };
+
+  const abortUploadSession = async (sessionId: string): Promise<void> => {
+    if (!token) throw new Error('Not authenticated');
+
+    const response = await fetch(`${baseUrl}/uploads/${sessionId}`, {
+      method: 'DELETE',
+      headers,
+    });
+
+    if (!response.ok && response.status !== 404) {
+      throw new Error('Failed to abort upload');
+    }
+  };
+
+  // Uploads a file in chunks, a few at a time, retrying failed chunks. The session
+  // id is remembered so picking the same file again continues where it stopped.
+  const uploadFileResumable = async (
+    file: globalThis.File,
+    folderId: number | null,
+    isEncrypted: boolean,
+    progressCallback?: (progressEvent: ProgressEvent) => void
+  ): Promise<File> => {
+    if (!token) throw new Error('Not authenticated');
+
+    const storageKey = `upload:${folderId}:${isEncrypted}:${file.name}:${file.size}:${file.lastModified}`;
+    const savedId = localStorage.getItem(storageKey);
+    let session = savedId ? await getUploadSession(savedId) : null;
+    if (!session) {
+      session = await createUploadSession(file, folderId, isEncrypted);
+      localStorage.setItem(storageKey, session.id);
+    }
+    const { id, chunk_size: chunkSize, chunk_count: chunkCount } = session;
+
+    const received = new Set(session.received);
+    const pending = Array.from({ length: chunkCount }, (_, index) => index).filter(index => !received.has(index));
+    let loaded = session.received_bytes;
+    progressCallback?.({ loaded, total: file.size });
+
+    const sendChunks = async () => {
+      for (let index = pending.shift(); index !== undefined; index = pending.shift()) {
+        const chunk = file.slice(index * chunkSize, Math.min((index + 1) * chunkSize, file.size));
+        for (let attempt = 1; ; attempt++) {
+          try {
+            await uploadChunk(id, index, chunk);
+            break;
+          } catch (err) {
+            if (attempt >= UPLOAD_CHUNK_ATTEMPTS) throw err;
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+          }
+        }
+        loaded += chunk.size;
+        progressCallback?.({ loaded, total: file.size });
+      }
+    };
+    await Promise.all(Array.from({ length: UPLOAD_PARALLELISM }, sendChunks));
+
+    const uploaded = await completeUploadSession(id);
+    localStorage.removeItem(storageKey);
+    return uploaded;
+  };
+
   const getFiles = async (folderId?: number | null): Promise<File[]> => {
     if (!token) throw new Error('Not authenticated');
 
@@ -325,13 +556,16 @@ export const useNoteApi = (token: string | null) => {
   return {
     // Note operations
     getNotes,
+    searchNotes,
     getNote,
     createNote,
     updateNote,
+    batchNotes,
     deleteNote,
 
     // Folder operations
     getFolders,
+    getFolderTree,
     getFolder,
     createFolder,
     updateFolder,
@@ -340,6 +574,8 @@ export const useNoteApi = (token: string | null) => {
 
     // File operations
     uploadFile,
+    uploadFileResumable,
+    abortUploadSession,
     getFiles,
     downloadFile,
     deleteFile,